@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates'), ('static', 'static')],
-    hiddenimports=['yt_dlp'],
+    hiddenimports=['yt_dlp', 'numpy'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,20 +1,31 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import yt_dlp
+import startup  # en premier : mesure du démarrage à froid
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
-import re
 import time
 import threading
 import webbrowser
-import glob
-import sys
-import tempfile
-import subprocess
-import json
-
-# ---- Utilitaires de chemin (PyInstaller-friendly) ----
-def resource_path(relative_path):
-    base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
-    return os.path.join(base_path, relative_path)
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import media
+import metrics
+import seekindex
+import service
+import silence
+import uploads
+import waveform
+from service import (
+    resource_path, FFMPEG_SLOTS, DOWNLOAD_SLOTS, job_messages, output_choices, get_job,
+    SSE_HEADERS, parse_ranges, parse_output, flight_key, flights, overloaded, SERVER_BUSY, admit,
+    QUOTA_EXCEEDED, work_area, allowed_file, UNSUPPORTED_FORMAT, source_cache, Ingest, keep_upload,
+    snap_mode,
+    create_job, BULK_PARALLEL, BULK_FRAGMENTS, run_bulk, PEAKS_MAX_WIDTH, url_peaks, upload_peaks,
+    job_slot, make_progress_hook, FFMPEG_DIR, info_cache, ydl_pool, probe_media, FFMPEG_PATH,
+    make_ffmpeg_progress, ffmpeg_cut, check_ingest, ffmpeg_cut_many, remove_result, INGEST_TIMEOUT,
+    FFPROBE_PATH, stream_bulk_zip, slotted, stream_zip, metrics_text,
+)
+from youtube import download_audio, clean_title, check_range, source_key
 
 def open_browser():
     webbrowser.open_new("http://localhost:5005")
@@ -26,94 +37,69 @@ app = Flask(
     static_folder=resource_path('static')
 )
 
-progress_data = {'percent': '0%'}
-status_data   = {'step': 'En attente...'}
 last_ping     = time.time()
-temp_audio_path = None  # fichier temporaire
-
-# ---- Chemins ffmpeg/ffprobe (packagés localement) ----
-FFMPEG_DIR   = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg', 'bin')
-FFMPEG_PATH  = os.path.join(FFMPEG_DIR, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
-FFPROBE_PATH = os.path.join(FFMPEG_DIR, 'ffprobe.exe' if os.name == 'nt' else 'ffprobe')
-
-def clean_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
-
-def progress_hook(d):
-    if d['status'] == 'downloading':
-        raw = d.get('_percent_str', '0.0%')
-        progress_data['percent'] = clean_ansi(raw).strip()
-        status_data['step'] = "Téléchargement en cours... 📥"
-    elif d['status'] == 'finished':
-        progress_data['percent'] = 'convert'
-        status_data['step'] = "Conversion audio en cours... 🎧"
-
-# ---- Helpers temps/validation ----
-def parse_time(t):
-    parts = list(map(int, t.strip().split(":")))
-    if len(parts) == 1:
-        return parts[0]
-    elif len(parts) == 2:
-        return parts[0] * 60 + parts[1]
-    elif len(parts) == 3:
-        return parts[0] * 3600 + parts[1] * 60 + parts[2]
-    else:
-        raise ValueError("Format de temps invalide (hh:mm:ss, mm:ss ou ss)")
-
-def probe_duration(input_file):
-    """Retourne la durée (float, secondes) via ffprobe."""
-    try:
-        cmd = [
-            FFPROBE_PATH,
-            "-v", "error",
-            "-print_format", "json",
-            "-show_format",
-            "-show_streams",
-            input_file
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        # priorité au format.duration, fallback stream[0].duration
-        if 'format' in info and 'duration' in info['format']:
-            return float(info['format']['duration'])
-        for s in info.get('streams', []):
-            if 'duration' in s:
-                return float(s['duration'])
-        raise ValueError("Durée introuvable")
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"ffprobe a échoué: {e.stderr or e.stdout}")
-
-def ffmpeg_cut_to_mp3(input_file, start_time, end_time, output_path):
-    """Coupe l'audio entre start_time et end_time (en secondes) vers MP3."""
-    # -ss avant -i pour seek rapide; -to est relatif au début
-    cmd = [
-        FFMPEG_PATH,
-        "-v", "error",
-        "-ss", str(start_time),
-        "-to", str(end_time),
-        "-i", input_file,
-        "-vn",
-        "-acodec", "libmp3lame",
-        "-b:a", "128k",
-        "-y",
-        output_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-        raise RuntimeError(f"ffmpeg a échoué: {result.stderr or result.stdout}")
+
+# ---- Jobs d'extraction ----
+# Chaque /extract crée un job isolé (progression, étape, fichier résultat) exécuté
+# par un pool de workers : plusieurs utilisateurs ne se marchent plus dessus. Assez de
+# workers pour occuper tous les slots ; l'ordonnanceur décide de ce qui tourne.
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', str(FFMPEG_SLOTS + DOWNLOAD_SLOTS)))
+executor  = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix='extract')
+def job_events(job, keepalive=15):
+    """
+    Flux Server-Sent Events d'un job : 'progress', 'status', puis 'done' ou 'failed'.
+    Un commentaire est envoyé toutes les `keepalive` secondes pour garder la connexion.
+    """
+    version, last = -1, {}
+    while True:
+        snapshot, version = job.wait_change(version, keepalive)
+        if snapshot is None:
+            yield ": keepalive\n\n"
+            continue
+        messages, finished = job_messages(snapshot, last)
+        yield from messages
+        last = snapshot
+        if finished:
+            return
 
 # ---- Routes ----
 @app.route('/')
 def index():
-    return render_template('index.html')
-
-@app.route('/progress')
-def progress():
-    return jsonify(progress_data)
-
-@app.route('/status')
-def status():
-    return jsonify(status_data)
+    # Le flux /heartbeat ne sert qu'en mode bureau (arrêt auto quand l'onglet se ferme)
+    return render_template('index.html', heartbeat=app.config.get('DESKTOP_MODE', False),
+                           formats=output_choices(), bitrates=media.BITRATES)
+
+@app.route('/events/<job_id>')
+def events(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return Response(job_events(job), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/heartbeat')
+def heartbeat():
+    """Flux ouvert tant que l'onglet l'est : remplace les POST /ping en boucle."""
+    def generate():
+        global last_ping
+        while True:
+            last_ping = time.time()
+            yield ": ping\n\n"
+            time.sleep(15)
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/progress/<job_id>')
+def progress(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.progress())
+
+@app.route('/status/<job_id>')
+def status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.status())
 
 @app.route('/ping', methods=['POST'])
 def ping():
@@ -129,136 +115,441 @@ def download_start():
 
 @app.route('/extract', methods=['POST'])
 def extract():
-    global temp_audio_path
-
-    mode  = request.form['mode']
-    start = request.form['start']
-    end   = request.form['end']
+    """Valide la requête, prépare la source puis lance le job en arrière-plan."""
+    mode = request.form['mode']
 
-    ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'aac', 'mp4', 'avi', 'mkv'}
-
-    def allowed_file(filename):
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-    start_time = parse_time(start)
-    end_time   = parse_time(end)
+    try:
+        ranges = parse_ranges(request.form)
+        output = parse_output(request.form)
+    except (KeyError, TypeError, ValueError) as e:
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e) or "Plages invalides"})
+
+    # Même vidéo, mêmes plages, même sortie qu'un job en cours ou récent : on le rejoint,
+    # sans passer par la file ni le quota
+    key = None
+    if mode == 'youtube':
+        url = request.form.get('url', '').strip()
+        key = flight_key(url and (source_key(url) or url), ranges, output, request.form)
+        joined = flights.find(key)
+        if joined:
+            return jsonify({"success": True, "job_id": joined.id, "stored": False})
+
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    # Dossier de travail propre au job (supprimé à la fin du job), qui porte la place réservée
+    workdir = work_area.mkdtemp(prefix="extract_")
+    if not admit(request.content_length or 0, workdir):
+        work_area.remove(workdir)
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+    try:
+        if mode == 'youtube':
+            url = request.form.get('url', '').strip()
+            if not url:
+                raise Exception("Aucun lien YouTube fourni")
+            source = {'mode': 'youtube', 'url': url}
+        elif request.form.get('stream') == '1':
+            # Upload en flux : le fichier arrivera ensuite via PUT /ingest/<job_id>, sauf si
+            # son empreinte annoncée (sha256) désigne un upload déjà en cache
+            filename = request.form.get('filename', '')
+            if not allowed_file(filename):
+                raise Exception(UNSUPPORTED_FORMAT)
+            name, ext = os.path.splitext(filename)
+            digest = uploads.parse_digest(request.form.get('sha256'))
+            stored = uploads.fetch(source_cache, digest, workdir)
+            if stored:
+                source = {'mode': 'upload', 'input_file': stored, 'name': name, 'stored': True}
+                # Nom compris : le nom du résultat vient de l'envoi
+                key = flight_key(f"{uploads.key(digest)}/{name}", ranges, output, request.form)
+            else:
+                feed = Ingest(os.path.join(workdir, "uploaded_audio" + ext), ext[1:].lower(),
+                              seekable=bool(snap_mode(request.form)), keep=keep_upload)
+                source = {'mode': 'stream', 'ingest': feed, 'name': name}
+        else:
+            if 'audio-file' not in request.files:
+                raise Exception("Aucun fichier n'a été uploadé")
+
+            audio_file = request.files['audio-file']
+            if audio_file.filename == '':
+                raise Exception("Aucun fichier sélectionné")
+
+            if not allowed_file(audio_file.filename):
+                raise Exception(UNSUPPORTED_FORMAT)
+
+            # L'upload doit être lu pendant la requête : on le pose dans le dossier du job
+            original_filename = os.path.splitext(audio_file.filename)[0]
+            ext = os.path.splitext(audio_file.filename)[1]
+            input_file = os.path.join(workdir, "uploaded_audio" + ext)
+            digest = uploads.save_stream(audio_file.stream, input_file)
+            keep_upload(input_file, digest)
+            metrics.BYTES.inc(os.path.getsize(input_file), direction='uploaded')
+            # Vidéo déjà indexée : la découpe lit l'index plutôt que le fichier reçu
+            input_file = seekindex.fetch(source_cache, uploads.key(digest), workdir) or input_file
+            source = {'mode': 'upload', 'input_file': input_file, 'name': original_filename}
+            key = flight_key(f"{uploads.key(digest)}/{original_filename}", ranges, output, request.form)
+    except Exception as e:
+        work_area.remove(workdir)
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e)})
 
-    if end_time <= start_time:
-        return jsonify({"success": False, "error": "L'heure de fin doit être supérieure à l'heure de début."})
+    # delivery=stream : l'extrait est encodé pendant son téléchargement, sans fichier intermédiaire
+    source['delivery'] = request.form.get('delivery', 'file')
+    # snap=1 : bornes calées sur les silences voisins avant la découpe ; snap=suggest : proposées
+    source['snap'] = snap_mode(request.form)
+    source['output'] = output
+    job, joined = flights.join(key, create_job)
+    if joined:  # doublon arrivé pendant la préparation de la source
+        work_area.remove(workdir)
+        return jsonify({"success": True, "job_id": job.id, "stored": source.get('stored', False)})
+    if source['mode'] == 'stream':
+        job.update(ingest=source['ingest'], step="En attente du fichier... 📤")
+    executor.submit(run_job, job, source, ranges, workdir)
+    # stored : source reprise du cache, le client n'envoie pas le fichier
+    return jsonify({"success": True, "job_id": job.id, "stored": source.get('stored', False)})
+
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    """
+    Lot de vidéos : `urls` (une par ligne, playlists acceptées), plages comme /extract ou
+    full=1 pour l'audio complet, `parallel` téléchargements simultanés, `fragments` par vidéo.
+    """
+    try:
+        urls = [u.strip() for u in request.form.get('urls', '').splitlines() if u.strip()]
+        if not urls:
+            raise ValueError("Aucun lien fourni")
+        ranges = None if request.form.get('full') == '1' else parse_ranges(request.form)
+        parallel  = max(1, min(int(request.form.get('parallel', BULK_PARALLEL)), BULK_PARALLEL))
+        fragments = max(1, min(int(request.form.get('fragments', BULK_FRAGMENTS)), 16))
+        output    = parse_output(request.form)
+    except (KeyError, TypeError, ValueError) as e:
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e) or "Requête invalide"})
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    if not admit():
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+
+    job = create_job()
+    job.update(items=[])
+    executor.submit(run_bulk, job, urls, ranges, parallel, fragments, output)
+    return jsonify({"success": True, "job_id": job.id})
+
+@app.route('/peaks')
+def peaks():
+    """
+    Forme d'onde d'un lien (`url`) ou d'un fichier déjà envoyé (`sha256`) réduite à
+    `width` colonnes, pour choisir les plages. La source téléchargée pour l'occasion entre
+    dans le cache des sources : l'extraction qui suit ne la télécharge pas une seconde fois.
+    Calculée dans le pool `executor`, sous les slots de l'ordonnanceur, comme un job.
+    """
+    url = request.args.get('url', '').strip()
+    digest = uploads.parse_digest(request.args.get('sha256'))
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    try:
+        width = max(1, min(int(request.args.get('width', 1000)), PEAKS_MAX_WIDTH))
+        if not url and not digest:
+            raise ValueError("Aucun lien fourni")
+        result = executor.submit(*((url_peaks, url) if url else (upload_peaks, digest))).result()
+        data = waveform.to_json(result, width)
+    except Exception as e:
+        metrics.count_error(e)
+        return jsonify({"success": False, "error": str(e)})
+    response = jsonify({"success": True, **data})
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+@app.route('/ingest/<job_id>', methods=['PUT'])
+def ingest(job_id):
+    """Corps brut du fichier d'un job créé avec stream=1, transmis à ffmpeg au fil de l'eau."""
+    job = get_job(job_id)
+    if job is None or job.ingest is None:
+        return jsonify({"success": False, "error": "Job introuvable"}), 404
+    feed = job.ingest
+    if not feed.claim():
+        return jsonify({"success": False, "error": "Fichier déjà reçu pour ce job"}), 409
+
+    total = request.content_length
+    # Le fichier arrive maintenant : sa taille annoncée est réservée sur le dossier du job
+    if not admit(total or 0, os.path.dirname(feed.path)):
+        feed.abort(QUOTA_EXCEEDED)
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+
+    def on_chunk(received):
+        # En mode spool la découpe attend la fin de l'envoi : on affiche la réception
+        if feed.mode == 'spool' and total:
+            job.update(percent=f"{received * 100 / total:.1f}%", step="Réception du fichier... 📤")
 
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            if mode == 'youtube':
-                url = request.form['url']
-                audio_output_path    = os.path.join(temp_dir, "audio.%(ext)s")
-                downloaded_file_path = os.path.join(temp_dir, "audio.mp3")
-
-                status_data['step'] = "Récupération du lien et du timing..."
-
-                # Options yt-dlp durcies pour contourner SABR/Signature (client Android) + cookies
-                cookies_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookies.txt')
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': audio_output_path,
-                    'progress_hooks': [progress_hook],
-                    'prefer_ffmpeg': True,
-                    'ffmpeg_location': FFMPEG_DIR,
-                    'noplaylist': True,
-                    'extractor_args': {
-                        'youtube': {
-                            'player_client': ['android']
-                        }
-                    },
-                    'postprocessor_args': {
-                        'ffmpeg': ['-preset', 'ultrafast', '-loglevel', 'info']
-                    },
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '128',
-                    }]
-                }
-                if os.path.exists(cookies_path):
-                    ydl_opts['cookiefile'] = cookies_path
-
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    video_title = info.get('title', 'video')
-                    video_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()
-                    ydl.download([url])
-
-                if not os.path.exists(downloaded_file_path):
-                    raise Exception("Fichier MP3 non trouvé après le téléchargement.")
-                
-                input_file = downloaded_file_path
-                output_filename = f"{video_title}_{start}-{end}.mp3"
-            else:
-                if 'audio-file' not in request.files:
-                    raise Exception("Aucun fichier n'a été uploadé")
-                
-                audio_file = request.files['audio-file']
-                if audio_file.filename == '':
-                    raise Exception("Aucun fichier sélectionné")
-                
-                if not allowed_file(audio_file.filename):
-                    raise Exception("Format de fichier non supporté. Formats acceptés : MP3, WAV, M4A, AAC, MP4, AVI, MKV")
-                
-                original_filename = os.path.splitext(audio_file.filename)[0]
-                ext = os.path.splitext(audio_file.filename)[1]
-                input_file = os.path.join(temp_dir, "uploaded_audio" + ext)
-                audio_file.save(input_file)
-                status_data['step'] = "Fichier uploadé avec succès"
-                output_filename = f"{original_filename}_{start}-{end}.mp3"
-
-            # Validation durée via ffprobe
-            status_data['step'] = "Analyse du média... 🔎"
-            clip_duration = probe_duration(input_file)
-
-            if start_time >= clip_duration or end_time > clip_duration:
-                raise ValueError(
-                    f"La durée du fichier est de {int(clip_duration//60)}:{int(clip_duration%60):02d}. "
-                    "Veuillez choisir une plage de temps valide."
+        feed.receive(request.stream, total, on_chunk=on_chunk)
+    except Exception as e:
+        # L'erreur est comptée par le job, qui échoue avec elle
+        return jsonify({"success": False, "error": str(e)}), 400
+    finally:
+        metrics.BYTES.inc(feed.received, direction='uploaded')
+    return jsonify({"success": True, "received": feed.received, "sha256": feed.digest.hexdigest()})
+
+def run_job(job, source, ranges, workdir):
+    """Exécuté dans le pool : téléchargement éventuel, analyse puis découpage."""
+    job.update(state='running')
+    # Fenêtre couvrant toutes les plages demandées
+    first = min(r[2] for r in ranges)
+    last  = max(r[3] for r in ranges)
+    output = source.get('output', media.DEFAULT_OUTPUT)
+    spec = media.OUTPUT_FORMATS[output[0]]
+    feed, popen_kwargs = None, {}
+    try:
+        info, offset = {}, 0
+        if source['mode'] == 'youtube':
+            with job_slot(job, 'io'):
+                job.update(step="Récupération du lien et du timing...")
+                input_file, info, offset = download_audio(
+                    source['url'], workdir, first, last,
+                    [make_progress_hook(job)], FFMPEG_DIR,
+                    on_status=lambda text: job.update(step=text),
+                    cache=source_cache,
+                    info_cache=info_cache,
+                    pool=ydl_pool,
                 )
+            work_area.settle(workdir)
+            base_name = clean_title(info.get('title', 'video'))
+        elif source['mode'] == 'stream':
+            feed = source['ingest']
+            input_file, popen_kwargs = wait_ingest(job, feed)
+            base_name = source['name']
+        else:
+            input_file = source['input_file']
+            job.update(step="Fichier déjà reçu, repris du cache ♻️" if source.get('stored')
+                       else "Fichier uploadé avec succès")
+            base_name = source['name']
+
+        # Durée, codec et débit : métadonnées yt-dlp quand elles existent, sinon ffprobe
+        meta = media.metadata_from_info(info)
+        if feed and feed.mode == 'pipe':
+            # Lecture séquentielle sur stdin : pas de ffprobe, la durée est contrôlée après coup
+            meta['codec'] = feed.ext if feed.ext in ('mp3', 'aac') else None
+        elif not meta['duration']:
+            # Validation durée via ffprobe (déjà faite via les métadonnées yt-dlp sinon)
+            job.update(step="Analyse du média... 🔎")
+            meta = probe_media(input_file)
+            check_range(meta['duration'], first, last)
+        source_codec = meta['codec']
+
+        # Encodage différé : /download lance ffmpeg et envoie sa sortie au fil de l'eau
+        deferred = (len(ranges) == 1 and source['delivery'] == 'stream' and spec['streamable']
+                    and not (feed and feed.mode == 'pipe'))
+        # Calage et découpe : un slot ffmpeg de l'ordonnanceur, tenu jusqu'à la fin de la coupe
+        # (l'encodage différé prend le sien dans /download)
+        with job_slot(job, 'cpu') if source.get('snap') or not deferred else contextlib.nullcontext():
+            if source.get('snap') and not (feed and feed.mode == 'pipe'):
+                # Bornes calées sur les pauses voisines (sauf lecture en flux : pas de retour en arrière),
+                # transmises au client (status, événement 'snapped') et appliquées seulement avec snap=1
+                job.update(step="Calage des bornes sur les silences... 🔇")
+                snapped = silence.snap_ranges(input_file, ranges, FFMPEG_PATH, offset)
+                job.update(snapped=[[start, end] for start, end, _, _ in snapped])
+                if source['snap'] == 'apply':
+                    ranges = snapped
+
+            if deferred:
+                # Le dossier du job (source comprise) devient le résultat, supprimé après l'envoi
+                # ou à l'expiration du job.
+                start, end, start_time, end_time = ranges[0]
+                job.update(result_path=workdir,
+                           pending_cut=(input_file, start_time - offset, end_time - offset, source_codec, output))
+                output_filename = f"{base_name}_{start}-{end}.{spec['ext']}"
+            elif len(ranges) == 1:
+                start, end, start_time, end_time = ranges[0]
+                # Découpage via ffmpeg
+                job.update(step="Découpage de l'extrait... ✂️", percent='0%')
+
+                # Fichier résultat dans l'espace de travail, invisible côté utilisateur
+                temp_audio_path = work_area.mkstemp(suffix='.' + spec['ext'])
+                job.update(result_path=temp_audio_path)
+
+                reached = [start_time]  # position atteinte dans la source (contrôle des flux)
+                on_progress = make_ffmpeg_progress(job)
+
+                def track(p):
+                    if p['out_time'] is not None:
+                        reached[0] = start_time + p['out_time']
+                    on_progress(p)
+
+                try:
+                    ffmpeg_cut(input_file, start_time - offset, end_time - offset, temp_audio_path,
+                               source_codec, track, output, **popen_kwargs)
+                except media.FFmpegError:
+                    if feed:  # sortie vide : la plage dépasse peut-être la fin du flux
+                        check_ingest(feed, start_time, end_time, reached[0])
+                    raise
+                if feed:
+                    check_ingest(feed, start_time, end_time, start_time + output_seconds(temp_audio_path))
+                output_filename = f"{base_name}_{start}-{end}.{spec['ext']}"
+            else:
+                # Tous les extraits en une seule passe ffmpeg, servis ensuite en ZIP
+                job.update(step=f"Découpage de {len(ranges)} extraits... ✂️", percent='0%')
+                clips_dir = work_area.mkdtemp(prefix="clips_")
+                job.update(result_path=clips_dir)
+
+                clips, names = [], []
+                for i, (start, end, start_time, end_time) in enumerate(ranges, 1):
+                    name = f"{i:02d}_{base_name}_{start}-{end}.{spec['ext']}".replace(":", "-")
+                    clips.append((start_time - offset, end_time - offset, os.path.join(clips_dir, name)))
+                    names.append(name)
+                ffmpeg_cut_many(input_file, clips, source_codec, make_ffmpeg_progress(job), output, **popen_kwargs)
+                if feed:
+                    check_ingest(feed, first, last)
+                    for start_time, end_time, out in clips:
+                        check_ingest(feed, start_time, end_time, start_time + output_seconds(out))
+                job.update(clips=[(name, out) for name, (_, _, out) in zip(names, clips)])
+                output_filename = f"{base_name}_extraits.zip"
+
+        work_area.settle(job.result_path)
+        job.update(state='done', step="Terminé ✅", percent='done', speed=None, eta=None,
+                   filename=output_filename)
 
-            # Découpage via ffmpeg
-            status_data['step'] = "Découpage de l'extrait... ✂️"
-            progress_data['percent'] = '0%'
+    except Exception as e:
+        remove_result(job.result_path)
+        metrics.count_error(e)
+        job.update(state='error', step=f"Erreur : {str(e)}", error=str(e), result_path=None)
+    finally:
+        if feed:
+            feed.close()
+        job.update(ingest=None)
+        if job.result_path != workdir:
+            work_area.remove(workdir)
+
+def wait_ingest(job, feed):
+    """
+    Attend l'upload en flux d'un job. Retourne (entrée ffmpeg, options Popen) :
+    le tube en mode 'pipe', le fichier complet en mode 'spool'.
+    """
+    if not feed.ready.wait(INGEST_TIMEOUT):
+        raise Exception("Aucun fichier reçu")
+    if feed.error:
+        raise Exception(feed.error)
+    if feed.mode == 'pipe':
+        job.update(step="Découpage pendant la réception du fichier... ✂️")
+        return 'pipe:0', {'stdin': feed.read_fd}
+
+    # Le format exige un fichier complet : on attend la fin de l'envoi, tant qu'il progresse
+    received = -1
+    while not feed.complete.wait(INGEST_TIMEOUT):
+        if feed.received == received:
+            raise Exception("Envoi interrompu : plus de données reçues")
+        received = feed.received
+    if feed.error:
+        raise Exception(feed.error)
+    job.update(step="Fichier uploadé avec succès")
+    return feed.path, {}
+
+def output_seconds(path):
+    """
+    Durée réelle d'un extrait produit (ffprobe), 0 s'il est vide ou illisible : la
+    progression de ffmpeg (out_time) avance aussi sur des données invalides.
+    """
+    try:
+        return media.probe_media(path, FFPROBE_PATH)['duration']
+    except (OSError, ValueError, media.FFmpegError):
+        return 0.0
+
+@app.route('/download/<job_id>')
+def download(job_id):
+    job = get_job(job_id)
+    if job is not None and job.items is not None and job.state != 'error':
+        # Lot : ZIP envoyé au fil des vidéos terminées, sans attendre la fin du lot
+        download_name = request.args.get('filename', 'lot_extraits.zip')
+        return Response(metrics.metered(stream_bulk_zip(job)), mimetype='application/zip', headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"
+        })
+    if job is None or job.state != 'done':
+        return "Fichier introuvable", 404
+
+    # Un seul envoi, sauf résultat partagé (flights.py)
+    path, shared, cut = job.take_result()
+    download_name = request.args.get('filename', job.filename or 'extrait_audio.mp3')
+
+    if path and cut:
+        input_file, start_time, end_time, source_codec, output = cut
+
+        cmd = media.build_cut_command(FFMPEG_PATH, input_file, start_time, end_time, 'pipe:1', source_codec,
+                                      output)
+        metrics.count_cuts(output, source_codec)
+        chunks = slotted('cpu', media.stream_ffmpeg(cmd))
+        try:
+            # Premier bloc lu avant de répondre : un échec de ffmpeg donne encore une erreur HTTP
+            head = next(chunks, b'')
+        except media.FFmpegError as e:
+            remove_result(path)
+            return str(e), 500
+
+        def generate():
+            try:
+                yield head
+                yield from chunks
+            finally:
+                chunks.close()  # client parti : arrête ffmpeg
+                remove_result(path)
 
-            # Créer un fichier temporaire invisible côté utilisateur
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            temp_audio_path = temp_file.name
-            temp_file.close()
+        return Response(metrics.metered(generate()), mimetype=media.OUTPUT_FORMATS[output[0]]['mime'], headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"
+        })
 
-            ffmpeg_cut_to_mp3(input_file, start_time, end_time, temp_audio_path)
+    if path and job.clips and os.path.isdir(path):
 
-        status_data['step'] = "Terminé ✅"
-        progress_data['percent'] = 'done'
-        return jsonify({"success": True, "filename": output_filename})
+        def generate():
+            try:
+                yield from stream_zip(job.clips)
+            finally:
+                if not shared:
+                    remove_result(path)
 
-    except Exception as e:
-        status_data['step'] = f"Erreur : {str(e)}"
-        return jsonify({"success": False, "error": str(e)})
+        return Response(metrics.metered(generate()), mimetype='application/zip', headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"
+        })
 
-@app.route('/download')
-def download():
-    global temp_audio_path
+    if path and os.path.exists(path):
 
-    if temp_audio_path and os.path.exists(temp_audio_path):
-        path = temp_audio_path
-        temp_audio_path = None  # Reset avant suppression
+        response = send_file(path, as_attachment=True, download_name=download_name, mimetype=media.mime_of(path))
+        # Supprimé une fois la réponse envoyée et le fichier fermé (sans passthrough,
+        # werkzeug n'appellerait pas call_on_close)
+        response.direct_passthrough = False
+        metrics.BYTES.inc(os.path.getsize(path), direction='sent')
+        started = time.monotonic()
 
-        def delete_file_later(p):
-            time.sleep(5)
-            try:
-                os.remove(p)
-            except Exception:
-                pass
+        def on_close():
+            metrics.STAGE_SECONDS.observe(time.monotonic() - started, stage='transfer')
+            if not shared:
+                remove_result(path)
 
-        threading.Thread(target=delete_file_later, args=(path,), daemon=True).start()
-        return send_file(path, as_attachment=True, download_name=request.args.get('filename', 'extrait_audio.mp3'))
+        response.call_on_close(on_close)
+        return response
 
     return "Fichier introuvable", 404
 
+@app.route('/download/<job_id>/<int:index>')
+def download_item(job_id, index):
+    """Extrait d'une vidéo de lot, disponible dès qu'elle est terminée (ZIP si plusieurs plages)."""
+    job = get_job(job_id)
+    items = job.items if job else None
+    if not items or index >= len(items) or items[index]['state'] != 'done':
+        return "Fichier introuvable", 404
+    files = items[index]['files']
+    if len(files) > 1:
+        name = os.path.splitext(files[0][0])[0].rsplit('_', 1)[0] + "_extraits.zip"
+        return Response(metrics.metered(stream_zip(files)), mimetype='application/zip', headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(name)}"
+        })
+    metrics.BYTES.inc(os.path.getsize(files[0][1]), direction='sent')
+    return send_file(files[0][1], as_attachment=True, download_name=files[0][0],
+                     mimetype=media.mime_of(files[0][1]))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
 def monitor_browser():
     global last_ping
     while True:
@@ -267,7 +558,12 @@ def monitor_browser():
             print("Navigateur fermé. Arrêt du serveur...")
             os._exit(0)
 
+# Nettoyage, encodeurs ffmpeg et préchargement de yt-dlp (cf. service.start)
+service.start()
+startup.mark('app_loaded')
+
 if __name__ == '__main__':
+    app.config['DESKTOP_MODE'] = True
     threading.Thread(target=monitor_browser, daemon=True).start()
     threading.Timer(1, open_browser).start()
-    app.run(debug=False)
+    app.run(debug=False, threaded=True)
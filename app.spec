@@ -6,7 +6,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates'), ('static', 'static'), ('ffmpeg', 'ffmpeg')],
-    hiddenimports=[],
+    # yt-dlp et NumPy ne sont importés qu'au premier usage : inclus explicitement
+    hiddenimports=['yt_dlp', 'numpy'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,722 @@
+"""
+Mode serveur asynchrone (ASGI) : mêmes routes, même page et mêmes jobs que app.py,
+servis par Quart.
+
+    uvicorn asgi_app:app --port 5005        (ou : hypercorn asgi_app:app)
+
+ffmpeg/ffprobe tournent en sous-process asyncio et le téléchargement yt-dlp (bloquant)
+dans un pool de threads dédié : une extraction en attente, un upload en cours ou un
+flux d'événements ouvert ne coûte qu'une tâche asyncio, pas un thread.
+Les routes propres au mode bureau (/heartbeat, /ping, /download-start) restent dans app.py.
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
+
+import aiofiles
+from quart import Quart, render_template, request, jsonify, Response
+from quart.utils import run_sync_iterable
+
+import media
+import metrics
+import seekindex
+import service
+import silence
+import uploads
+import waveform
+from service import (
+    resource_path, create_job, get_job, remove_result, parse_ranges, allowed_file,
+    UNSUPPORTED_FORMAT, make_progress_hook, make_ffmpeg_progress, ingest_mode, head_complete,
+    check_ingest, job_messages, stream_zip, SSE_HEADERS, INGEST_TIMEOUT, Ingest,
+    FFMPEG_DIR, FFMPEG_PATH, FFPROBE_PATH, source_cache, info_cache, metrics_text,
+    run_bulk, stream_bulk_zip, BULK_PARALLEL, BULK_FRAGMENTS, ydl_pool, url_peaks, PEAKS_MAX_WIDTH,
+    work_area, admit, QUOTA_EXCEEDED, keep_upload, upload_keepable, upload_peaks, parse_output,
+    output_choices,
+    scheduler, overloaded, waiting_step, SERVER_BUSY, flights, flight_key, snap_mode,
+)
+from youtube import download_audio, clean_title, check_range, source_key
+
+# Threads des téléchargements yt-dlp (bloquants) ; leur nombre simultané est borné par
+# l'ordonnanceur (DOWNLOAD_SLOTS), les jobs en attente de slot n'occupent pas de thread
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', '32'))
+
+app = Quart(
+    __name__,
+    template_folder=resource_path('templates'),
+    static_folder=resource_path('static')
+)
+# Uploads volumineux et flux longs (SSE, MP3 encodé à la volée) : pas de limite Quart
+app.config.update(MAX_CONTENT_LENGTH=None, BODY_TIMEOUT=None, RESPONSE_TIMEOUT=None)
+
+downloader = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='download')
+
+
+def off_loop(func, *args, **kwargs):
+    """
+    Appel bloquant (espace de travail, purge des jobs, sous-process ffmpeg) exécuté dans le
+    pool `downloader` : à attendre, la boucle reste libre.
+    """
+    return asyncio.get_running_loop().run_in_executor(downloader, partial(func, *args, **kwargs))
+
+
+@app.before_serving
+async def start_background():
+    """Nettoyage, encodeurs ffmpeg et préchargement de yt-dlp (cf. service.start)."""
+    service.start()
+
+
+class AsyncIngest:
+    """
+    Ingest (service.py) en asyncio. En mode 'pipe', le corps est écrit directement sur
+    l'entrée standard du ffmpeg du job (avec contre-pression via drain) ; en mode
+    'spool', dans le fichier du dossier du job. Haché au passage, comme Ingest ;
+    keep est ici une coroutine.
+    """
+    HEAD_MAX = Ingest.HEAD_MAX
+
+    def __init__(self, path, ext, seekable=False, keep=None):
+        self.path     = path
+        self.ext      = ext
+        self.seekable = seekable
+        self.keep     = keep
+        self.digest   = hashlib.sha256()
+        self.mode     = None
+        self.error    = None
+        self.received = 0
+        self.stdin    = None                # entrée standard du ffmpeg du job (mode pipe)
+        self.ready    = asyncio.Event()     # mode choisi
+        self.attached = asyncio.Event()     # ffmpeg lancé (ou job terminé)
+        self.complete = asyncio.Event()     # corps entièrement reçu (ou envoi interrompu)
+        self._claimed = False
+        self._closed  = False
+
+    def claim(self):
+        if self._claimed or self._closed:
+            return False
+        self._claimed = True
+        return True
+
+    def attach(self, proc):
+        """on_start de run_ffmpeg_async : le corps part désormais vers ce process."""
+        self.stdin = proc.stdin
+        self.attached.set()
+
+    def abort(self, error):
+        self.error = error
+        self.ready.set()
+        self.complete.set()
+
+    def close(self):
+        self._closed = True
+        self.attached.set()
+
+    async def receive(self, body, total=None, on_chunk=None):
+        chunks = body.__aiter__()
+        copy_path = None
+        try:
+            head = b''
+            while len(head) < self.HEAD_MAX:
+                chunk = await anext(chunks, b'')
+                if not chunk:
+                    break
+                head += chunk
+                if head_complete(self.ext, head):
+                    break
+            self.received = len(head)
+            if not head:
+                raise ValueError("fichier vide")
+            if self._closed:
+                raise RuntimeError("le job est terminé")
+
+            self.mode = ingest_mode(self.ext, head, self.seekable)
+            self.ready.set()
+            if self.mode == 'pipe' and self.keep and upload_keepable(total):
+                await self.attached.wait()
+                # Copie à conserver, hors du dossier du job (cf. Ingest)
+                copy_path = await off_loop(work_area.mkstemp, suffix='.' + self.ext)
+                work_area.transfer(os.path.dirname(self.path), copy_path, total)
+                async with aiofiles.open(copy_path, 'wb') as copy:
+                    async def write(chunk):
+                        await copy.write(chunk)
+                        await self._write_pipe(chunk)
+                    await self._pump(chunks, head, write, on_chunk)
+            elif self.mode == 'pipe':
+                await self.attached.wait()
+                await self._pump(chunks, head, self._write_pipe, on_chunk)
+            else:
+                async with aiofiles.open(self.path, 'wb') as f:
+                    await self._pump(chunks, head, f.write, on_chunk)
+            if total is not None and self.received < total:
+                raise ConnectionError("corps de requête incomplet")
+            if self.keep and (copy_path or self.mode == 'spool'):
+                if self.stdin:
+                    self.stdin.close()  # fin du flux pour ffmpeg avant la mise en cache
+                    self.stdin = None
+                await self.keep(copy_path or self.path, self.digest.hexdigest())
+        except asyncio.CancelledError:
+            self.error = "Envoi interrompu par le client"
+            raise
+        except Exception as e:
+            self.error = f"Envoi interrompu : {e}"
+            raise
+        finally:
+            # Erreur notée avant la fermeture : ffmpeg voit la fin du flux, le job sait
+            # que l'extrait est tronqué
+            if self.stdin:
+                self.stdin.close()
+            if copy_path:
+                downloader.submit(work_area.remove, copy_path)  # sans attendre (envoi annulé compris)
+            self.ready.set()
+            self.complete.set()
+
+    async def _write_pipe(self, chunk):
+        if self.stdin is None:
+            return  # ffmpeg a fini (plage atteinte) : on vide le reste de l'envoi
+        try:
+            self.stdin.write(chunk)
+            await self.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            self.stdin = None
+
+    async def _pump(self, chunks, chunk, write, on_chunk):
+        while chunk:
+            self.digest.update(chunk)
+            await write(chunk)
+            if on_chunk:
+                on_chunk(self.received)
+            chunk = await anext(chunks, b'')
+            self.received += len(chunk)
+
+
+async def job_events_async(job, keepalive=15):
+    """job_events (app.py) sans thread bloqué : réveillé par Job.subscribe."""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    unsubscribe = job.subscribe(lambda: loop.call_soon_threadsafe(changed.set))
+    try:
+        version, last = -1, {}
+        while True:
+            snapshot, version = job.wait_change(version, 0)
+            if snapshot is None:
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                changed.clear()
+                continue
+            messages, finished = job_messages(snapshot, last)
+            for message in messages:
+                yield message
+            last = snapshot
+            if finished:
+                return
+    finally:
+        unsubscribe()
+
+
+async def ffmpeg_cut(input_file, start_time, end_time, output_path, source_codec=None,
+                     on_progress=None, output=media.DEFAULT_OUTPUT, **kwargs):
+    cmd = media.build_cut_command(FFMPEG_PATH, input_file, start_time, end_time, output_path, source_codec,
+                                  output)
+    metrics.count_cuts(output, source_codec)
+    code, err = await media.run_ffmpeg_async(cmd, end_time - start_time, on_progress, **kwargs)
+    if code != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        raise media.FFmpegError(f"ffmpeg a échoué: {err}")
+
+
+async def ffmpeg_cut_many(input_file, clips, source_codec=None, on_progress=None, output=media.DEFAULT_OUTPUT,
+                          **kwargs):
+    cmd = media.build_multi_cut_command(FFMPEG_PATH, input_file, clips, source_codec, output)
+    metrics.count_cuts(output, source_codec, len(clips))
+    span = max(end for _, end, _ in clips) - min(start for start, _, _ in clips)
+    code, err = await media.run_ffmpeg_async(cmd, span, on_progress, **kwargs)
+    if code != 0 or any(not os.path.exists(out) or os.path.getsize(out) == 0 for _, _, out in clips):
+        raise media.FFmpegError(f"ffmpeg a échoué: {err}")
+
+
+async def output_seconds_async(path):
+    """app.output_seconds sans bloquer la boucle."""
+    try:
+        return (await media.probe_media_async(path, FFPROBE_PATH))['duration']
+    except (OSError, ValueError, media.FFmpegError):
+        return 0.0
+
+
+@contextlib.asynccontextmanager
+async def job_slot_async(job, kind):
+    """job_slot (service.py) pour une tâche asyncio : attente sans thread bloqué."""
+    async with scheduler.slot_async(kind, waiting_step(job)):
+        if job.position is not None:
+            job.update(position=None)
+        yield
+
+
+async def read_file(path, chunk_size=64 * 1024):
+    async with aiofiles.open(path, 'rb') as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def stream_cut(cmd):
+    """Sortie de ffmpeg au fil de l'encodage, dans un slot 'cpu' de l'ordonnanceur."""
+    async with scheduler.slot_async('cpu'):
+        chunks = media.stream_ffmpeg_async(cmd)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+
+# ---- Routes ----
+@app.route('/')
+async def index():
+    return await render_template('index.html', heartbeat=False, formats=await off_loop(output_choices),
+                                 bitrates=media.BITRATES)
+
+@app.route('/events/<job_id>')
+async def events(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    response = Response(job_events_async(job), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.timeout = None
+    return response
+
+@app.route('/progress/<job_id>')
+async def progress(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.progress())
+
+@app.route('/status/<job_id>')
+async def status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.status())
+
+@app.route('/extract', methods=['POST'])
+async def extract():
+    """Valide la requête, prépare la source puis lance le job en tâche de fond."""
+    form = await request.form
+    mode = form['mode']
+
+    try:
+        ranges = parse_ranges(form)
+        output = await off_loop(parse_output, form)  # ffmpeg -encoders au premier appel
+    except (KeyError, TypeError, ValueError) as e:
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e) or "Plages invalides"})
+
+    # Doublon d'un job en cours ou récent (cf. app.extract) : on le rejoint
+    loop = asyncio.get_running_loop()
+    key = None
+    if mode == 'youtube':
+        url = form.get('url', '').strip()
+        source_id = url and (await loop.run_in_executor(downloader, source_key, url) or url)
+        key = flight_key(source_id, ranges, output, form)
+        joined = flights.find(key)
+        if joined:
+            return jsonify({"success": True, "job_id": joined.id, "stored": False})
+
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    workdir = await off_loop(work_area.mkdtemp, prefix="extract_")
+    # Attente éventuelle de place (quota atteint) dans un thread
+    if not await off_loop(admit, request.content_length or 0, workdir):
+        await off_loop(work_area.remove, workdir)
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+    try:
+        if mode == 'youtube':
+            url = form.get('url', '').strip()
+            if not url:
+                raise Exception("Aucun lien YouTube fourni")
+            source = {'mode': 'youtube', 'url': url}
+        elif form.get('stream') == '1':
+            filename = form.get('filename', '')
+            if not allowed_file(filename):
+                raise Exception(UNSUPPORTED_FORMAT)
+            name, ext = os.path.splitext(filename)
+            digest = uploads.parse_digest(form.get('sha256'))
+            stored = await loop.run_in_executor(downloader, uploads.fetch, source_cache, digest, workdir)
+            if stored:
+                source = {'mode': 'upload', 'input_file': stored, 'name': name, 'stored': True}
+                key = flight_key(f"{uploads.key(digest)}/{name}", ranges, output, form)
+            else:
+                feed = AsyncIngest(os.path.join(workdir, "uploaded_audio" + ext), ext[1:].lower(),
+                                   seekable=bool(snap_mode(form)), keep=keep_upload_async)
+                source = {'mode': 'stream', 'ingest': feed, 'name': name}
+        else:
+            files = await request.files
+            if 'audio-file' not in files:
+                raise Exception("Aucun fichier n'a été uploadé")
+            audio_file = files['audio-file']
+            if audio_file.filename == '':
+                raise Exception("Aucun fichier sélectionné")
+            if not allowed_file(audio_file.filename):
+                raise Exception(UNSUPPORTED_FORMAT)
+
+            name, ext = os.path.splitext(audio_file.filename)
+            input_file = os.path.join(workdir, "uploaded_audio" + ext)
+            digest = await loop.run_in_executor(downloader, uploads.save_stream, audio_file.stream, input_file)
+            await keep_upload_async(input_file, digest)
+            metrics.BYTES.inc(os.path.getsize(input_file), direction='uploaded')
+            # Vidéo déjà indexée : la découpe lit l'index plutôt que le fichier reçu
+            input_file = await loop.run_in_executor(downloader, seekindex.fetch, source_cache,
+                                                    uploads.key(digest), workdir) or input_file
+            source = {'mode': 'upload', 'input_file': input_file, 'name': name}
+            key = flight_key(f"{uploads.key(digest)}/{name}", ranges, output, form)
+    except Exception as e:
+        await off_loop(work_area.remove, workdir)
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e)})
+
+    source['delivery'] = form.get('delivery', 'file')
+    source['snap'] = snap_mode(form)
+    source['output'] = output
+    # create_job purge les jobs expirés (suppression de leurs résultats)
+    job, joined = await off_loop(flights.join, key, create_job)
+    if joined:
+        await off_loop(work_area.remove, workdir)
+        return jsonify({"success": True, "job_id": job.id, "stored": source.get('stored', False)})
+    if source['mode'] == 'stream':
+        job.update(ingest=source['ingest'], step="En attente du fichier... 📤")
+    app.add_background_task(run_job, job, source, ranges, workdir)
+    return jsonify({"success": True, "job_id": job.id, "stored": source.get('stored', False)})
+
+async def keep_upload_async(path, digest):
+    """service.keep_upload (ffprobe, copie dans le cache, indexation) dans le pool `downloader`."""
+    await asyncio.get_running_loop().run_in_executor(downloader, keep_upload, path, digest)
+
+@app.route('/bulk', methods=['POST'])
+async def bulk():
+    """Lot de vidéos (cf. app.bulk) : exécuté par des threads du pool `downloader`."""
+    form = await request.form
+    try:
+        urls = [u.strip() for u in form.get('urls', '').splitlines() if u.strip()]
+        if not urls:
+            raise ValueError("Aucun lien fourni")
+        ranges = None if form.get('full') == '1' else parse_ranges(form)
+        parallel  = max(1, min(int(form.get('parallel', BULK_PARALLEL)), BULK_PARALLEL))
+        fragments = max(1, min(int(form.get('fragments', BULK_FRAGMENTS)), 16))
+        output    = await off_loop(parse_output, form)
+    except (KeyError, TypeError, ValueError) as e:
+        metrics.count_error('validation')
+        return jsonify({"success": False, "error": str(e) or "Requête invalide"})
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    if not await off_loop(admit):
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+
+    job = await off_loop(create_job)
+    job.update(items=[])
+    downloader.submit(run_bulk, job, urls, ranges, parallel, fragments, output)
+    return jsonify({"success": True, "job_id": job.id})
+
+@app.route('/peaks')
+async def peaks():
+    """Forme d'onde (cf. app.peaks) : téléchargement et décodage dans le pool `downloader`."""
+    url = request.args.get('url', '').strip()
+    digest = uploads.parse_digest(request.args.get('sha256'))
+    retry = overloaded()
+    if retry:
+        return jsonify({"success": False, "error": SERVER_BUSY.format(retry)}), 429, {'Retry-After': str(retry)}
+    try:
+        width = max(1, min(int(request.args.get('width', 1000)), PEAKS_MAX_WIDTH))
+        if not url and not digest:
+            raise ValueError("Aucun lien fourni")
+        result = await asyncio.get_running_loop().run_in_executor(
+            downloader, *((url_peaks, url) if url else (upload_peaks, digest)))
+        data = waveform.to_json(result, width)
+    except Exception as e:
+        metrics.count_error(e)
+        return jsonify({"success": False, "error": str(e)})
+    response = jsonify({"success": True, **data})
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+@app.route('/ingest/<job_id>', methods=['PUT'])
+async def ingest(job_id):
+    job = get_job(job_id)
+    if job is None or job.ingest is None:
+        return jsonify({"success": False, "error": "Job introuvable"}), 404
+    feed = job.ingest
+    if not feed.claim():
+        return jsonify({"success": False, "error": "Fichier déjà reçu pour ce job"}), 409
+
+    total = request.content_length
+    if not await asyncio.get_running_loop().run_in_executor(
+            downloader, admit, total or 0, os.path.dirname(feed.path)):
+        feed.abort(QUOTA_EXCEEDED)
+        return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 507
+
+    def on_chunk(received):
+        if feed.mode == 'spool' and total:
+            job.update(percent=f"{received * 100 / total:.1f}%", step="Réception du fichier... 📤")
+
+    try:
+        await feed.receive(request.body, total, on_chunk)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    finally:
+        metrics.BYTES.inc(feed.received, direction='uploaded')
+    return jsonify({"success": True, "received": feed.received, "sha256": feed.digest.hexdigest()})
+
+async def run_job(job, source, ranges, workdir):
+    """run_job (app.py) en asyncio : yt-dlp dans le pool `downloader`, ffmpeg en sous-process."""
+    job.update(state='running')
+    first = min(r[2] for r in ranges)
+    last  = max(r[3] for r in ranges)
+    output = source.get('output', media.DEFAULT_OUTPUT)
+    spec = media.OUTPUT_FORMATS[output[0]]
+    feed, ffmpeg_kwargs = None, {}
+    loop = asyncio.get_running_loop()
+    try:
+        info, offset = {}, 0
+        if source['mode'] == 'youtube':
+            async with job_slot_async(job, 'io'):
+                job.update(step="Récupération du lien et du timing...")
+                input_file, info, offset = await loop.run_in_executor(downloader, partial(
+                    download_audio, source['url'], workdir, first, last,
+                    [make_progress_hook(job)], FFMPEG_DIR,
+                    on_status=lambda text: job.update(step=text),
+                    cache=source_cache,
+                    info_cache=info_cache,
+                    pool=ydl_pool,
+                ))
+            await off_loop(work_area.settle, workdir)
+            base_name = clean_title(info.get('title', 'video'))
+        elif source['mode'] == 'stream':
+            feed = source['ingest']
+            input_file = await wait_ingest(job, feed)
+            if feed.mode == 'pipe':
+                ffmpeg_kwargs = {'stdin': asyncio.subprocess.PIPE, 'on_start': feed.attach}
+            base_name = source['name']
+        else:
+            input_file = source['input_file']
+            job.update(step="Fichier déjà reçu, repris du cache ♻️" if source.get('stored')
+                       else "Fichier uploadé avec succès")
+            base_name = source['name']
+
+        meta = media.metadata_from_info(info)
+        if feed and feed.mode == 'pipe':
+            meta['codec'] = feed.ext if feed.ext in ('mp3', 'aac') else None
+        elif not meta['duration']:
+            job.update(step="Analyse du média... 🔎")
+            meta = await media.probe_media_async(input_file, FFPROBE_PATH)
+            check_range(meta['duration'], first, last)
+        source_codec = meta['codec']
+
+        deferred = (len(ranges) == 1 and source['delivery'] == 'stream' and spec['streamable']
+                    and not (feed and feed.mode == 'pipe'))
+        # Un slot 'cpu' de l'ordonnanceur du calage à la fin de la coupe (cf. app.run_job)
+        async with (job_slot_async(job, 'cpu') if source.get('snap') or not deferred
+                    else contextlib.nullcontext()):
+            if source.get('snap') and not (feed and feed.mode == 'pipe'):
+                # Quelques décodages courts, bloquants : dans le pool `downloader`
+                job.update(step="Calage des bornes sur les silences... 🔇")
+                snapped = await loop.run_in_executor(downloader, partial(
+                    silence.snap_ranges, input_file, ranges, FFMPEG_PATH, offset))
+                job.update(snapped=[[start, end] for start, end, _, _ in snapped])
+                if source['snap'] == 'apply':
+                    ranges = snapped
+
+            if deferred:
+                start, end, start_time, end_time = ranges[0]
+                job.update(result_path=workdir,
+                           pending_cut=(input_file, start_time - offset, end_time - offset, source_codec, output))
+                output_filename = f"{base_name}_{start}-{end}.{spec['ext']}"
+            elif len(ranges) == 1:
+                start, end, start_time, end_time = ranges[0]
+                job.update(step="Découpage de l'extrait... ✂️", percent='0%')
+                temp_audio_path = await off_loop(work_area.mkstemp, suffix='.' + spec['ext'])
+                job.update(result_path=temp_audio_path)
+
+                reached = [start_time]
+                on_progress = make_ffmpeg_progress(job)
+
+                def track(p):
+                    if p['out_time'] is not None:
+                        reached[0] = start_time + p['out_time']
+                    on_progress(p)
+
+                try:
+                    await ffmpeg_cut(input_file, start_time - offset, end_time - offset, temp_audio_path,
+                                     source_codec, track, output, **ffmpeg_kwargs)
+                except media.FFmpegError:
+                    if feed:
+                        check_ingest(feed, start_time, end_time, reached[0])
+                    raise
+                if feed:
+                    check_ingest(feed, start_time, end_time,
+                                 start_time + await output_seconds_async(temp_audio_path))
+                output_filename = f"{base_name}_{start}-{end}.{spec['ext']}"
+            else:
+                job.update(step=f"Découpage de {len(ranges)} extraits... ✂️", percent='0%')
+                clips_dir = await off_loop(work_area.mkdtemp, prefix="clips_")
+                job.update(result_path=clips_dir)
+
+                clips, names = [], []
+                for i, (start, end, start_time, end_time) in enumerate(ranges, 1):
+                    name = f"{i:02d}_{base_name}_{start}-{end}.{spec['ext']}".replace(":", "-")
+                    clips.append((start_time - offset, end_time - offset, os.path.join(clips_dir, name)))
+                    names.append(name)
+                await ffmpeg_cut_many(input_file, clips, source_codec, make_ffmpeg_progress(job), output,
+                                      **ffmpeg_kwargs)
+                if feed:
+                    check_ingest(feed, first, last)
+                    for start_time, end_time, out in clips:
+                        check_ingest(feed, start_time, end_time, start_time + await output_seconds_async(out))
+                job.update(clips=[(name, out) for name, (_, _, out) in zip(names, clips)])
+                output_filename = f"{base_name}_extraits.zip"
+
+        await off_loop(work_area.settle, job.result_path)
+        job.update(state='done', step="Terminé ✅", percent='done', speed=None, eta=None,
+                   filename=output_filename)
+
+    except Exception as e:
+        await off_loop(remove_result, job.result_path)
+        metrics.count_error(e)
+        job.update(state='error', step=f"Erreur : {str(e)}", error=str(e), result_path=None)
+    finally:
+        if feed:
+            feed.close()
+        job.update(ingest=None)
+        if job.result_path != workdir:
+            await off_loop(work_area.remove, workdir)
+
+async def wait_ingest(job, feed):
+    """wait_ingest (app.py) en asyncio. Retourne l'entrée ffmpeg ('pipe:0' ou le fichier)."""
+    try:
+        await asyncio.wait_for(feed.ready.wait(), INGEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise Exception("Aucun fichier reçu")
+    if feed.error:
+        raise Exception(feed.error)
+    if feed.mode == 'pipe':
+        job.update(step="Découpage pendant la réception du fichier... ✂️")
+        return 'pipe:0'
+
+    received = -1
+    while not feed.complete.is_set():
+        try:
+            await asyncio.wait_for(feed.complete.wait(), INGEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            if feed.received == received:
+                raise Exception("Envoi interrompu : plus de données reçues")
+            received = feed.received
+    if feed.error:
+        raise Exception(feed.error)
+    job.update(step="Fichier uploadé avec succès")
+    return feed.path
+
+@app.route('/download/<job_id>')
+async def download(job_id):
+    job = get_job(job_id)
+    if job is not None and job.items is not None and job.state != 'error':
+        # Lot : ZIP envoyé au fil des vidéos terminées (attente dans un thread)
+        download_name = request.args.get('filename', 'lot_extraits.zip')
+        headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+        response = Response(metrics.metered_async(run_sync_iterable(stream_bulk_zip(job))),
+                            mimetype='application/zip', headers=headers)
+        response.timeout = None
+        return response
+    if job is None or job.state != 'done':
+        return "Fichier introuvable", 404
+
+    # Un seul envoi, sauf résultat partagé (flights.py)
+    path, shared, cut = job.take_result()
+    download_name = request.args.get('filename', job.filename or 'extrait_audio.mp3')
+    headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+
+    if path and cut:
+        input_file, start_time, end_time, source_codec, output = cut
+
+        cmd = media.build_cut_command(FFMPEG_PATH, input_file, start_time, end_time, 'pipe:1', source_codec,
+                                      output)
+        metrics.count_cuts(output, source_codec)
+        chunks = stream_cut(cmd)
+        try:
+            head = await anext(chunks, b'')
+        except media.FFmpegError as e:
+            await off_loop(remove_result, path)
+            return str(e), 500
+
+        async def generate():
+            try:
+                yield head
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+                downloader.submit(remove_result, path)
+
+        response = Response(metrics.metered_async(generate()), mimetype=media.OUTPUT_FORMATS[output[0]]['mime'],
+                            headers=headers)
+        response.timeout = None
+        return response
+
+    if path and job.clips and os.path.isdir(path):
+
+        async def generate():
+            try:
+                async for chunk in run_sync_iterable(stream_zip(job.clips)):
+                    yield chunk
+            finally:
+                if not shared:
+                    downloader.submit(remove_result, path)
+
+        response = Response(metrics.metered_async(generate()), mimetype='application/zip', headers=headers)
+        response.timeout = None
+        return response
+
+    if path and os.path.exists(path):
+        headers['Content-Length'] = str(os.path.getsize(path))
+
+        async def generate():
+            try:
+                async for chunk in read_file(path):
+                    yield chunk
+            finally:
+                if not shared:
+                    downloader.submit(remove_result, path)
+
+        response = Response(metrics.metered_async(generate()), mimetype=media.mime_of(path), headers=headers)
+        response.timeout = None
+        return response
+
+    return "Fichier introuvable", 404
+
+@app.route('/download/<job_id>/<int:index>')
+async def download_item(job_id, index):
+    job = get_job(job_id)
+    items = job.items if job else None
+    if not items or index >= len(items) or items[index]['state'] != 'done':
+        return "Fichier introuvable", 404
+    files = items[index]['files']
+    if len(files) > 1:
+        name = os.path.splitext(files[0][0])[0].rsplit('_', 1)[0] + "_extraits.zip"
+        chunks = run_sync_iterable(stream_zip(files))
+    else:
+        name = files[0][0]
+        chunks = read_file(files[0][1])
+    headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(name)}"}
+    response = Response(metrics.metered_async(chunks),
+                        mimetype='application/zip' if len(files) > 1 else media.mime_of(name), headers=headers)
+    response.timeout = None
+    return response
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,341 @@
+"""
+Banc d'essai hors ligne du pipeline d'extraction, par les routes HTTP de app.py.
+
+    python benchmark.py [--lengths 60,600] [--containers mp3,m4a,wav,mkv] [--clip 30]
+                        [--repeat 3] [--output bench.json] [--baseline ancien.json]
+
+Les sources sont synthétiques (ffmpeg lavfi : sinusoïde + bruit rose), générées une fois dans
+--sources puis réutilisées. Le mode YouTube passe par l'extracteur générique de yt-dlp et un
+serveur HTTP local (avec requêtes Range) : aucun accès réseau. Chaque job suit le chemin de la
+page, via le client de test Flask : POST /extract, puis pour un upload envoi du fichier en flux
+(PUT /ingest), attente de la fin du job et GET /download. Le temps mesuré va de /extract à la
+fin du job ; les durées par étape viennent de l'histogramme des étapes de /metrics. Le JSON
+produit a toujours la même structure (cas triés, médianes) pour être comparé d'une exécution à
+l'autre avec --baseline.
+
+Chaque répétition part à froid : les caches de l'app (sources, métadonnées yt-dlp, sondes
+ffprobe, instances yt-dlp) sont vidés avant chaque job. Caches, espace de travail et slots de
+l'ordonnanceur sont placés dans un dossier temporaire propre à l'exécution : un serveur lancé
+sur la même machine n'est ni lu ni ralenti (quota, slots). Un premier job non mesuré par cas
+(--warmup) absorbe les coûts propres au process (import de yt-dlp, cache disque du système).
+"""
+import argparse
+import atexit
+import contextlib
+import functools
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Fixés avant d'importer app, qui crée caches, espace de travail et ordonnanceur à l'import
+RUN_DIR = tempfile.mkdtemp(prefix="import_audio_bench_run_")
+os.environ['SOURCE_CACHE_DIR'] = os.path.join(RUN_DIR, 'cache')
+os.environ['WORK_DIR'] = os.path.join(RUN_DIR, 'work')
+os.environ['SLOTS_DIR'] = os.path.join(RUN_DIR, 'slots')
+os.environ['YTDLP_WARMUP'] = '0'  # préchargement remplacé par --warmup
+atexit.register(shutil.rmtree, RUN_DIR, True)
+
+import app  # noqa: E402
+import media  # noqa: E402
+import metrics  # noqa: E402
+import service  # noqa: E402
+
+DEFAULT_SOURCES_DIR = os.path.join(tempfile.gettempdir(), "import_audio_bench")
+# Sortie de yt-dlp masquée ; gardé ouvert car les instances YoutubeDL du pool la conservent
+_DEVNULL = open(os.devnull, 'w')
+
+# Conteneur -> options d'encodage de la source synthétique
+CONTAINERS = {
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '128k'],
+    'm4a': ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'mkv': ['-c:a', 'libopus', '-b:a', '96k'],
+}
+
+
+def generate_source(directory, length, container):
+    """Crée (si absent) `synth_<durée>s.<conteneur>` et retourne son chemin."""
+    path = os.path.join(directory, f"synth_{length}s.{container}")
+    if os.path.exists(path):
+        return path
+    tmp = f"{path}.part.{container}"
+    cmd = [
+        service.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={length}",
+        '-f', 'lavfi', '-i', f"anoisesrc=color=pink:amplitude=0.05:sample_rate=44100:duration={length}",
+        '-filter_complex', 'amix=inputs=2:duration=shortest,aformat=channel_layouts=stereo',
+        *CONTAINERS[container], tmp,
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(tmp, path)
+    return path
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Fichiers statiques avec prise en charge de `Range: bytes=a-b` (lecture partielle par ffmpeg)."""
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        return _Limited(f, end - start + 1)
+
+
+class _Limited:
+    """Fichier lu au plus `remaining` octets (copyfile de SimpleHTTPRequestHandler)."""
+    def __init__(self, f, remaining):
+        self.f = f
+        self.remaining = remaining
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # yt-dlp et ffmpeg ferment la connexion dès qu'ils ont lu ce qu'il leur faut
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(directory):
+    """Démarre le serveur HTTP local. Retourne (serveur, URL de base)."""
+    server = _Server(('127.0.0.1', 0), functools.partial(RangeHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def cold_caches():
+    """Vide les caches de l'app (dossier RUN_DIR) : le job suivant part à froid."""
+    for cache in (service.source_cache, service.info_cache):
+        if cache is not None:
+            cache.clear()
+    media.clear_probe_cache()
+    service.ydl_pool.close()
+
+
+def stage_sums():
+    """Secondes cumulées par étape depuis le lancement (histogramme de /metrics)."""
+    return {labels[0]: total for labels, total in metrics.STAGE_SECONDS.sums().items()}
+
+
+def run_once(source, start, end, verbose=False, snap=False, output=('mp3', None)):
+    """
+    Exécute un job complet par les routes de l'app, caches vidés. Retourne
+    {'total', 'stages', 'output_bytes'} ou lève l'erreur du job.
+    """
+    cold_caches()
+    fmt = lambda s: f"{int(s // 60)}:{int(s % 60):02d}"
+    form = {'mode': source['mode'], 'start': fmt(start), 'end': fmt(end), 'delivery': 'file',
+            'format': output[0], 'bitrate': output[1] or ''}
+    if snap:
+        form['snap'] = '1'
+    if source['mode'] == 'youtube':
+        form['url'] = source['url']
+    else:
+        # Comme la page : job créé sans le fichier, envoyé ensuite en flux
+        form.update(stream='1', filename=os.path.basename(source['path']))
+    client = app.app.test_client()
+
+    before = stage_sums()
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(_DEVNULL))
+        reply = client.post('/extract', data=form).get_json()
+        if not reply['success']:
+            raise RuntimeError(reply['error'])
+        job = service.get_job(reply['job_id'])
+        if source['mode'] == 'upload':
+            with open(source['path'], 'rb') as f:
+                client.put(f"/ingest/{job.id}", input_stream=f, headers={
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Length': str(os.path.getsize(source['path']))})
+        version = 0
+        while job.state in ('queued', 'running'):
+            _, version = job.wait_change(version, 1)
+    total = time.perf_counter() - started
+    after = stage_sums()
+    stages = {name: seconds - before.get(name, 0.0) for name, seconds in after.items()
+              if seconds > before.get(name, 0.0)}
+
+    if job.state != 'done':
+        raise RuntimeError(job.error)
+    # Téléchargement du résultat, hors mesure : le supprime de l'espace de travail
+    response = client.get(f"/download/{job.id}")
+    output_bytes = len(response.get_data())
+    response.close()
+    return {'total': total, 'stages': stages, 'output_bytes': output_bytes}
+
+
+def summarize(runs, clip, source_bytes):
+    """Médiane (et extrêmes) des répétitions d'un cas."""
+    totals = [r['total'] for r in runs]
+    names = sorted({name for r in runs for name in r['stages']})
+    median = statistics.median(totals)
+    return {
+        'runs': len(runs),
+        'total_s': {'median': median, 'min': min(totals), 'max': max(totals)},
+        'stages_s': {name: statistics.median(r['stages'].get(name, 0.0) for r in runs) for name in names},
+        # Secondes d'audio extraites par seconde, et débit de lecture de la source
+        'audio_x_realtime': clip / median,
+        'source_mb_per_s': source_bytes / 1e6 / median,
+        'output_bytes': runs[-1]['output_bytes'],
+    }
+
+
+# Démarrage à froid : modules importés par un process neuf
+STARTUP_TARGETS = ('app', 'version_tkinter', 'yt_dlp')
+
+
+def measure_startup(repeat):
+    """Durée médiane de `python -c "import <module>"` (process complet, sans préchargement de yt-dlp)."""
+    env = {**os.environ, 'YTDLP_WARMUP': '0'}
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for target in STARTUP_TARGETS:
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            done = subprocess.run([sys.executable, '-c', f"import {target}"], cwd=here, env=env,
+                                  capture_output=True)
+            durations.append(time.perf_counter() - started)
+        if done.returncode == 0:  # tkinter absent, par exemple
+            results[target] = statistics.median(durations)
+    return results
+
+
+def environment():
+    import yt_dlp
+    ffmpeg_version = subprocess.run([service.FFMPEG_PATH, '-version'], capture_output=True,
+                                    text=True).stdout.split('\n', 1)[0]
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version,
+        'yt_dlp': yt_dlp.version.__version__,
+    }
+
+
+def compare(results, baseline):
+    """Affiche l'écart de la médiane totale par rapport à un résultat précédent."""
+    previous = {case['name']: case for case in baseline['cases']}
+    for case in results['cases']:
+        old = previous.get(case['name'])
+        if old:
+            before, after = old['total_s']['median'], case['total_s']['median']
+            print(f"{case['name']:<24} {before:8.3f}s -> {after:8.3f}s  ({(after / before - 1) * 100:+.1f}%)")
+    for target, after in results['startup_s'].items():
+        before = baseline.get('startup_s', {}).get(target)
+        if before:
+            print(f"{'import ' + target:<24} {before:8.3f}s -> {after:8.3f}s  ({(after / before - 1) * 100:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne de l'extraction audio")
+    parser.add_argument('--lengths', default='60,600', help="durées des sources (secondes)")
+    parser.add_argument('--containers', default=','.join(CONTAINERS), help="conteneurs des sources")
+    parser.add_argument('--modes', default='upload,youtube')
+    parser.add_argument('--clip', type=float, default=30, help="durée de l'extrait (secondes)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1, help="jobs non mesurés avant chaque cas")
+    parser.add_argument('--sources', default=DEFAULT_SOURCES_DIR, help="dossier des sources générées")
+    parser.add_argument('--output', help="fichier JSON des résultats (sinon sortie standard)")
+    parser.add_argument('--baseline', help="résultats précédents à comparer")
+    parser.add_argument('--verbose', action='store_true', help="affiche la sortie de yt-dlp")
+    parser.add_argument('--no-startup', action='store_true', help="ne mesure pas le démarrage à froid")
+    parser.add_argument('--snap', action='store_true', help="cale les bornes sur les silences (étape 'snap')")
+    parser.add_argument('--format', default='mp3', choices=sorted(media.OUTPUT_FORMATS),
+                        help="format de sortie (copie du flux si la source est déjà dans ce codec)")
+    parser.add_argument('--bitrate', help="débit imposé (ré-encodage systématique), ex. 192k")
+    args = parser.parse_args(argv)
+
+    lengths = [int(x) for x in args.lengths.split(',')]
+    containers = args.containers.split(',')
+    modes = args.modes.split(',')
+    os.makedirs(args.sources, exist_ok=True)
+    server, base_url = serve(args.sources)
+
+    cases = []
+    try:
+        for length in lengths:
+            clip = min(args.clip, length / 2)
+            start = (length - clip) / 2  # extrait au milieu : oblige à chercher dans la source
+            for container in containers:
+                path = generate_source(args.sources, length, container)
+                source_bytes = os.path.getsize(path)
+                for mode in modes:
+                    if mode == 'youtube':
+                        source = {'mode': 'youtube', 'url': f"{base_url}/{os.path.basename(path)}"}
+                    else:
+                        source = {'mode': 'upload', 'path': path}
+                    runs = [run_once(dict(source), start, start + clip, args.verbose, args.snap,
+                                     (args.format, args.bitrate))
+                            for _ in range(args.warmup + args.repeat)][args.warmup:]
+                    case = {'name': f"{mode}/{container}/{length}s", 'mode': mode,
+                            'container': container, 'length_s': length, 'clip_s': clip,
+                            'source_bytes': source_bytes, **summarize(runs, clip, source_bytes)}
+                    cases.append(case)
+                    print(f"{case['name']:<24} {case['total_s']['median']:8.3f}s  "
+                          f"x{case['audio_x_realtime']:.1f}", file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    results = {
+        'environment': environment(),
+        'parameters': {'lengths': lengths, 'containers': containers, 'modes': modes,
+                       'clip_s': args.clip, 'repeat': args.repeat, 'warmup': args.warmup, 'snap': args.snap,
+                       'format': args.format, 'bitrate': args.bitrate},
+        'cases': sorted(cases, key=lambda c: c['name']),
+        'startup_s': {} if args.no_startup else measure_startup(args.repeat),
+    }
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
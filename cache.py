@@ -0,0 +1,357 @@
+"""
+Caches disque partagés entre app.py et version_tkinter.py.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "import_audio_cache")
+
+
+def safe_key(key):
+    """Clé utilisable comme nom de fichier."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', key)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Autre système de fichiers ou liens non supportés
+        shutil.copyfile(src, dst)
+
+
+class KeyLocks:
+    """
+    Verrous par clé. Une entrée n'existe que tant qu'un thread tient ou attend son
+    verrou : la table ne grandit pas avec le nombre de clés vues.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # clé -> [verrou, nombre de threads qui le tiennent ou l'attendent]
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class SourceCache:
+    """
+    Cache LRU des sources téléchargées, borné en octets.
+
+    Une entrée = le fichier audio `<clé>.<ext>` + ses métadonnées `<clé>.json`
+    (titre, durée, codec). Les deux sont publiés par renommage atomique, les
+    métadonnées en dernier : une entrée n'est valide que si son .json existe, ce qui
+    permet à plusieurs process de partager le même dossier. Les lectures se font
+    par lien dur vers le dossier du job : une éviction ne casse jamais une découpe
+    en cours. L'ordre LRU suit la date de modification, rafraîchie à chaque accès.
+    """
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=2 * 1024**3, max_duration=1800):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration  # au-delà, une source n'est pas mise en cache
+        self._lock = threading.Lock()
+        self._key_locks = KeyLocks()
+        self.hits = 0    # sources reprises du cache (cf. count)
+        self.misses = 0  # sources à télécharger
+        os.makedirs(root, exist_ok=True)
+
+    def key_lock(self, key):
+        """Verrou par clé : un seul téléchargement d'une même source à la fois."""
+        return self._key_locks.hold(key)
+
+    def count(self, hit):
+        """Comptabilise une demande de source (une par extraction, quel que soit le nombre de fetch)."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def accepts(self, duration):
+        return bool(duration) and duration <= self.max_duration
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, safe_key(key) + ".json")
+
+    def fetch(self, key, dest_dir):
+        """Place la source en cache dans `dest_dir`. Retourne (chemin, métadonnées) ou None."""
+        meta_path = self._meta_path(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            data_path = os.path.join(self.root, meta['file'])
+            dest = os.path.join(dest_dir, "source" + os.path.splitext(meta['file'])[1])
+            _link_or_copy(data_path, dest)
+            now = time.time()
+            os.utime(data_path, (now, now))
+            os.utime(meta_path, (now, now))
+        except (OSError, ValueError, KeyError):
+            return None
+        return dest, meta
+
+    def meta(self, key):
+        """Métadonnées d'une entrée valide (sans la placer ni rafraîchir son accès), ou None."""
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+            if os.path.exists(os.path.join(self.root, meta['file'])):
+                return meta
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def put(self, key, path, meta):
+        """
+        Ajoute `path` (laissé en place) au cache puis applique la limite de taille. Le
+        fichier d'une entrée précédente d'une autre extension est supprimé.
+        """
+        name = safe_key(key) + os.path.splitext(path)[1]
+        previous = self.meta(key)
+        tmp_data = os.path.join(self.root, f".{uuid.uuid4().hex}.part")
+        _link_or_copy(path, tmp_data)
+        os.replace(tmp_data, os.path.join(self.root, name))
+
+        tmp_meta = os.path.join(self.root, f".{uuid.uuid4().hex}.part")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({**meta, 'file': name}, f)
+        os.replace(tmp_meta, self._meta_path(key))
+        if previous and previous['file'] != name:
+            try:
+                os.remove(os.path.join(self.root, previous['file']))
+            except OSError:
+                pass
+        self.evict()
+
+    def entries(self):
+        """[(dernier accès, taille, chemin .json, chemin données)] des entrées valides."""
+        result = []
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    data_path = os.path.join(self.root, json.load(f)['file'])
+                st = os.stat(data_path)
+            except (OSError, ValueError, KeyError):
+                continue
+            result.append((st.st_mtime, st.st_size, entry.path, data_path))
+        return result
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes."""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, meta_path, data_path in entries:
+                if total <= self.max_bytes:
+                    break
+                # Métadonnées d'abord : l'entrée devient invisible avant de disparaître
+                for p in (meta_path, data_path):
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+                total -= size
+
+    def clear(self):
+        """Supprime toutes les entrées (ex. banc d'essai : chaque répétition part à froid)."""
+        with self._lock:
+            for entry in os.scandir(self.root):
+                if entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+
+class InfoCache:
+    """
+    Cache à durée de vie (TTL) des métadonnées yt-dlp : titre, durée, formats.
+
+    En mémoire (LRU borné) et, si `root` est fourni, sur disque pour survivre aux
+    redémarrages et être partagé entre process. Le TTL doit rester inférieur à la
+    durée de validité des URLs de formats (quelques heures chez YouTube).
+    """
+    def __init__(self, root=None, ttl=1800, max_items=256):
+        self.root = root
+        self.ttl = ttl
+        self.max_items = max_items
+        self._mem = OrderedDict()  # clé -> (expiration, info)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self._sweep()
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        info = self._lookup(key)
+        with self._lock:
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return info
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item and item[0] > now:
+                self._mem.move_to_end(key)
+                return item[1]
+            self._mem.pop(key, None)
+        if not self.root:
+            return None
+        path = self._path(key)
+        try:
+            expires = os.stat(path).st_mtime + self.ttl
+            if expires <= now:
+                return None
+            with open(path, encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, info, expires)
+        return info
+
+    def put(self, key, info):
+        self._remember(key, info, time.time() + self.ttl)
+        if self.root:
+            tmp = os.path.join(self.root, f".{uuid.uuid4().hex}.part")
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(info, f)
+                os.replace(tmp, self._path(key))
+            except (OSError, TypeError, ValueError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._mem.pop(key, None)
+        if self.root:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Oublie toutes les métadonnées, en mémoire et sur disque."""
+        with self._lock:
+            self._mem.clear()
+        if self.root:
+            for entry in os.scandir(self.root):
+                if entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def _remember(self, key, info, expires):
+        with self._lock:
+            self._mem[key] = (expires, info)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    def _sweep(self):
+        """Supprime les fichiers expirés (ou orphelins) du dossier."""
+        now = time.time()
+        for entry in os.scandir(self.root):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class PeaksCache:
+    """
+    Cache disque des formes d'onde (waveform.py) : un petit fichier .npy par source,
+    nommé d'après le hash de sa clé (id vidéo ou identité du fichier local). Borné en
+    nombre d'entrées, les moins récemment lues (mtime) partent en premier.
+    """
+    def __init__(self, root, max_items=500):
+        self.root = root
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._key_locks = KeyLocks()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    def key_lock(self, key):
+        """Verrou par clé : une seule analyse d'une même source à la fois."""
+        return self._key_locks.hold(key)
+
+    def get(self, key, count=True):
+        """Contenu en cache (octets) ou None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            data = None
+        if count:
+            with self._lock:
+                if data is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return data
+
+    def put(self, key, data):
+        tmp = os.path.join(self.root, f".{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.root):
+                try:
+                    if entry.name.endswith(".npy"):
+                        entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+            entries.sort()
+            for _, path in entries[:max(0, len(entries) - self.max_items)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,85 @@
+"""
+Regroupement des extractions identiques (single-flight), partagé par app.py et asgi_app.py.
+
+Un lien partagé dans une discussion amène des dizaines de /extract identiques (même vidéo,
+mêmes plages, même sortie) en quelques secondes. Le premier lance le job ; les suivants
+reçoivent son identifiant tant qu'il tourne, et suivent donc la même progression et
+téléchargent le même résultat. Un job réussi reste attribué à sa clé `ttl` secondes pour
+les retardataires, tant que son résultat n'a pas été remis. Dès qu'une seconde requête
+rejoint un job (job.share), son résultat est conservé après /download, compté dans le
+quota de l'espace de travail comme tout résultat terminé, et supprimé avec le job
+(JOB_TTL). Un job en erreur n'est jamais repris.
+"""
+import threading
+import time
+
+
+def request_key(source_id, ranges, output, snap):
+    """
+    Clé d'une requête : source (youtube.source_key, uploads.key...), plages en secondes,
+    (format, débit) de sortie et calage (service.snap_mode). None si `source_id` l'est
+    (requête non partagée).
+    """
+    if not source_id:
+        return None
+    spans = ",".join(f"{start_time:g}-{end_time:g}" for _, _, start_time, end_time in ranges)
+    fmt, bitrate = output
+    return f"{source_id}|{spans}|{fmt}-{bitrate or 'auto'}|{snap or 'exact'}"
+
+
+class Flights:
+    """Jobs en cours ou récemment réussis, par clé de requête (cf. request_key)."""
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.RLock()  # create() de join() peut purger (prune)
+        self._jobs = {}  # clé -> job
+        self.hits = 0    # requêtes rattachées à un job existant
+        self.misses = 0  # jobs lancés pour une clé
+
+    def find(self, key):
+        """Job vivant pour `key`, ou None (à vérifier avant d'engager des ressources)."""
+        if key is None or self.ttl <= 0:
+            return None
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and self.alive(job) and job.share():
+                self.hits += 1
+                return job
+        return None
+
+    def join(self, key, create):
+        """
+        (job, True) si un job vivant existe pour `key` (il est alors partagé), sinon
+        (create(), False), le nouveau job étant enregistré sous `key` quand le partage est
+        possible.
+        """
+        if key is None or self.ttl <= 0:
+            return create(), False
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and self.alive(job) and job.share():
+                self.hits += 1
+                return job, True
+            self.misses += 1
+            job = create()
+            self._jobs[key] = job
+            return job, False
+
+    def alive(self, job, now=None):
+        """True si `job` peut encore être rejoint : en cours, ou réussi depuis moins de ttl."""
+        if job.state in ('queued', 'running'):
+            return True
+        now = time.time() if now is None else now
+        return (job.state == 'done' and job.result_path is not None
+                and job.finished is not None and now - job.finished < self.ttl)
+
+    def prune(self):
+        """Oublie les clés dont le job ne peut plus être rejoint."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, job in self._jobs.items() if not self.alive(job, now)]:
+                del self._jobs[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
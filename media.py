@@ -0,0 +1,464 @@
+"""
+Opérations ffmpeg/ffprobe partagées entre app.py et version_tkinter.py.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+
+MP3_BITRATE = "128k"
+
+# Formats de sortie : encodeur ffmpeg, conteneur (-f), type MIME, codecs source recopiés
+# tels quels (coupe sans ré-encodage), débit par défaut. streamable : le conteneur peut
+# s'écrire sur un tube (encodage pendant le téléchargement, cf. delivery=stream).
+OUTPUT_FORMATS = {
+    'mp3':  {'label': "MP3", 'ext': 'mp3', 'encoder': 'libmp3lame', 'muxer': 'mp3',
+             'mime': 'audio/mpeg', 'copy': ('mp3',), 'bitrate': MP3_BITRATE, 'streamable': True},
+    'm4a':  {'label': "AAC (M4A)", 'ext': 'm4a', 'encoder': 'aac', 'muxer': 'ipod',
+             'mime': 'audio/mp4', 'copy': ('aac',), 'bitrate': "128k", 'streamable': False},
+    'opus': {'label': "Opus", 'ext': 'opus', 'encoder': 'libopus', 'muxer': 'ogg',
+             'mime': 'audio/ogg', 'copy': ('opus',), 'bitrate': "96k", 'streamable': True},
+}
+DEFAULT_OUTPUT = ('mp3', None)  # (format, débit imposé ou None)
+BITRATES = ("64k", "96k", "128k", "160k", "192k", "256k", "320k")
+
+_encoders = None
+_encoders_lock = threading.Lock()
+
+# Résultats ffprobe par identité de fichier : une même source n'est analysée qu'une fois
+PROBE_CACHE_SIZE = 256
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+# Statistiques du cache ffprobe (exportées par /metrics)
+probe_stats = {'hits': 0, 'misses': 0}
+
+
+class FFmpegError(RuntimeError):
+    """Échec de ffmpeg ou ffprobe (code retour non nul, sortie vide)."""
+
+
+def normalize_codec(codec):
+    """Ramène un nom de codec yt-dlp ('mp4a.40.2', 'opus'...) ou ffprobe au nom ffprobe."""
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    if codec.startswith('mp4a'):
+        return 'aac'
+    if codec.startswith('mp3') or codec == 'mp3float':
+        return 'mp3'
+    return codec.split('.')[0]
+
+
+def file_identity(path):
+    """
+    Identité d'un fichier sans le lire : (périphérique, inode, taille, mtime en ns).
+    Stable pour un même contenu, y compris à travers les liens durs du cache.
+    """
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def metadata_from_info(info):
+    """
+    {'duration', 'codec', 'bitrate'} tirés des métadonnées yt-dlp, au même format que
+    probe_media. duration vaut None si yt-dlp ne la connaît pas (il faut alors sonder).
+    """
+    abr = info.get('abr')  # kbit/s
+    return {
+        'duration': float(info['duration']) if info.get('duration') else None,
+        'codec': normalize_codec(info.get('acodec')),
+        'bitrate': int(abr * 1000) if abr else None,
+    }
+
+
+def probe_media(input_file, ffprobe="ffprobe"):
+    """
+    Retourne {'duration', 'codec', 'bitrate'} du premier flux audio via ffprobe.
+    Le résultat est mis en cache par identité de fichier (file_identity).
+    """
+    key, cached = _cached_probe(input_file)
+    if cached:
+        return cached
+    try:
+        result = subprocess.run(_probe_command(ffprobe, input_file), capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise FFmpegError(f"ffprobe a échoué: {e.stderr or e.stdout}")
+    return _remember_probe(key, _parse_probe(result.stdout))
+
+
+async def probe_media_async(input_file, ffprobe="ffprobe"):
+    """probe_media sans bloquer la boucle asyncio (même cache)."""
+    key, cached = _cached_probe(input_file)
+    if cached:
+        return cached
+    proc = await asyncio.create_subprocess_exec(
+        *_probe_command(ffprobe, input_file),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise FFmpegError(f"ffprobe a échoué: {(err or out).decode('utf-8', errors='replace')}")
+    return _remember_probe(key, _parse_probe(out))
+
+
+def _cached_probe(input_file):
+    """(clé de cache, résultat en cache ou None)."""
+    try:
+        key = file_identity(input_file)
+    except OSError:
+        return None, None
+    with _probe_lock:
+        if key in _probe_cache:
+            _probe_cache.move_to_end(key)
+            probe_stats['hits'] += 1
+            return key, dict(_probe_cache[key])
+        probe_stats['misses'] += 1
+    return key, None
+
+
+def remember_probe(path, result):
+    """Enregistre une sonde déjà connue de `path` (ex. upload identique déjà analysé)."""
+    try:
+        _remember_probe(file_identity(path), result)
+    except OSError:
+        pass
+
+
+def clear_probe_cache():
+    """Oublie toutes les sondes en cache (ex. banc d'essai : chaque répétition part à froid)."""
+    with _probe_lock:
+        _probe_cache.clear()
+
+
+def _remember_probe(key, result):
+    if key:
+        with _probe_lock:
+            _probe_cache[key] = result
+            while len(_probe_cache) > PROBE_CACHE_SIZE:
+                _probe_cache.popitem(last=False)
+    return dict(result)
+
+
+def _probe_command(ffprobe, input_file):
+    return [
+        ffprobe,
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        input_file
+    ]
+
+
+def _parse_probe(stdout):
+    info = json.loads(stdout)
+    fmt = info.get('format', {})
+    audio = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), {})
+
+    # priorité au format.duration, fallback durée d'un flux
+    duration = fmt.get('duration')
+    if duration is None:
+        duration = next((s['duration'] for s in info.get('streams', []) if 'duration' in s), None)
+    if duration is None:
+        raise ValueError("Durée introuvable")
+
+    bitrate = audio.get('bit_rate') or fmt.get('bit_rate')
+    return {
+        'duration': float(duration),
+        'codec': normalize_codec(audio.get('codec_name')),
+        'bitrate': int(bitrate) if bitrate else None,
+    }
+
+
+def encoders(ffmpeg="ffmpeg"):
+    """Encodeurs audio de ffmpeg (`ffmpeg -encoders`), lus une seule fois par process."""
+    global _encoders
+    with _encoders_lock:
+        if _encoders is None:
+            try:
+                out = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True,
+                                     text=True, check=True).stdout
+                _encoders = {line.split()[1] for line in out.splitlines() if line.startswith(" A")}
+            except (OSError, subprocess.CalledProcessError):
+                _encoders = set()  # ffmpeg introuvable : l'erreur viendra de la découpe
+        return _encoders
+
+
+def available_formats(ffmpeg="ffmpeg"):
+    """Formats de sortie dont l'encodeur est présent (tous si la liste n'a pas pu être lue)."""
+    found = encoders(ffmpeg)
+    return [fmt for fmt, spec in OUTPUT_FORMATS.items() if not found or spec['encoder'] in found]
+
+
+def mime_of(filename):
+    """Type MIME d'un extrait d'après son extension."""
+    ext = os.path.splitext(filename)[1][1:].lower()
+    return next((spec['mime'] for spec in OUTPUT_FORMATS.values() if spec['ext'] == ext),
+                'application/octet-stream')
+
+
+def copies(output, source_codec):
+    """True si la coupe recopie le flux source : même codec que le format, aucun débit imposé."""
+    fmt, bitrate = output
+    return not bitrate and normalize_codec(source_codec) in OUTPUT_FORMATS[fmt]['copy']
+
+
+def codec_args(output, source_codec=None):
+    """Options de codec d'une sortie : copie du flux (cf. copies) ou encodage au débit voulu."""
+    fmt, bitrate = output
+    if copies(output, source_codec):
+        return ["-c:a", "copy"]
+    spec = OUTPUT_FORMATS[fmt]
+    return ["-c:a", spec['encoder'], "-b:a", bitrate or spec['bitrate']]
+
+
+def build_cut_command(ffmpeg, input_file, start_time, end_time, output_path, source_codec=None,
+                      output=DEFAULT_OUTPUT):
+    """
+    Commande ffmpeg qui coupe [start_time, end_time] (secondes) vers `output`
+    (format, débit), MP3 par défaut.
+
+    Un seul encodage depuis le flux natif ; si la source est déjà dans le codec du
+    format, copie directe du flux sans ré-encodage.
+    """
+    # -ss avant -i pour seek rapide; -to est relatif au début. Sur un tube, aucun saut
+    # possible (un MKV tenterait de suivre ses Cues et lirait des blocs au hasard) :
+    # -ss/-to en options de sortie, l'entrée est lue depuis le début.
+    seek = ["-ss", str(start_time), "-to", str(end_time)]
+    piped = input_file == "pipe:0"
+    cmd = [
+        ffmpeg,
+        "-hide_banner",
+        "-v", "error",
+        *([] if piped else seek),
+        "-i", input_file,
+        "-vn",
+    ]
+    if piped:
+        cmd += seek
+    elif copies(output, source_codec):
+        # -ss 0 en sortie : écarte les paquets antérieurs au début demandé, que la copie
+        # garderait sinon avec un horodatage négatif (Ogg ne sait pas les ignorer)
+        cmd += ["-ss", "0"]
+    cmd += codec_args(output, source_codec)
+    if output_path == "pipe:1":
+        cmd += ["-f", OUTPUT_FORMATS[output[0]]['muxer']]  # pas d'extension pour deviner le format
+    cmd += ["-y", output_path]
+    return cmd
+
+
+def build_multi_cut_command(ffmpeg, input_file, clips, source_codec=None, output=DEFAULT_OUTPUT):
+    """
+    Commande ffmpeg unique produisant plusieurs extraits au format `output` (MP3 par défaut).
+
+    `clips` = [(début, fin, chemin de sortie)] en secondes. La source est lue une
+    seule fois à partir du plus petit début ; chaque sortie garde sa plage
+    (-ss / -to en options de sortie) à partir des trames décodées une seule fois.
+    """
+    cmd = [ffmpeg, "-hide_banner", "-v", "error"]
+    if input_file == "pipe:0":
+        base = 0  # tube : pas de saut en entrée (cf. build_cut_command)
+    else:
+        base = min(start for start, _, _ in clips)
+        span = max(end for _, end, _ in clips) - base
+        cmd += ["-ss", str(base), "-t", str(span)]
+    cmd += ["-i", input_file]
+    args = codec_args(output, source_codec)
+    for start, end, output_path in clips:
+        cmd += ["-map", "0:a:0", "-ss", str(start - base), "-to", str(end - base),
+                *args, "-y", output_path]
+    return cmd
+
+
+def build_pcm_command(ffmpeg, input_file, rate, start_time=None, duration=None):
+    """
+    Commande ffmpeg qui décode le premier flux audio en PCM 16 bits mono à `rate` Hz
+    sur sa sortie standard, éventuellement à partir de start_time et pour `duration` s.
+    """
+    cmd = [ffmpeg, "-hide_banner", "-v", "error", "-nostdin"]
+    if start_time:
+        cmd += ["-ss", str(start_time)]
+    if duration is not None:
+        cmd += ["-t", str(duration)]
+    cmd += ["-i", input_file, "-map", "0:a:0", "-ac", "1", "-ar", str(rate),
+            "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"]
+    return cmd
+
+
+def _parse_progress(block, duration):
+    """Bloc clé=valeur de `-progress` -> {'out_time', 'percent', 'speed', 'eta'}."""
+    try:
+        out_time = int(block.get('out_time_us', 'N/A')) / 1e6
+    except ValueError:
+        out_time = None
+    if out_time is not None and out_time < 0:  # pas encore de timestamp (AV_NOPTS_VALUE)
+        out_time = None
+    try:
+        speed = float(block.get('speed', 'N/A').rstrip('x'))
+    except ValueError:
+        speed = None
+
+    percent = eta = None
+    if out_time is not None and duration:
+        percent = max(0.0, min(100.0, out_time / duration * 100))
+        if speed:
+            eta = max(0.0, (duration - out_time) / speed)
+    if block.get('progress') == 'end':
+        percent, eta = 100.0, 0.0
+    return {'out_time': out_time, 'percent': percent, 'speed': speed, 'eta': eta}
+
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, on_start=None, **popen_kwargs):
+    """
+    Lance une commande ffmpeg avec `-progress pipe:1` et appelle on_progress(dict)
+    à chaque rapport (environ deux fois par seconde) : pourcentage de `duration`
+    (secondes de sortie attendues), vitesse (multiple du temps réel) et ETA.
+    on_start(proc) reçoit le process (pour pouvoir l'annuler).
+    Retourne (code retour, stderr).
+    """
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        **popen_kwargs
+    )
+    if on_start:
+        on_start(proc)
+
+    # stderr lu en parallèle pour ne pas bloquer ffmpeg si le tampon se remplit
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)
+    reader.start()
+
+    block = {}
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        block[key] = value
+        if key == "progress":
+            if on_progress:
+                on_progress(_parse_progress(block, duration))
+            block = {}
+
+    proc.wait()
+    reader.join()
+    return proc.returncode, "".join(errors)
+
+
+def stream_ffmpeg(cmd, chunk_size=64 * 1024, full_chunks=False, **popen_kwargs):
+    """
+    Lance une commande ffmpeg qui écrit sur 'pipe:1' et produit sa sortie par blocs,
+    au fil de l'encodage. Lève FFmpegError si ffmpeg échoue ; fermer le générateur
+    (client parti) arrête ffmpeg. Avec full_chunks, chaque bloc (sauf le dernier) fait
+    exactement chunk_size octets : du PCM se découpe alors en trames sans reste.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs)
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        while True:
+            chunk = proc.stdout.read(chunk_size) if full_chunks else proc.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        proc.wait()
+        reader.join()
+        if proc.returncode != 0:
+            raise FFmpegError(f"ffmpeg a échoué: {b''.join(errors).decode('utf-8', errors='replace')}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+
+async def run_ffmpeg_async(cmd, duration=None, on_progress=None, on_start=None, **kwargs):
+    """
+    Équivalent asyncio de run_ffmpeg : même format de progression, retourne
+    (code retour, stderr). on_start(proc) reçoit le process asyncio.
+    """
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **kwargs
+    )
+    if on_start:
+        on_start(proc)
+    errors = asyncio.ensure_future(proc.stderr.read())
+    try:
+        block = {}
+        async for raw in proc.stdout:
+            key, _, value = raw.decode("utf-8", errors="replace").strip().partition("=")
+            block[key] = value
+            if key == "progress":
+                if on_progress:
+                    on_progress(_parse_progress(block, duration))
+                block = {}
+        await proc.wait()
+        return proc.returncode, (await errors).decode("utf-8", errors="replace")
+    finally:
+        if proc.returncode is None:  # tâche annulée : on n'abandonne pas ffmpeg
+            proc.kill()
+            await proc.wait()
+
+
+async def stream_ffmpeg_async(cmd, chunk_size=64 * 1024):
+    """Équivalent asyncio de stream_ffmpeg (générateur asynchrone)."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    errors = asyncio.ensure_future(proc.stderr.read())
+    try:
+        while True:
+            chunk = await proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        await proc.wait()
+        if proc.returncode != 0:
+            raise FFmpegError(f"ffmpeg a échoué: {(await errors).decode('utf-8', errors='replace')}")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        errors.cancel()
+
+# Conteneurs lisibles d'un bout à l'autre sur un tube (stdin), sans retour en arrière
+PIPE_FRIENDLY_EXTENSIONS = {'mp3', 'aac', 'wav', 'mkv'}
+# Conteneurs ISO/MP4 : lisibles sur un tube seulement si l'atome 'moov' précède les données
+MP4_EXTENSIONS = {'mp4', 'm4a'}
+
+
+def mp4_is_streamable(head):
+    """
+    Parcourt les atomes de premier niveau d'un début de fichier MP4.
+    True si 'moov' arrive avant 'mdat' (fichier « faststart »), False sinon,
+    None s'il faut plus d'octets pour conclure.
+    """
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], 'big')
+        kind = head[pos + 4:pos + 8]
+        if kind == b'moov':
+            return True
+        if kind == b'mdat':
+            return False
+        if size == 1:  # taille sur 64 bits
+            if pos + 16 > len(head):
+                return None
+            size = int.from_bytes(head[pos + 8:pos + 16], 'big')
+        if size < 8:  # 0 = jusqu'à la fin du fichier, ou atome invalide
+            return False
+        pos += size
+    return None
@@ -0,0 +1,238 @@
+"""
+Métriques du serveur au format texte Prometheus (sans dépendance), pour /metrics.
+
+Les durées par étape sont déduites des changements d'étape des jobs (Job.update) ;
+les compteurs des caches sont lus sur les caches eux-mêmes au moment de l'export.
+"""
+import threading
+import time
+
+import media
+import startup
+import youtube
+
+try:
+    import resource  # absent sous Windows
+except ImportError:
+    resource = None
+
+# Bornes (secondes) des histogrammes : de l'analyse ffprobe aux longs téléchargements
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Début d'un texte d'étape -> nom d'étape exporté
+STAGES = (
+    ("En attente...", 'queued'),
+    ("Récupération du lien", 'metadata'),
+    ("Source déjà en cache", 'cache_fetch'),
+    ("Téléchargement de la plage", 'download'),
+    ("Téléchargement en cours", 'download'),
+    ("Téléchargement terminé", 'download_finalize'),
+    ("En attente du fichier", 'upload_wait'),
+    ("Réception du fichier", 'upload'),
+    ("Fichier uploadé", 'upload'),
+    ("Analyse du média", 'probe'),
+    ("Calage des bornes", 'snap'),
+    ("Découpage", 'cut'),
+)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [compteurs par borne, somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            counts, total, count = self._series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= b) for c, b in zip(counts, self.buckets)]
+            self._series[key] = (counts, total + value, count + 1)
+
+    def sums(self):
+        """Somme des observations par valeurs d'étiquettes (ex. benchmark.py, par différence)."""
+        with self._lock:
+            return {key: total for key, (_, total, _) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (bound,))} {c}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram('import_audio_stage_seconds', "Durée des étapes d'un job", ('stage',))
+JOB_SECONDS   = Histogram('import_audio_job_seconds', "Durée totale des jobs", ('outcome',))
+BYTES         = Counter('import_audio_bytes_total',
+                        "Octets téléchargés (yt-dlp), reçus (uploads) et envoyés (résultats)",
+                        ('direction',))
+ERRORS        = Counter('import_audio_errors_total', "Erreurs par type", ('type',))
+CUTS          = Counter('import_audio_cuts_total',
+                        "Extraits produits par format de sortie, flux recopié ou ré-encodé",
+                        ('format', 'method'))
+
+
+def stage_of(step):
+    for prefix, stage in STAGES:
+        if step.startswith(prefix):
+            return stage
+    return 'other'
+
+
+def step_changed(previous_step, seconds):
+    """Appelé par Job.update quand l'étape change : durée de l'étape qui se termine."""
+    STAGE_SECONDS.observe(seconds, stage=stage_of(previous_step))
+
+
+def job_finished(outcome, seconds):
+    JOB_SECONDS.observe(seconds, outcome=outcome)
+
+
+def count_cuts(output, source_codec, clips=1):
+    """Extraits d'une découpe (output = (format, débit)), cf. media.copies."""
+    CUTS.inc(clips, format=output[0], method='copy' if media.copies(output, source_codec) else 'encode')
+
+
+def metered(chunks):
+    """Relaie les blocs d'une réponse en comptant les octets envoyés et la durée du transfert."""
+    started = time.monotonic()
+    try:
+        for chunk in chunks:
+            BYTES.inc(len(chunk), direction='sent')
+            yield chunk
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='transfer')
+        chunks.close()  # client parti : libère aussitôt le générateur relayé
+
+
+async def metered_async(chunks):
+    started = time.monotonic()
+    try:
+        async for chunk in chunks:
+            BYTES.inc(len(chunk), direction='sent')
+            yield chunk
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='transfer')
+        await chunks.aclose()
+
+
+def classify_error(exc):
+    """'download' (yt-dlp), 'ffmpeg', 'validation', 'upload' ou 'other'."""
+    if youtube.is_download_error(exc):
+        return 'download'
+    if isinstance(exc, media.FFmpegError):
+        return 'ffmpeg'
+    if isinstance(exc, ValueError):
+        return 'validation'
+    if str(exc).startswith("Envoi interrompu") or str(exc) == "Aucun fichier reçu":
+        return 'upload'
+    return 'other'
+
+
+def count_error(exc_or_type):
+    ERRORS.inc(type=exc_or_type if isinstance(exc_or_type, str) else classify_error(exc_or_type))
+
+
+def _family(name, kind, help_text, samples, labelname=None):
+    """Lignes d'une métrique calculée à l'export : samples = [(valeur d'étiquette, valeur)]."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label, value in samples:
+        lines.append(f"{name}{_labels((labelname,), (label,)) if labelname else ''} {value}")
+    return lines
+
+
+def render(jobs, caches, work=None, slots=None):
+    """
+    Texte d'export complet. `jobs` = liste des jobs connus, `caches` = {nom: objet
+    ayant des attributs hits/misses} (None si le cache est désactivé), `work` =
+    WorkArea.stats() de l'espace de travail, `slots` = Scheduler.stats() de l'ordonnanceur.
+    """
+    states = {'queued': 0, 'running': 0, 'done': 0, 'error': 0}
+    for job in jobs:
+        states[job.state] = states.get(job.state, 0) + 1
+    caches = sorted((name, cache) for name, cache in caches.items() if cache is not None)
+
+    lines = []
+    lines += _family('import_audio_jobs', 'gauge', "Jobs connus par état", sorted(states.items()), 'state')
+    lines += _family('import_audio_jobs_in_flight', 'gauge', "Jobs en attente ou en cours",
+                     [(None, states['queued'] + states['running'])])
+    lines += _family('import_audio_queue_depth', 'gauge', "Jobs en attente d'un worker",
+                     [(None, states['queued'])])
+    lines += _family('import_audio_cache_hits_total', 'counter', "Accès aux caches servis",
+                     [(name, cache.hits) for name, cache in caches], 'cache')
+    lines += _family('import_audio_cache_misses_total', 'counter', "Accès aux caches non servis",
+                     [(name, cache.misses) for name, cache in caches], 'cache')
+    if work:
+        lines += _family('import_audio_work_bytes', 'gauge',
+                         "Espace de travail : octets occupés, dont résultats partagés gardés, et quota (0 = illimité)",
+                         [('used', work['used_bytes']), ('shared', work.get('shared_bytes', 0)),
+                          ('quota', work['quota_bytes'])], 'kind')
+        lines += _family('import_audio_work_entries', 'gauge', "Dossiers et fichiers de l'espace de travail",
+                         [(None, work['entries'])])
+        lines += _family('import_audio_work_swept_total', 'counter', "Entrées orphelines expirées supprimées",
+                         [(None, work['swept'])])
+        lines += _family('import_audio_work_swept_bytes_total', 'counter', "Octets libérés par le nettoyeur",
+                         [(None, work['swept_bytes'])])
+        lines += _family('import_audio_work_admissions_total', 'counter',
+                         "Admission des jobs : acceptés, mis en attente (quota atteint), refusés",
+                         sorted(work['admissions'].items()), 'outcome')
+    if slots:
+        slots = sorted(slots.items())
+        lines += _family('import_audio_slots', 'gauge', "Slots de l'ordonnanceur (cpu : ffmpeg, io : téléchargements)",
+                         [(kind, pool['size']) for kind, pool in slots], 'kind')
+        lines += _family('import_audio_slots_busy', 'gauge', "Slots occupés par ce process",
+                         [(kind, pool['busy']) for kind, pool in slots], 'kind')
+        lines += _family('import_audio_slots_waiting', 'gauge', "Travaux en file devant un slot",
+                         [(kind, pool['waiting']) for kind, pool in slots], 'kind')
+        lines += _family('import_audio_slots_acquired_total', 'counter', "Slots attribués",
+                         [(kind, pool['acquired']) for kind, pool in slots], 'kind')
+    if resource:
+        # Sous-process terminés et attendus (ffmpeg, ffprobe) : temps CPU cumulé
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        lines += _family('import_audio_ffmpeg_cpu_seconds_total', 'counter',
+                         "Temps CPU des sous-process ffmpeg/ffprobe",
+                         [('user', usage.ru_utime), ('system', usage.ru_stime)], 'mode')
+
+    lines += _family('import_audio_startup_seconds', 'gauge',
+                     "Démarrage : temps écoulé à chaque étape, durée des chargements différés",
+                     sorted(startup.timings.items()), 'phase')
+
+    for metric in (STAGE_SECONDS, JOB_SECONDS, BYTES, ERRORS, CUTS):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
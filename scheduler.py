@@ -0,0 +1,206 @@
+"""
+Ordonnancement des travaux lourds des serveurs : process ffmpeg ('cpu') et téléchargements
+yt-dlp ('io'), chaque famille bornée par un nombre de slots.
+
+- Un travail attend son slot dans une file FIFO (pas de dépassement) ; on_wait(position)
+  reçoit sa place dans la file à chaque changement, pour l'afficher au client.
+- Avec `lock_dir`, un slot est aussi un verrou (fcntl.flock) sur l'un des fichiers
+  `<famille>-<n>.lock` du dossier : la limite vaut pour tous les process qui le partagent
+  (workers gunicorn, app.py et asgi_app.py) et le système rend les slots d'un process
+  arrêté. Sans fcntl (Windows), la limite est propre au process.
+- waiting() et retry_after() servent au refus des nouveaux jobs quand la file est pleine
+  (429 + Retry-After) ; stats() est exporté par /metrics.
+"""
+import asyncio
+import contextlib
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl  # absent sous Windows
+except ImportError:
+    fcntl = None
+
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "import_audio_slots")
+POLL = 0.2            # secondes entre deux essais des verrous tenus par d'autres process
+ASYNC_POLL = 0.05     # attente d'une tâche asyncio entre deux essais
+DEFAULT_HOLD = 5.0    # durée d'occupation supposée tant qu'aucun slot n'a été rendu
+
+
+class Slots:
+    """`size` slots d'une famille, attribués dans l'ordre d'arrivée."""
+    def __init__(self, name, size, lock_dir=None):
+        self.name = name
+        self.size = max(1, size)
+        self.lock_paths = ([os.path.join(lock_dir, f"{name}-{i}.lock") for i in range(self.size)]
+                           if lock_dir and fcntl else [])
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._queue = deque()  # tickets en attente, dans l'ordre d'arrivée
+        self._held = {}        # ticket -> (descripteur du verrou ou None, début)
+        self._tickets = 0
+        self.hold = None       # durée moyenne d'occupation (moyenne glissante), secondes
+        self.acquired = 0
+        if self.lock_paths:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @property
+    def busy(self):
+        return len(self._held)
+
+    @property
+    def waiting(self):
+        return len(self._queue)
+
+    # ---- Attribution ----
+    def acquire(self, on_wait=None):
+        """Attend un slot (file FIFO). Retourne le ticket à rendre par release()."""
+        ticket = self._enter()
+        position = None
+        try:
+            with self._lock:
+                while True:
+                    waiting = self._try(ticket)
+                    if not waiting:
+                        return ticket
+                    if on_wait and waiting != position:
+                        position = waiting
+                        on_wait(position)
+                    self._freed.wait(POLL if self.lock_paths else None)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    async def acquire_async(self, on_wait=None):
+        """acquire() pour une tâche asyncio : attente par sondage, sans bloquer la boucle."""
+        ticket = self._enter()
+        position = None
+        try:
+            while True:
+                with self._lock:
+                    waiting = self._try(ticket)
+                if not waiting:
+                    return ticket
+                if on_wait and waiting != position:
+                    position = waiting
+                    on_wait(position)
+                await asyncio.sleep(ASYNC_POLL)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    def release(self, ticket):
+        """Rend le slot de `ticket` (sans effet s'il l'a déjà été)."""
+        with self._lock:
+            held = self._held.pop(ticket, None)
+            if held is None:
+                return
+            fd, started = held
+            if fd is not None:
+                os.close(fd)  # libère le verrou partagé
+            seconds = time.monotonic() - started
+            self.hold = seconds if self.hold is None else 0.8 * self.hold + 0.2 * seconds
+            self._freed.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, on_wait=None):
+        ticket = self.acquire(on_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, on_wait=None):
+        ticket = await self.acquire_async(on_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def _enter(self):
+        with self._lock:
+            self._tickets += 1
+            self._queue.append(self._tickets)
+            return self._tickets
+
+    def _try(self, ticket):
+        """
+        (verrou tenu) Prend un slot si `ticket` est en tête de file et qu'un slot est libre :
+        retourne 0, sinon la position du ticket dans la file (1 = prochain servi).
+        """
+        if self._queue[0] == ticket and len(self._held) < self.size:
+            fd = self._lock_file()
+            if fd is not False:
+                self._queue.popleft()
+                self._held[ticket] = (fd, time.monotonic())
+                self.acquired += 1
+                self._freed.notify_all()  # le suivant passe en tête de file
+                return 0
+        return self._queue.index(ticket) + 1
+
+    def _lock_file(self):
+        """
+        Descripteur d'un fichier de slot verrouillé pour ce process, None sans verrous
+        partagés, False si tous sont tenus (par d'autres process).
+        """
+        if not self.lock_paths:
+            return None
+        for path in self.lock_paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return False
+
+    def _abandon(self, ticket):
+        """Attente interrompue (client parti, annulation) : quitte la file ou rend le slot."""
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._freed.notify_all()
+                return
+        self.release(ticket)
+
+
+class Scheduler:
+    """Slots 'cpu' (process ffmpeg) et 'io' (téléchargements yt-dlp), cf. Slots."""
+    def __init__(self, cpu_slots, io_slots, lock_dir=None):
+        self.pools = {'cpu': Slots('cpu', cpu_slots, lock_dir), 'io': Slots('io', io_slots, lock_dir)}
+
+    def slot(self, kind, on_wait=None):
+        """Contexte qui tient un slot `kind` ('cpu' ou 'io')."""
+        return self.pools[kind].slot(on_wait)
+
+    def slot_async(self, kind, on_wait=None):
+        return self.pools[kind].slot_async(on_wait)
+
+    def acquire(self, kind, on_wait=None):
+        """Slot tenu au-delà d'un bloc (ex. réponse envoyée au fil de l'encodage) : jeton pour release()."""
+        return kind, self.pools[kind].acquire(on_wait)
+
+    async def acquire_async(self, kind, on_wait=None):
+        return kind, await self.pools[kind].acquire_async(on_wait)
+
+    def release(self, token):
+        kind, ticket = token
+        self.pools[kind].release(ticket)
+
+    def waiting(self):
+        """Travaux en file devant un slot, dans ce process."""
+        return sum(pool.waiting for pool in self.pools.values())
+
+    def retry_after(self, depth, limit=300):
+        """Secondes estimées avant qu'une place se libère, `depth` jobs étant déjà en attente."""
+        estimate = max((pool.hold or DEFAULT_HOLD) * (depth + 1) / pool.size for pool in self.pools.values())
+        return max(1, min(limit, math.ceil(estimate)))
+
+    def stats(self):
+        return {kind: {'size': pool.size, 'busy': pool.busy, 'waiting': pool.waiting, 'acquired': pool.acquired}
+                for kind, pool in self.pools.items()}
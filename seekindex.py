@@ -0,0 +1,99 @@
+"""
+Index de recherche des grosses sources vidéo, partagé par app.py, asgi_app.py et version_tkinter.py.
+
+`-ss` avant `-i` demande au démultiplexeur de sauter au point de synchronisation qui
+précède le début. Dans un MKV sans Cues ou un AVI sans idx1, ffmpeg relit pour cela le
+fichier depuis le début ; avec des images clés espacées, il décode en plus des dizaines
+de secondes d'audio avant la plage. Chaque nouvelle coupe repaie ce coût.
+
+L'index est construit une fois, par une seule lecture des paquets (sans décodage) : le
+flux audio est recopié seul dans un Matroska, dont ffmpeg écrit la table de recherche
+(Cues, un point toutes les quelques secondes). Les coupes suivantes lisent cette copie :
+saut direct au bloc qui précède le début, quelques trames décodées puis coupe exacte.
+L'index est rangé dans le cache des sources (cache.SourceCache), sous la clé de la
+source suffixée `-seek`, avec sa sonde ffprobe.
+"""
+import os
+import subprocess
+
+import media
+
+INDEXED_EXTENSIONS = {'mkv', 'avi', 'mp4'}  # conteneurs vidéo ; l'audio seul se parcourt déjà vite
+MIN_BYTES = 64 * 1024**2
+MAX_SHARE = 4  # comme un upload, un index n'occupe jamais plus du quart du cache
+# Statistiques (exportées par /metrics) : sources reprises de leur index, index construits
+stats = {'hits': 0, 'misses': 0}
+
+
+def key(source_key):
+    """Clé de cache de l'index d'une source (clé de la source elle-même : uploads.key...)."""
+    return f"{source_key}-seek"
+
+
+def wanted(cache, path, min_bytes=MIN_BYTES):
+    """True si `path` mérite un index : conteneur vidéo d'au moins `min_bytes` (0 = jamais)."""
+    ext = os.path.splitext(path)[1][1:].lower()
+    try:
+        return (cache is not None and min_bytes > 0 and ext in INDEXED_EXTENSIONS
+                and os.path.getsize(path) >= min_bytes)
+    except OSError:
+        return False
+
+
+def indexed(cache, source_key):
+    return cache is not None and cache.meta(key(source_key)) is not None
+
+
+def build_command(ffmpeg, input_file, output_path):
+    """Commande ffmpeg qui recopie le premier flux audio (sans décodage) dans un Matroska indexé."""
+    return [
+        ffmpeg,
+        "-hide_banner",
+        "-v", "error",
+        "-i", input_file,
+        "-map", "0:a:0",
+        "-c", "copy",
+        "-f", "matroska",
+        "-y", output_path,
+    ]
+
+
+def build(cache, source_key, input_file, work_dir, ffmpeg="ffmpeg", ffprobe="ffprobe"):
+    """
+    Construit l'index de `input_file` dans `work_dir` puis le range dans `cache`.
+    Un seul calcul à la fois par source ; rien à faire si l'index existe déjà.
+    Retourne True si l'index est disponible.
+    """
+    with cache.key_lock(key(source_key)):
+        if indexed(cache, source_key):
+            return True
+        stats['misses'] += 1
+        path = os.path.join(work_dir, "index.mka")
+        try:
+            result = subprocess.run(build_command(ffmpeg, input_file, path), capture_output=True, text=True)
+            if result.returncode != 0 or not os.path.exists(path):
+                raise media.FFmpegError(f"ffmpeg a échoué: {result.stderr}")
+            if os.path.getsize(path) > cache.max_bytes // MAX_SHARE:
+                return False
+            cache.put(key(source_key), path, {'probe': media.probe_media(path, ffprobe)})
+            return True
+        except (OSError, ValueError, media.FFmpegError) as e:
+            print(f"Index de recherche non construit : {e}")
+            return False
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def fetch(cache, source_key, dest_dir):
+    """Index de la source `source_key`, placé dans `dest_dir` (chemin), ou None."""
+    if cache is None:
+        return None
+    hit = cache.fetch(key(source_key), dest_dir)
+    if hit is None:
+        return None
+    path, meta = hit
+    if meta.get('probe'):
+        media.remember_probe(path, meta['probe'])
+    stats['hits'] += 1
+    return path
@@ -0,0 +1,877 @@
+"""
+État et fonctions communs aux deux serveurs (app.py sous Flask, asgi_app.py sous Quart) :
+configuration, jobs, caches, ordonnanceur, espace de travail, réception des uploads,
+lots et formes d'onde.
+
+L'import ne lance rien : les tâches de fond (nettoyage de l'espace de travail, lecture
+des encodeurs de ffmpeg, préchargement de yt-dlp) démarrent par start(), appelé une
+fois par le serveur.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from werkzeug.exceptions import ClientDisconnected
+
+import media
+import metrics
+import seekindex
+import uploads
+import waveform
+from cache import SourceCache, InfoCache, PeaksCache, DEFAULT_CACHE_DIR
+from flights import Flights, request_key
+from scheduler import Scheduler, DEFAULT_LOCK_DIR
+from workarea import WorkArea, DEFAULT_WORK_DIR
+from youtube import YDLPool, download_audio, source_kept, expand_urls, clean_title, check_range, warm_up
+
+# ---- Utilitaires de chemin (PyInstaller-friendly) ----
+def resource_path(relative_path):
+    base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
+    return os.path.join(base_path, relative_path)
+
+# ---- Ordonnanceur (scheduler.py) ----
+# Process ffmpeg et téléchargements yt-dlp simultanés, bornés pour tous les process qui
+# partagent SLOTS_DIR (workers gunicorn, asgi_app.py). Au-delà de QUEUE_MAX jobs en attente
+# dans un process, les nouveaux sont refusés (429 + Retry-After).
+FFMPEG_SLOTS    = int(os.environ.get('FFMPEG_SLOTS', str(os.cpu_count() or 4)))
+DOWNLOAD_SLOTS  = int(os.environ.get('DOWNLOAD_SLOTS', str(2 * (os.cpu_count() or 4))))
+QUEUE_MAX       = int(os.environ.get('QUEUE_MAX', str(4 * (os.cpu_count() or 4))))
+SLOTS_DIR       = os.environ.get('SLOTS_DIR', DEFAULT_LOCK_DIR)
+SERVER_BUSY     = "Serveur occupé, réessayez dans {} s"
+scheduler = Scheduler(FFMPEG_SLOTS, DOWNLOAD_SLOTS, SLOTS_DIR)
+
+JOB_TTL         = int(os.environ.get('JOB_TTL', '3600'))  # secondes avant oubli d'un job terminé
+# Upload en flux (/ingest) : secondes d'attente sans nouvelles données avant abandon
+INGEST_TIMEOUT  = int(os.environ.get('INGEST_TIMEOUT', '300'))
+CHUNK_SIZE      = 1024 * 1024
+# Lots (/bulk) : téléchargements simultanés par lot (défaut et maximum), fragments DASH/HLS
+# téléchargés en parallèle par vidéo, nombre max de vidéos
+BULK_PARALLEL   = int(os.environ.get('BULK_PARALLEL', '3'))
+BULK_FRAGMENTS  = int(os.environ.get('BULK_FRAGMENTS', '4'))
+BULK_MAX_ITEMS  = int(os.environ.get('BULK_MAX_ITEMS', '200'))
+
+# ---- Cache disque des sources YouTube (clé extracteur + id vidéo, LRU) ----
+SOURCE_CACHE_DIR          = os.environ.get('SOURCE_CACHE_DIR', DEFAULT_CACHE_DIR)
+SOURCE_CACHE_MAX_BYTES    = int(os.environ.get('SOURCE_CACHE_MAX_BYTES', str(2 * 1024**3)))  # 0 = désactivé
+SOURCE_CACHE_MAX_DURATION = int(os.environ.get('SOURCE_CACHE_MAX_DURATION', '1800'))  # secondes
+
+source_cache = (SourceCache(SOURCE_CACHE_DIR, SOURCE_CACHE_MAX_BYTES, SOURCE_CACHE_MAX_DURATION)
+                if SOURCE_CACHE_MAX_BYTES > 0 else None)
+
+# Métadonnées yt-dlp (titre, durée, formats) réutilisées pendant INFO_CACHE_TTL secondes
+INFO_CACHE_TTL = int(os.environ.get('INFO_CACHE_TTL', '1800'))  # 0 = désactivé
+info_cache = InfoCache(os.path.join(SOURCE_CACHE_DIR, 'info'), INFO_CACHE_TTL) if INFO_CACHE_TTL > 0 else None
+
+# Formes d'onde (/peaks) : nombre max de sources dont les pics restent sur disque
+PEAKS_CACHE_MAX_ITEMS = int(os.environ.get('PEAKS_CACHE_MAX_ITEMS', '500'))  # 0 = désactivé
+peaks_cache = (PeaksCache(os.path.join(SOURCE_CACHE_DIR, 'peaks'), PEAKS_CACHE_MAX_ITEMS)
+               if PEAKS_CACHE_MAX_ITEMS > 0 else None)
+PEAKS_MAX_WIDTH = 4000  # colonnes au plus par réponse
+PEAKS_UNAVAILABLE = "Forme d'onde indisponible : vidéo trop longue pour le cache des sources"
+
+# Extractions identiques regroupées (flights.py) : les doublons d'un job en cours le rejoignent,
+# un résultat réussi reste servi FLIGHT_TTL secondes aux retardataires
+FLIGHT_TTL = int(os.environ.get('FLIGHT_TTL', '300'))  # 0 = désactivé
+flights = Flights(FLIGHT_TTL)
+
+# Index de recherche (seekindex.py) des vidéos envoyées d'au moins SEEK_INDEX_MIN_BYTES octets,
+# construits en tâche de fond et rangés dans le cache des sources
+SEEK_INDEX_MIN_BYTES = int(os.environ.get('SEEK_INDEX_MIN_BYTES', str(64 * 1024**2)))  # 0 = désactivé
+indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='seek-index')
+
+# Instances yt-dlp réutilisées (cookies, connexions HTTP/TLS) : nombre max d'instances libres
+YDL_POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', '8'))
+ydl_pool = YDLPool(YDL_POOL_SIZE)
+# yt-dlp n'est importé qu'au premier lien YouTube ; 1 = préchargé en tâche de fond après le démarrage
+YTDLP_WARMUP = os.environ.get('YTDLP_WARMUP', '1') == '1'
+
+# ---- Espace de travail (dossiers des jobs, résultats en attente de /download) ----
+# Quota en octets : au-delà, les nouveaux jobs attendent ADMISSION_WAIT secondes qu'un résultat
+# soit téléchargé ou expire, puis sont refusés (507). Les entrées orphelines (process arrêté)
+# sont supprimées après WORK_TTL secondes.
+WORK_DIR            = os.environ.get('WORK_DIR', DEFAULT_WORK_DIR)
+WORK_QUOTA_BYTES    = int(os.environ.get('WORK_QUOTA_BYTES', '0'))  # 0 = illimité
+WORK_TTL            = int(os.environ.get('WORK_TTL', str(2 * JOB_TTL)))
+WORK_SWEEP_INTERVAL = int(os.environ.get('WORK_SWEEP_INTERVAL', '60'))
+ADMISSION_WAIT      = int(os.environ.get('ADMISSION_WAIT', '10'))
+QUOTA_EXCEEDED      = "Espace disque du serveur saturé, réessayez dans quelques minutes"
+work_area = WorkArea(WORK_DIR, WORK_QUOTA_BYTES, WORK_TTL, WORK_SWEEP_INTERVAL)
+
+jobs      = {}
+jobs_lock = threading.Lock()
+
+class Job:
+    """État d'une extraction : progression, étape, résultat ou erreur."""
+    def __init__(self):
+        self.id          = uuid.uuid4().hex
+        self.state       = 'queued'  # queued -> running -> done | error
+        self.percent     = '0%'
+        self.speed       = None  # vitesse ffmpeg (x temps réel) pendant la découpe
+        self.eta         = None  # secondes restantes estimées pendant la découpe
+        self.step        = 'En attente...'
+        self.position    = None  # place dans la file d'un slot de l'ordonnanceur, en attente
+        self.error       = None
+        self.filename    = None
+        self.result_path = None  # fichier audio, ou dossier des extraits pour un lot
+        self.clips       = None  # [(nom dans le ZIP, chemin)] pour un lot
+        self.ingest      = None  # Ingest d'un upload en flux, en attente de PUT /ingest
+        self.pending_cut = None  # (source, début, fin, codec) encodé pendant /download (delivery=stream)
+        self.items       = None  # éléments d'un lot (/bulk) : un dict par vidéo, remplacé à chaque changement
+        self.snapped     = None  # [[début, fin], ...] calées sur les silences (snap), libellés des plages
+        self.shared      = False  # rejoint par une autre requête (flights.py) : résultat gardé après /download
+        self.created     = time.time()
+        self.finished    = None
+        self.step_started = self.created  # début de l'étape courante (métriques)
+        self.version     = 0  # incrémenté à chaque changement, pour le flux d'événements
+        self._lock       = threading.Lock()
+        self._changed    = threading.Condition(self._lock)
+        self._listeners  = []  # rappels sans argument (mode asyncio, cf. asgi_app.py)
+
+    def update(self, **fields):
+        ended_step = job_seconds = None
+        with self._lock:
+            now = time.time()
+            if fields.get('step', self.step) != self.step:
+                ended_step, step_seconds = self.step, now - self.step_started
+                self.step_started = now
+            for key, value in fields.items():
+                setattr(self, key, value)
+            if self.state in ('done', 'error') and self.finished is None:
+                self.finished = now
+                job_seconds = self.finished - self.created
+            self.version += 1
+            self._changed.notify_all()
+            listeners = list(self._listeners)
+        if ended_step is not None:
+            metrics.step_changed(ended_step, step_seconds)
+        if job_seconds is not None:
+            metrics.job_finished(self.state, job_seconds)
+        for callback in listeners:
+            callback()
+
+    def share(self):
+        """Une requête de plus rejoint le job (flights.py) ; False si son résultat a déjà été remis."""
+        with self._lock:
+            if self.state == 'done' and self.result_path is None:
+                return False
+            self.shared = True
+            return True
+
+    def take_result(self):
+        """
+        Résultat à envoyer (/download) : (chemin, partagé, coupe différée). Un résultat non
+        partagé est retiré du job avec sa coupe différée (`pending_cut`), d'un seul tenant :
+        un seul envoi, l'appelant le supprime ensuite ; une requête concurrente reçoit None.
+        """
+        with self._lock:
+            path, shared, cut = self.result_path, self.shared, self.pending_cut
+            if not shared:
+                self.result_path = self.pending_cut = None
+            return path, shared, cut
+
+    def update_item(self, index, **fields):
+        """Met à jour un élément d'un lot, puis notifie comme update()."""
+        with self._lock:
+            self.items[index] = {**self.items[index], **fields}
+        self.update()
+
+    def subscribe(self, callback):
+        """Appelle callback() à chaque changement. Retourne la fonction de désabonnement."""
+        with self._lock:
+            self._listeners.append(callback)
+        def unsubscribe():
+            with self._lock:
+                self._listeners.remove(callback)
+        return unsubscribe
+
+    def wait_change(self, version, timeout):
+        """Attend un état plus récent que `version`. Retourne (instantané, version) ou (None, version)."""
+        with self._lock:
+            if self.version == version:
+                self._changed.wait(timeout)
+            if self.version == version:
+                return None, version
+            return {'percent': self.percent, 'speed': self.speed, 'eta': self.eta,
+                    'step': self.step, 'state': self.state, 'position': self.position,
+                    'error': self.error, 'filename': self.filename, 'snapped': self.snapped,
+                    'items': list(self.items) if self.items is not None else None}, self.version
+
+    def progress(self):
+        with self._lock:
+            return {'percent': self.percent, 'speed': self.speed, 'eta': self.eta}
+
+    def status(self):
+        with self._lock:
+            status = {'step': self.step, 'state': self.state, 'position': self.position,
+                      'error': self.error, 'filename': self.filename}
+            if self.items is not None:
+                status['items'] = [item_status(i, item) for i, item in enumerate(self.items)]
+            if self.snapped is not None:
+                status['snapped'] = self.snapped
+            return status
+
+def item_status(index, item):
+    """Partie publique d'un élément de lot (sans les chemins)."""
+    return {'index': index, **{k: item[k] for k in ('url', 'title', 'state', 'percent', 'filename', 'error')}}
+
+def create_job():
+    purge_jobs()
+    job = Job()
+    with jobs_lock:
+        jobs[job.id] = job
+    return job
+
+def get_job(job_id):
+    with jobs_lock:
+        return jobs.get(job_id)
+
+def purge_jobs():
+    """
+    Oublie les jobs terminés depuis plus de JOB_TTL et supprime leur fichier, résultats
+    partagés (flights.py) compris.
+    """
+    now = time.time()
+    with jobs_lock:
+        expired = [j for j in jobs.values() if j.finished and now - j.finished > JOB_TTL]
+        for job in expired:
+            del jobs[job.id]
+    for job in expired:
+        path = job.result_path
+        job.update(result_path=None)  # plus rejoignable (flights.alive)
+        remove_result(path)
+    flights.prune()
+
+def remove_result(path):
+    """Supprime un résultat de job (fichier unique ou dossier d'extraits) et libère sa place."""
+    if path:
+        work_area.remove(path)
+
+def admit(need=0, path=None):
+    """
+    Réserve `need` octets sur `path`, dossier du job (cf. WorkArea.admit) ; False =
+    refuser la requête.
+    """
+    if work_area.admit(need, path, ADMISSION_WAIT):
+        return True
+    metrics.count_error('storage')
+    return False
+
+def queue_depth():
+    """Jobs en attente dans ce process : pas encore pris par un worker, ou en file devant un slot."""
+    with jobs_lock:
+        pending = sum(job.state == 'queued' for job in jobs.values())
+    return pending + scheduler.waiting()
+
+def overloaded():
+    """None si un nouveau job peut entrer en file, sinon les secondes à attendre (Retry-After)."""
+    depth = queue_depth()
+    if depth < QUEUE_MAX:
+        return None
+    metrics.count_error('busy')
+    return scheduler.retry_after(depth)
+
+def flight_key(source_id, ranges, output, form):
+    """Clé de regroupement (flights.py) d'une requête /extract, None si elle ne se partage pas."""
+    if form.get('delivery') == 'stream' and len(ranges) == 1:
+        return None  # encodage pendant /download : un seul envoi par job
+    return request_key(source_id, ranges, output, snap_mode(form))
+
+def snap_mode(form):
+    """
+    Calage sur les silences demandé (silence.py) : 'apply' (snap=1, bornes remplacées avant
+    la découpe), 'suggest' (snap=suggest, bornes proposées au client, plages découpées
+    telles quelles) ou None.
+    """
+    return {'1': 'apply', 'suggest': 'suggest'}.get(form.get('snap'))
+
+def waiting_step(job):
+    """on_wait de l'ordonnanceur : place du job dans la file, affichée dans son étape."""
+    def on_wait(position):
+        job.update(step=f"En attente... (position {position} dans la file)", position=position)
+    return on_wait
+
+def slotted(kind, chunks):
+    """Relaie le générateur `chunks` en tenant un slot `kind`, pris au premier bloc demandé."""
+    with scheduler.slot(kind):
+        try:
+            yield from chunks
+        finally:
+            chunks.close()
+
+@contextlib.contextmanager
+def job_slot(job, kind):
+    """Slot `kind` ('cpu' | 'io') de l'ordonnanceur pour `job`, qui affiche sa place en attendant."""
+    with scheduler.slot(kind, waiting_step(job)):
+        if job.position is not None:
+            job.update(position=None)
+        yield
+
+# ---- Chemins ffmpeg/ffprobe (packagés localement) ----
+FFMPEG_DIR   = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg', 'bin')
+FFMPEG_PATH  = os.path.join(FFMPEG_DIR, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+FFPROBE_PATH = os.path.join(FFMPEG_DIR, 'ffprobe.exe' if os.name == 'nt' else 'ffprobe')
+
+def clean_ansi(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+def make_progress_hook(job):
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            raw = d.get('_percent_str', '0.0%')
+            job.update(percent=clean_ansi(raw).strip(), step="Téléchargement en cours... 📥")
+        elif d['status'] == 'finished':
+            metrics.BYTES.inc(d.get('total_bytes') or d.get('downloaded_bytes') or 0,
+                              direction='downloaded')
+            job.update(percent='convert', step="Téléchargement terminé, préparation du découpage... 🎧")
+    return progress_hook
+
+# ---- Helpers temps/validation ----
+def parse_time(t):
+    """'hh:mm:ss', 'mm:ss' ou 'ss' -> secondes ; les secondes peuvent avoir des décimales (1:02.3)."""
+    *parts, seconds = t.strip().split(":")
+    parts = [*map(int, parts), float(seconds) if '.' in seconds else int(seconds)]
+    if len(parts) == 1:
+        return parts[0]
+    elif len(parts) == 2:
+        return parts[0] * 60 + parts[1]
+    elif len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    else:
+        raise ValueError("Format de temps invalide (hh:mm:ss, mm:ss ou ss)")
+
+def parse_ranges(form):
+    """
+    Plages demandées : champ 'ranges' (JSON [[début, fin], ...]) ou start/end.
+    Retourne [(début, fin, début_s, fin_s)].
+    """
+    if form.get('ranges'):
+        try:
+            pairs = json.loads(form['ranges'])
+        except ValueError:
+            raise ValueError("Liste de plages invalide")
+        if not isinstance(pairs, list) or not pairs:
+            raise ValueError("Liste de plages invalide")
+    else:
+        pairs = [[form['start'], form['end']]]
+
+    ranges = []
+    for pair in pairs:
+        if not (isinstance(pair, list) and len(pair) == 2 and all(isinstance(t, str) for t in pair)):
+            raise ValueError('Liste de plages invalide : chaque plage est ["début", "fin"]')
+        start, end = pair
+        start_time = parse_time(start)
+        end_time   = parse_time(end)
+        if end_time <= start_time:
+            prefix = f"{start} → {end} : " if len(pairs) > 1 else ""
+            raise ValueError(prefix + "L'heure de fin doit être supérieure à l'heure de début.")
+        ranges.append((start, end, start_time, end_time))
+    return ranges
+
+def parse_output(form):
+    """
+    (format, débit) de sortie : `format` (mp3, m4a, opus ; selon les encodeurs de ffmpeg)
+    et `bitrate` optionnel ('192k'). Sans débit, une source déjà dans le codec du format
+    est recopiée sans ré-encodage.
+    """
+    fmt = form.get('format') or media.DEFAULT_OUTPUT[0]
+    if fmt not in media.available_formats(FFMPEG_PATH):
+        raise ValueError(f"Format de sortie indisponible : {fmt}")
+    bitrate = form.get('bitrate') or None
+    if bitrate and bitrate not in media.BITRATES:
+        raise ValueError(f"Débit invalide : {bitrate}")
+    return fmt, bitrate
+
+def probe_media(input_file):
+    """Retourne durée (float, secondes), codec et débit audio via ffprobe."""
+    return media.probe_media(input_file, FFPROBE_PATH)
+
+def make_ffmpeg_progress(job):
+    """Reporte la progression de ffmpeg (pourcentage, vitesse, ETA) dans le job."""
+    def on_progress(p):
+        if p['percent'] is not None:
+            job.update(percent=f"{p['percent']:.1f}%", speed=p['speed'], eta=p['eta'])
+    return on_progress
+
+def ffmpeg_cut(input_file, start_time, end_time, output_path, source_codec=None, on_progress=None,
+               output=media.DEFAULT_OUTPUT, **popen_kwargs):
+    """Coupe l'audio entre start_time et end_time (en secondes) vers `output` (format, débit)."""
+    cmd = media.build_cut_command(FFMPEG_PATH, input_file, start_time, end_time, output_path, source_codec,
+                                  output)
+    metrics.count_cuts(output, source_codec)
+    code, err = media.run_ffmpeg(cmd, end_time - start_time, on_progress, **popen_kwargs)
+    if code != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        raise media.FFmpegError(f"ffmpeg a échoué: {err}")
+
+def ffmpeg_cut_many(input_file, clips, source_codec=None, on_progress=None, output=media.DEFAULT_OUTPUT,
+                    **popen_kwargs):
+    """Produit tous les extraits [(début, fin, sortie)] en une seule passe ffmpeg."""
+    cmd = media.build_multi_cut_command(FFMPEG_PATH, input_file, clips, source_codec, output)
+    metrics.count_cuts(output, source_codec, len(clips))
+    span = max(end for _, end, _ in clips) - min(start for start, _, _ in clips)
+    code, err = media.run_ffmpeg(cmd, span, on_progress, **popen_kwargs)
+    if code != 0 or any(not os.path.exists(out) or os.path.getsize(out) == 0 for _, _, out in clips):
+        raise media.FFmpegError(f"ffmpeg a échoué: {err}")
+
+def ingest_mode(ext, head, seekable=False):
+    """
+    'pipe' si ffmpeg peut lire ce format d'un bout à l'autre sur stdin, sinon 'spool'.
+    seekable : le job doit pouvoir relire le fichier (calage des bornes), toujours 'spool'.
+    """
+    if seekable:
+        return 'spool'
+    if ext in media.PIPE_FRIENDLY_EXTENSIONS:
+        return 'pipe'
+    if ext in media.MP4_EXTENSIONS and media.mp4_is_streamable(head):
+        return 'pipe'
+    return 'spool'
+
+def head_complete(ext, head):
+    """Assez d'octets reçus pour choisir le mode (seuls les MP4 demandent à lire plus loin)."""
+    return ext not in media.MP4_EXTENSIONS or media.mp4_is_streamable(head) is not None
+
+class Ingest:
+    """
+    Réception en flux d'un upload (PUT /ingest/<job_id>) pour un job déjà créé.
+
+    Mode 'pipe' : le corps de la requête est écrit dans un tube que ffmpeg lit sur
+    son entrée standard ; la découpe avance pendant l'envoi, sans copie sur disque.
+    Mode 'spool' : formats qui exigent de se déplacer dans le fichier (MP4 sans
+    « faststart », AVI) ; le corps est écrit par blocs dans le dossier du job et la
+    découpe démarre dès la fin de l'envoi.
+    Le corps est haché (SHA-256) au passage ; keep(chemin, empreinte) reçoit le fichier
+    complet à la fin de l'envoi (déduplication, cf. uploads.py). En mode 'pipe', ce
+    fichier est une copie, faite seulement si la taille annoncée tient dans le cache
+    (cf. upload_keepable).
+    """
+    HEAD_MAX = 1024 * 1024  # octets lus au plus pour décider si un MP4 est lisible en flux
+
+    def __init__(self, path, ext, seekable=False, keep=None):
+        self.path      = path  # fichier de spool
+        self.ext       = ext
+        self.seekable  = seekable  # cf. ingest_mode
+        self.keep      = keep
+        self.digest    = hashlib.sha256()
+        self.mode      = None  # 'pipe' | 'spool', choisi sur les premiers octets
+        self.read_fd   = None
+        self.error     = None
+        self.received  = 0
+        self.ready     = threading.Event()  # mode choisi, ffmpeg peut démarrer (pipe)
+        self.complete  = threading.Event()  # corps entièrement reçu (ou envoi interrompu)
+        self._claimed  = False
+        self._closed   = False
+        self._lock     = threading.Lock()
+
+    def claim(self):
+        """Un seul envoi par job, et seulement tant que le job l'attend."""
+        with self._lock:
+            if self._claimed or self._closed:
+                return False
+            self._claimed = True
+            return True
+
+    def receive(self, stream, total=None, chunk_size=CHUNK_SIZE, on_chunk=None):
+        """
+        Lit le corps de la requête (`total` octets annoncés, None si inconnu) et
+        l'achemine vers ffmpeg ou le fichier de spool.
+        """
+        sink = copy = copy_path = None
+        try:
+            # Début du fichier : assez d'octets pour reconnaître un MP4 « faststart »
+            head = b''
+            while len(head) < self.HEAD_MAX:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                head += chunk
+                if head_complete(self.ext, head):
+                    break
+            self.received = len(head)
+            if not head:
+                raise ValueError("fichier vide")
+
+            self.mode = ingest_mode(self.ext, head, self.seekable)
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("le job est terminé")
+                if self.mode == 'pipe':
+                    self.read_fd, write_fd = os.pipe()
+                    sink = os.fdopen(write_fd, 'wb')
+                    if self.keep and upload_keepable(total):
+                        # Copie à conserver, hors du dossier du job : il peut être supprimé
+                        # avant la fin de l'envoi (plage atteinte). Elle reprend la place
+                        # réservée par /ingest, inutilisée par le dossier en mode pipe
+                        copy_path = work_area.mkstemp(suffix='.' + self.ext)
+                        work_area.transfer(os.path.dirname(self.path), copy_path, total)
+                        copy = open(copy_path, 'wb')
+                else:
+                    sink = open(self.path, 'wb')
+            self.ready.set()
+            self._pump(stream, head, sink, copy, chunk_size, on_chunk)
+            if self.keep and (copy_path or self.mode == 'spool'):
+                for f in (sink, copy):
+                    if f:
+                        with contextlib.suppress(OSError):
+                            f.close()
+                self.keep(copy_path or self.path, self.digest.hexdigest())
+        except ClientDisconnected:
+            # Erreur notée avant que ffmpeg ne voie la fin du flux : le job saura que
+            # l'extrait est tronqué
+            self.error = "Envoi interrompu par le client"
+            raise
+        except Exception as e:
+            self.error = f"Envoi interrompu : {e}"
+            raise
+        finally:
+            for f in (sink, copy):
+                if f:
+                    with contextlib.suppress(OSError):
+                        f.close()
+            if copy_path:
+                work_area.remove(copy_path)
+            self.ready.set()
+            self.complete.set()
+
+    def _pump(self, stream, chunk, sink, copy, chunk_size, on_chunk):
+        while chunk:
+            self.digest.update(chunk)
+            if copy:
+                copy.write(chunk)
+            if sink:
+                try:
+                    sink.write(chunk)
+                except BrokenPipeError:
+                    # ffmpeg a fini (plage atteinte) ou abandonné : le reste de l'envoi est
+                    # lu (et haché) sans lui être transmis, pour que le client termine sa requête
+                    sink = None
+            if on_chunk:
+                on_chunk(self.received)
+            chunk = stream.read(chunk_size)
+            self.received += len(chunk)
+
+    def abort(self, error):
+        """Envoi refusé avant lecture (ex. quota) : le job en attente échoue avec `error`."""
+        self.error = error
+        self.ready.set()
+        self.complete.set()
+
+    def close(self):
+        """Fin du job : un envoi encore en cours reçoit EPIPE, un envoi tardif est refusé."""
+        with self._lock:
+            self._closed = True
+            if self.read_fd is not None:
+                with contextlib.suppress(OSError):
+                    os.close(self.read_fd)
+                self.read_fd = None
+
+class _ZipSink(io.RawIOBase):
+    """Flux non seekable qui accumule ce que zipfile écrit, vidé au fil de l'envoi."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def _zip_file(zf, sink, arcname, path, chunk_size):
+    with open(path, 'rb') as src, zf.open(arcname, 'w', force_zip64=True) as dest:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dest.write(chunk)
+            yield sink.pop()
+    yield sink.pop()
+
+def stream_zip(files, chunk_size=64 * 1024):
+    """Génère une archive ZIP (sans compression, extraits déjà compressés) au fil de la lecture."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zf:
+        for arcname, path in files:
+            yield from _zip_file(zf, sink, arcname, path, chunk_size)
+    yield sink.pop()
+
+def stream_bulk_zip(job, chunk_size=64 * 1024, keepalive=15):
+    """
+    ZIP d'un lot envoyé pendant le lot : chaque vidéo est ajoutée dès qu'elle est prête,
+    l'archive se termine avec le job.
+    """
+    sink = _ZipSink()
+    sent, version = set(), -1
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zf:
+        while True:
+            finished = job.state in ('done', 'error')  # lu avant les éléments : rien n'est oublié
+            for index, item in enumerate(job.items or []):
+                if item['state'] == 'done' and index not in sent:
+                    sent.add(index)
+                    for arcname, path in item['files']:
+                        yield from _zip_file(zf, sink, arcname, path, chunk_size)
+            if finished:
+                break
+            _, version = job.wait_change(version, keepalive)
+    yield sink.pop()
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def job_messages(snapshot, last):
+    """Événements SSE entre deux instantanés d'un job. Retourne (messages, terminé)."""
+    messages = []
+    if snapshot['percent'] != last.get('percent'):
+        messages.append(sse('progress', {k: snapshot[k] for k in ('percent', 'speed', 'eta')}))
+    if snapshot['step'] != last.get('step'):
+        messages.append(sse('status', {'step': snapshot['step'], 'position': snapshot['position']}))
+    if snapshot['snapped'] != last.get('snapped'):
+        messages.append(sse('snapped', {'ranges': snapshot['snapped']}))
+    if snapshot['items'] is not None:
+        # Lot : un événement 'item' par vidéo dont l'état a changé
+        previous = last.get('items') or []
+        for index, item in enumerate(snapshot['items']):
+            if index >= len(previous) or item is not previous[index]:
+                messages.append(sse('item', item_status(index, item)))
+    if snapshot['state'] == 'done':
+        messages.append(sse('done', {'filename': snapshot['filename']}))
+    elif snapshot['state'] == 'error':
+        messages.append(sse('failed', {'error': snapshot['error']}))
+    return messages, snapshot['state'] in ('done', 'error')
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def output_choices():
+    """[(format, libellé)] proposés par la page : formats dont ffmpeg a l'encodeur."""
+    return [(fmt, media.OUTPUT_FORMATS[fmt]['label']) for fmt in media.available_formats(FFMPEG_PATH)]
+
+ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'aac', 'mp4', 'avi', 'mkv'}
+UNSUPPORTED_FORMAT = "Format de fichier non supporté. Formats acceptés : MP3, WAV, M4A, AAC, MP4, AVI, MKV"
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def upload_keepable(size):
+    """
+    True si un upload de `size` octets (None = inconnu) peut entrer dans le cache des
+    sources (False si le cache est désactivé).
+    """
+    return (source_cache is not None and bool(size)
+            and size <= source_cache.max_bytes // uploads.MAX_SHARE)
+
+def keep_upload(path, digest):
+    """
+    Upload complet reçu : conservé pour les envois suivants du même fichier (uploads.py)
+    et, pour une grosse vidéo, indexé en tâche de fond (seekindex.py).
+    """
+    uploads.store(source_cache, digest, path, FFPROBE_PATH)
+    if (seekindex.wanted(source_cache, path, SEEK_INDEX_MIN_BYTES)
+            and not seekindex.indexed(source_cache, uploads.key(digest))):
+        schedule_index(uploads.key(digest), path)
+
+def schedule_index(key, path):
+    """Confie l'indexation de `path` au pool `indexer`, via un lien dur : le job peut supprimer l'original."""
+    workdir = work_area.mkdtemp(prefix="index_")
+    source = os.path.join(workdir, "source" + os.path.splitext(path)[1])
+    try:
+        os.link(path, source)
+    except OSError as e:
+        # Pas de copie d'une grosse vidéo juste pour l'indexer
+        work_area.remove(workdir)
+        print(f"Index de recherche non construit : {e}")
+        return
+    indexer.submit(build_index, key, source, workdir)
+
+def build_index(key, source, workdir):
+    try:
+        with scheduler.slot('io'):  # lecture complète de la vidéo
+            seekindex.build(source_cache, key, source, workdir, FFMPEG_PATH, FFPROBE_PATH)
+    finally:
+        work_area.remove(workdir)
+
+def url_peaks(url):
+    """
+    Pics (waveform) de la vidéo `url` : cache, sinon téléchargement complet puis décodage.
+    Refusé (ValueError) si la source ne peut pas rester dans le cache des sources :
+    l'extraction qui suit la téléchargerait une seconde fois.
+    """
+    def compute():
+        workdir = work_area.mkdtemp(prefix="peaks_")
+        try:
+            with scheduler.slot('io'):
+                if not source_kept(url, source_cache, FFMPEG_DIR, info_cache, ydl_pool):
+                    raise ValueError(PEAKS_UNAVAILABLE)
+                input_file, _, _ = download_audio(url, workdir, 0, None, [], FFMPEG_DIR,
+                                                  cache=source_cache, info_cache=info_cache, pool=ydl_pool)
+            started = time.monotonic()
+            with scheduler.slot('cpu'):
+                result = waveform.decode_peaks(input_file, FFMPEG_PATH)
+            metrics.STAGE_SECONDS.observe(time.monotonic() - started, stage='peaks')
+            return result
+        finally:
+            work_area.remove(workdir)
+    return waveform.cached_peaks(peaks_cache, waveform.url_key(url), compute)
+
+def upload_peaks(digest):
+    """Pics d'un fichier déjà envoyé (cache des uploads) ; ValueError s'il n'y est plus."""
+    def compute():
+        workdir = work_area.mkdtemp(prefix="peaks_")
+        try:
+            input_file = uploads.fetch(source_cache, digest, workdir)
+            if input_file is None:
+                raise ValueError("Fichier inconnu : envoyez-le à nouveau")
+            started = time.monotonic()
+            with scheduler.slot('cpu'):
+                result = waveform.decode_peaks(input_file, FFMPEG_PATH)
+            metrics.STAGE_SECONDS.observe(time.monotonic() - started, stage='peaks')
+            return result
+        finally:
+            work_area.remove(workdir)
+    return waveform.cached_peaks(peaks_cache, uploads.key(digest), compute)
+
+def run_bulk(job, urls, ranges, parallel, fragments, output=media.DEFAULT_OUTPUT):
+    """Lot : développe les playlists puis traite `parallel` vidéos à la fois (run_bulk_item)."""
+    job.update(state='running', step="Récupération de la liste des vidéos...")
+    results_dir = work_area.mkdtemp(prefix="bulk_")
+    job.update(result_path=results_dir)
+    try:
+        entries = expand_urls(urls, FFMPEG_DIR, info_cache, ydl_pool)
+        if not entries:
+            raise ValueError("Aucune vidéo trouvée")
+        if len(entries) > BULK_MAX_ITEMS:
+            raise ValueError(f"Trop de vidéos ({len(entries)}), maximum {BULK_MAX_ITEMS}")
+        job.update(items=[{**entry, 'state': 'error' if entry['error'] else 'queued',
+                           'percent': '0%', 'filename': None, 'files': []} for entry in entries],
+                   step=f"Traitement de {len(entries)} vidéos...", percent='0%')
+
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            for index, entry in enumerate(entries):
+                if not entry['error']:
+                    pool.submit(run_bulk_item, job, index, ranges, results_dir, fragments, output)
+
+        done = sum(item['state'] == 'done' for item in job.items)
+        if not done:
+            raise Exception("Aucune vidéo n'a pu être extraite")
+        job.update(state='done', step=f"Terminé ✅ ({done}/{len(entries)} vidéos)", percent='done',
+                   filename="lot_extraits.zip")
+    except Exception as e:
+        remove_result(results_dir)
+        metrics.count_error(e)
+        job.update(state='error', step=f"Erreur : {str(e)}", error=str(e), result_path=None)
+
+def run_bulk_item(job, index, ranges, results_dir, fragments, output=media.DEFAULT_OUTPUT):
+    """Une vidéo d'un lot : téléchargement puis découpe vers `results_dir`. N'échoue pas le lot."""
+    url = job.items[index]['url']
+    workdir = work_area.mkdtemp(prefix="extract_")
+    try:
+        first = min(r[2] for r in ranges) if ranges else 0
+        last  = max(r[3] for r in ranges) if ranges else None
+        # L'élément reste « en attente » tant que l'ordonnanceur ne lui donne pas de slot
+        with scheduler.slot('io'):
+            job.update_item(index, state='running')
+            input_file, info, offset = download_audio(
+                url, workdir, first, last, [make_item_hook(job, index)], FFMPEG_DIR,
+                cache=source_cache, info_cache=info_cache, pool=ydl_pool,
+                concurrent_fragment_downloads=fragments,
+            )
+        base_name = clean_title(info.get('title') or 'video') or 'video'
+        meta = media.metadata_from_info(info)
+        if not meta['duration']:
+            meta = probe_media(input_file)
+            check_range(meta['duration'], first, last)
+
+        prefix = f"{index + 1:03d}_{base_name}"
+        ext = media.OUTPUT_FORMATS[output[0]]['ext']
+        if ranges:
+            names = [f"{prefix}_{start}-{end}.{ext}".replace(":", "-") for start, end, _, _ in ranges]
+            clips = [(start_time - offset, end_time - offset, os.path.join(results_dir, name))
+                     for name, (_, _, start_time, end_time) in zip(names, ranges)]
+        else:
+            names = [f"{prefix}.{ext}"]
+            clips = [(0, meta['duration'], os.path.join(results_dir, names[0]))]
+        job.update_item(index, percent='convert')
+        with scheduler.slot('cpu'):
+            if len(clips) == 1:
+                ffmpeg_cut(input_file, clips[0][0], clips[0][1], clips[0][2], meta['codec'], output=output)
+            else:
+                ffmpeg_cut_many(input_file, clips, meta['codec'], output=output)
+        work_area.settle(results_dir)
+        job.update_item(index, state='done', percent='done', filename=names[0],
+                        files=[(name, out) for name, (_, _, out) in zip(names, clips)])
+    except Exception as e:
+        metrics.count_error(e)
+        job.update_item(index, state='error', error=str(e))
+    finally:
+        work_area.remove(workdir)
+        finished = sum(item['state'] in ('done', 'error') for item in job.items)
+        job.update(percent=f"{finished * 100 / len(job.items):.0f}%")
+
+def make_item_hook(job, index):
+    """Progression yt-dlp d'une vidéo de lot, au pour cent près (limite les événements 'item')."""
+    def progress_hook(d):
+        if d['status'] == 'downloading' and d.get('total_bytes'):
+            percent = f"{d['downloaded_bytes'] * 100 // d['total_bytes']}%"
+            if percent != job.items[index]['percent']:
+                job.update_item(index, percent=percent)
+        elif d['status'] == 'finished':
+            metrics.BYTES.inc(d.get('total_bytes') or d.get('downloaded_bytes') or 0,
+                              direction='downloaded')
+    return progress_hook
+
+def check_ingest(feed, first, last, reached=None):
+    """
+    Après une découpe en flux : envoi complet et plage contenue dans le fichier
+    (`reached` : position atteinte dans la source, cf. output_seconds).
+    """
+    if feed.mode != 'pipe':
+        return
+    if feed.error:
+        raise Exception(feed.error)
+    if reached is None or reached >= last - 0.5:
+        return
+    # ffmpeg a vu la fin du fichier avant la fin de la plage
+    if reached <= first:
+        raise ValueError("Le fichier se termine avant le début de la plage demandée.")
+    check_range(reached, first, last)
+
+def metrics_text():
+    """Export Prometheus : jobs, caches, durées par étape, octets, erreurs, CPU ffmpeg."""
+    with jobs_lock:
+        known = list(jobs.values())
+    caches = {'source': source_cache, 'info': info_cache, 'ydl': ydl_pool, 'peaks': peaks_cache,
+              'probe': SimpleNamespace(**media.probe_stats), 'seek': SimpleNamespace(**seekindex.stats),
+              'flight': flights}
+    work = work_area.stats()
+    work['shared_bytes'] = sum(work_area.charged(job.result_path) for job in known
+                               if job.shared and job.state == 'done' and job.result_path)
+    return metrics.render(known, caches, work, scheduler.stats())
+
+
+_started = False
+
+def start():
+    """Tâches de fond du process serveur (une seule fois)."""
+    global _started
+    if _started:
+        return
+    _started = True
+    # Oubli des jobs expirés même sans nouvelle requête, puis des entrées orphelines
+    work_area.on_sweep(purge_jobs)
+    work_area.start()
+    # Encodeurs de ffmpeg (formats de sortie proposés) lus une fois, hors du chemin des requêtes
+    threading.Thread(target=media.encoders, args=(FFMPEG_PATH,), daemon=True).start()
+    if YTDLP_WARMUP:
+        warm_up(ydl_pool, FFMPEG_DIR, delay=1)
@@ -0,0 +1,140 @@
+"""
+Détection des silences autour des bornes d'un extrait, pour les caler sur une pause.
+
+Autour de chaque borne, seule une fenêtre de ±SNAP_WINDOW secondes est décodée par ffmpeg
+(recherche avant décodage) en PCM mono, lue par blocs et réduite avec NumPy en niveaux RMS
+par trame de FRAME secondes. Le coût ne dépend pas de la durée de la source : quelques
+dizaines de millisecondes par borne, y compris sur une heure d'audio.
+SNAP_WINDOW vaut youtube.RANGE_MARGIN : un téléchargement partiel contient toute la fenêtre.
+"""
+import media
+from youtube import RANGE_MARGIN
+
+RATE = 8000             # Hz
+FRAME = 0.02            # secondes par trame RMS
+FRAME_SAMPLES = int(RATE * FRAME)
+CHUNK_FRAMES = 500      # trames par bloc lu
+SNAP_WINDOW = RANGE_MARGIN
+SILENCE_DB = -50.0      # toujours un silence en dessous (dBFS)
+LOUD_DB = -20.0         # jamais un silence au dessus
+CONTRAST_DB = 12.0      # une pause est au moins aussi loin sous le niveau du son voisin
+MIN_SILENCE = 0.15      # durée minimale d'une pause (s)
+PAD = 0.05              # marge gardée avant le son (début) ou après (fin)
+DISTANCE_DB = 6.0       # pénalité par seconde d'écart quand il n'y a pas de pause franche
+PREROLL = 0.25          # décodé puis ignoré avant la fenêtre (silence parasite après un seek MP3)
+JOIN_SPAN = 60.0        # plage plus courte : un seul décodage couvre ses deux bornes
+
+
+def frame_levels(input_file, start_time, duration, ffmpeg="ffmpeg", **popen_kwargs):
+    """Niveaux RMS (dBFS, tableau float) des trames de [start_time, start_time + duration]."""
+    import numpy as np
+
+    levels = []
+    skip = int(min(PREROLL, start_time) / FRAME)  # trames de pré-roll à ignorer
+    cmd = media.build_pcm_command(ffmpeg, input_file, RATE, start_time - skip * FRAME, duration + skip * FRAME)
+    for data in media.stream_ffmpeg(cmd, CHUNK_FRAMES * FRAME_SAMPLES * 2, full_chunks=True, **popen_kwargs):
+        samples = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+        usable = len(samples) // FRAME_SAMPLES * FRAME_SAMPLES
+        if not usable:
+            continue
+        frames = samples[:usable].reshape(-1, FRAME_SAMPLES).astype(np.float32) / 32768
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        levels.append(20 * np.log10(rms + 1e-6))
+    return np.concatenate(levels)[skip:] if levels else np.zeros(0, np.float32)
+
+
+def _silent_runs(silent):
+    """[(première trame, trame après la dernière)] des suites de trames silencieuses."""
+    import numpy as np
+
+    edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def snap(input_file, position, edge, ffmpeg="ffmpeg", window=SNAP_WINDOW, **popen_kwargs):
+    """
+    Position (s, dans le fichier) proposée pour la borne `edge` ('start' ou 'end') voisine
+    de `position`, et sa nature : 'silence' (pause franche), 'quiet' (creux le plus calme
+    à proximité, pour une source sans pause) ou None (rien d'analysable, position inchangée).
+    Un début est calé juste avant la reprise du son, une fin juste après son arrêt.
+    """
+    base = max(0.0, position - window)
+    levels = frame_levels(input_file, base, position + window - base, ffmpeg, **popen_kwargs)
+    return _snap_levels(levels, base, position, edge)
+
+
+def _snap_levels(levels, base, position, edge):
+    """snap() sur des niveaux déjà calculés, la première trame commençant à `base`."""
+    import numpy as np
+
+    if len(levels) < 3:
+        return position, None
+    times = base + (np.arange(len(levels)) + 0.5) * FRAME
+
+    # Seuil relatif au bruit de fond de la fenêtre, borné par SILENCE_DB et LOUD_DB, et
+    # nettement sous le niveau du son : un passage uniforme n'est pas une pause
+    floor, loud = np.percentile(levels, [10, 90])
+    threshold = min(max(SILENCE_DB, float(floor) + 10), LOUD_DB, float(loud) - CONTRAST_DB)
+    runs = [(a, b) for a, b in _silent_runs(levels < threshold) if (b - a) * FRAME >= MIN_SILENCE]
+    if runs:
+        bounds = [(base + a * FRAME, base + b * FRAME) for a, b in runs]
+        if edge == 'start':
+            candidates = [max(start, end - PAD) for start, end in bounds]
+        else:
+            candidates = [min(end, start + PAD) for start, end in bounds]
+        return float(min(candidates, key=lambda t: abs(t - position))), 'silence'
+
+    # Pas de pause : trame la plus calme (lissée), pénalisée par son éloignement
+    smooth = np.convolve(levels, np.ones(5) / 5, mode='same')
+    best = int(np.argmin(smooth + DISTANCE_DB * np.abs(times - position)))
+    return float(times[best]), 'quiet'
+
+
+def snap_range(input_file, start_time, end_time, ffmpeg="ffmpeg", window=SNAP_WINDOW, **popen_kwargs):
+    """
+    (début, fin, natures) calés sur les silences voisins. Les bornes d'origine sont gardées
+    si le calage rendait la plage vide ou l'éloignait de plus de `window`.
+    """
+    if end_time - start_time <= JOIN_SPAN:
+        # Plage courte : un seul ffmpeg (une seule recherche dans la source) pour les deux bornes
+        base = max(0.0, start_time - window)
+        levels = frame_levels(input_file, base, end_time + window - base, ffmpeg, **popen_kwargs)
+        split = int((end_time - window - base) / FRAME)
+        start, start_kind = _snap_levels(levels[:int((start_time + window - base) / FRAME)], base,
+                                         start_time, 'start')
+        end, end_kind = _snap_levels(levels[max(split, 0):], base + max(split, 0) * FRAME, end_time, 'end')
+    else:
+        start, start_kind = snap(input_file, start_time, 'start', ffmpeg, window, **popen_kwargs)
+        end, end_kind = snap(input_file, end_time, 'end', ffmpeg, window, **popen_kwargs)
+    if end - start <= FRAME or abs(start - start_time) > window or abs(end - end_time) > window:
+        return start_time, end_time, (None, None)
+    return start, end, (start_kind, end_kind)
+
+
+def format_time(seconds):
+    """Secondes -> 'm:ss.d' ou 'h:mm:ss.d' : libellé d'une borne calée, au dixième."""
+    tenths = round(seconds * 10)
+    h, rest = divmod(tenths, 36000)
+    m, rest = divmod(rest, 600)
+    s, d = divmod(rest, 10)
+    return f"{h}:{m:02d}:{s:02d}.{d}" if h else f"{m}:{s:02d}.{d}"
+
+
+def snap_ranges(input_file, ranges, ffmpeg="ffmpeg", offset=0, **popen_kwargs):
+    """
+    Plages [(libellé début, libellé fin, début, fin)] dont les bornes sont calées sur les
+    silences voisins ; seuls les libellés des bornes déplacées sont recalculés (format_time).
+    `offset` = position du début du fichier dans la vidéo (téléchargement partiel).
+    """
+    snapped = []
+    for start, end, start_time, end_time in ranges:
+        new_start, new_end, kinds = snap_range(input_file, start_time - offset, end_time - offset,
+                                               ffmpeg, **popen_kwargs)
+        if kinds != (None, None):
+            new_start, new_end = new_start + offset, new_end + offset
+            if round(new_start, 1) != round(start_time, 1):
+                start, start_time = format_time(new_start), new_start
+            if round(new_end, 1) != round(end_time, 1):
+                end, end_time = format_time(new_end), new_end
+        snapped.append((start, end, start_time, end_time))
+    return snapped
@@ -0,0 +1,39 @@
+"""
+Mesure du démarrage à froid, partagée par app.py et version_tkinter.py.
+
+Importé en tout premier par les points d'entrée : `mark(nom)` note le temps écoulé depuis
+(serveur prêt, fenêtre affichée...) et `timed(nom)` mesure un chargement différé (yt-dlp).
+Les mesures sont exportées par /metrics et affichées sur stderr avec STARTUP_LOG=1.
+"""
+import contextlib
+import os
+import sys
+import threading
+import time
+
+STARTED = time.perf_counter()
+LOG = os.environ.get('STARTUP_LOG') == '1'
+
+timings = {}  # étape -> secondes
+_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _lock:
+        timings[name] = seconds
+    if LOG:
+        print(f"[démarrage] {name} : {seconds * 1000:.0f} ms", file=sys.stderr)
+
+
+def mark(name):
+    """Note le temps écoulé depuis le lancement (import de ce module)."""
+    record(name, time.perf_counter() - STARTED)
+
+
+@contextlib.contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
@@ -0,0 +1,82 @@
+"""
+Déduplication des fichiers envoyés, partagée par app.py et asgi_app.py.
+
+Chaque upload est haché (SHA-256) pendant sa réception puis rangé dans le cache des
+sources (cache.SourceCache) sous la clé `upload-<empreinte>`, avec le résultat de ffprobe.
+Un nouvel envoi du même fichier reprend la sonde enregistrée ; un client qui annonce
+l'empreinte avant d'envoyer (champ `sha256` de /extract) n'envoie rien si le serveur
+l'a déjà : le job part de la copie en cache, ou de son index de recherche (seekindex.py)
+pour une grosse vidéo.
+"""
+import hashlib
+import os
+import re
+
+import media
+import seekindex
+
+DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+MAX_SHARE = 4  # un upload n'occupe jamais plus du quart du cache
+
+
+def key(digest):
+    """Clé de cache (sources et formes d'onde) d'un upload."""
+    return f"upload-{digest}"
+
+
+def parse_digest(value):
+    """Empreinte SHA-256 hexadécimale (minuscules) ou None si `value` n'en est pas une."""
+    value = (value or '').strip().lower()
+    return value if DIGEST_RE.fullmatch(value) else None
+
+
+def save_stream(stream, path, chunk_size=1024 * 1024):
+    """Copie `stream` dans `path` en le hachant. Retourne l'empreinte (hex)."""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def store(cache, digest, path, ffprobe="ffprobe"):
+    """
+    Range l'upload complet `path` dans `cache` (optionnel). Déjà connu : seule sa sonde
+    est reprise pour `path` (media.probe_media ne relancera pas ffprobe). Ignoré si le
+    fichier est trop gros pour le cache ou illisible par ffprobe.
+    """
+    if cache is None or not digest:
+        return
+    meta = cache.meta(key(digest))
+    if meta and meta.get('probe'):
+        media.remember_probe(path, meta['probe'])
+        return
+    try:
+        if os.path.getsize(path) > cache.max_bytes // MAX_SHARE:
+            return
+        cache.put(key(digest), path, {'probe': media.probe_media(path, ffprobe)})
+    except (OSError, media.FFmpegError) as e:
+        print(f"Upload non conservé : {e}")
+
+
+def fetch(cache, digest, dest_dir):
+    """
+    Copie en cache de l'upload `digest`, placée dans `dest_dir` (chemin), ou None.
+    L'index de recherche, s'il existe, est préféré à la source : même flux audio, et il
+    reste en cache quand la vidéo est trop grosse pour y être gardée.
+    """
+    if cache is None or not digest:
+        return None
+    path = seekindex.fetch(cache, key(digest), dest_dir)
+    if path:
+        cache.count(True)
+        return path
+    hit = cache.fetch(key(digest), dest_dir)
+    cache.count(hit is not None)
+    if hit is None:
+        return None
+    path, meta = hit
+    if meta.get('probe'):
+        media.remember_probe(path, meta['probe'])
+    return path
@@ -1,3 +1,4 @@
+import startup  # en premier : mesure du démarrage à froid
 import os
 import re
 import sys
@@ -9,15 +10,29 @@ import subprocess
 import signal
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import yt_dlp
 import platform
 
+import seekindex
+import waveform
+from cache import SourceCache, InfoCache, PeaksCache, DEFAULT_CACHE_DIR
+from media import (build_cut_command, build_multi_cut_command, probe_media, run_ffmpeg,
+                   available_formats, OUTPUT_FORMATS, DEFAULT_OUTPUT, BITRATES)
+from silence import snap_ranges
+from youtube import download_audio, clean_title, is_download_error, warm_up, ytdlp
+
 # ------------------------------
 # Utilitaires
 # ------------------------------
 
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'aac', 'mp4', 'avi', 'mkv'}
 
+# Sources YouTube déjà téléchargées : plusieurs extraits d'une même vidéo sans re-téléchargement
+SOURCE_CACHE = SourceCache(max_bytes=1024**3)
+# Métadonnées yt-dlp : une URL déjà vue ne repasse pas par l'extracteur pendant 30 min
+INFO_CACHE = InfoCache(os.path.join(DEFAULT_CACHE_DIR, "info"))
+# Formes d'onde déjà calculées (partagées avec app.py) : réaffichage instantané
+PEAKS_CACHE = PeaksCache(os.path.join(DEFAULT_CACHE_DIR, "peaks"))
+
 def clean_ansi(text):
     import re as _re
     return _re.sub(r'\x1b\[[0-9;]*m', '', text)
@@ -208,28 +223,37 @@ class BigSpinner(ttk.Frame):
 class ExtractWorker(threading.Thread):
     """
     Workflow:
-      - YouTube (yt-dlp) -> récup MP3
-      - OU fichier local -> utilise tel quel
-      - ffmpeg (subprocess) -> découpe (-ss / -to) vers MP3
+      - YouTube (yt-dlp) -> récup du flux audio natif (plage demandée seulement si le format le permet)
+      - OU fichier local -> utilise tel quel (ou son index de recherche, cf. seekindex.py)
+      - ffmpeg (subprocess) -> découpe (-ss / -to) vers le format choisi (MP3, AAC, Opus) en un
+        seul encodage, ou copie du flux si la source est déjà dans ce codec
+      - Lot de plages -> tous les extraits en une seule passe ffmpeg
+      - Option : bornes calées sur les silences voisins avant la découpe
     Annulation:
       - Pendant téléchargement : exception dans progress_hook
       - Pendant découpe : kill du process ffmpeg
     """
-    def __init__(self, mode, url, local_file, start_str, end_str, event_queue, ffmpeg_dir=None):
+    def __init__(self, mode, url, local_file, start_str, end_str, event_queue, ffmpeg_dir=None, ranges=None,
+                 snap=False, output=DEFAULT_OUTPUT):
         super().__init__(daemon=True)
         self.mode = mode
         self.url = url
         self.local_file = local_file
         self.start_str = start_str
         self.end_str = end_str
+        self.ranges = ranges or [(start_str, end_str)]  # [(début, fin)] en 'hh:mm:ss'
         self.event_queue = event_queue
         self.ffmpeg_dir = ffmpeg_dir  # dossier contenant ffmpeg/ffprobe si dispo
+        self.snap = snap
+        self.output = output  # (format, débit imposé ou None)
+        self.ext = OUTPUT_FORMATS[output[0]]['ext']
         self.temp_out_path = None
         self.output_filename = None
         self._stopped = False
         self._ff_proc = None
         self._tmp_workdir = None
         self._downloaded_input = None
+        self._to_index = None  # (clé, chemin) de la grosse vidéo locale à indexer après l'extraction
 
     def stop(self):
         self._stopped = True
@@ -249,29 +273,62 @@ class ExtractWorker(threading.Thread):
     def yt_progress_hook(self, d):
         if self._stopped:
             # lever une erreur pour stopper yt-dlp
-            raise yt_dlp.utils.DownloadError("Annulé par l'utilisateur")
+            raise ytdlp().utils.DownloadError("Annulé par l'utilisateur")
         if d['status'] == 'downloading':
             raw = d.get('_percent_str', '0.0%')
             percent = clean_ansi(raw).strip()
             self._emit("progress", percent=percent, phase="Téléchargement en cours... 📥")
         elif d['status'] == 'finished':
-            self._emit("progress", percent="convert", phase="Conversion audio en cours... 🎧")
-    def _run_ffmpeg_cut(self, input_path, start_sec, end_sec, out_path):
+            self._emit("progress", percent="convert", phase="Téléchargement terminé, préparation du découpage... 🎧")
+    def _ffprobe_bin(self):
+        """ffprobe voisin du binaire ffmpeg résolu, sinon 'ffprobe' (PATH)."""
+        ff_bin = self.ffmpeg_exe if self.ffmpeg_exe else "ffmpeg"
+        probe_name = "ffprobe.exe" if os.name == "nt" else "ffprobe"
+        return os.path.join(os.path.dirname(ff_bin), probe_name) if os.path.dirname(ff_bin) else probe_name
+
+    def _source_codec(self, input_path):
+        """Codec audio du fichier local (None si ffprobe indisponible)."""
+        try:
+            return probe_media(input_path, self._ffprobe_bin())['codec']
+        except Exception:
+            return None
+
+    def _index_later(self):
+        """Indexe la grosse vidéo locale en tâche de fond : les extractions suivantes y gagnent."""
+        if not self._to_index or self._stopped:
+            return
+        key, path = self._to_index
+        ff_bin = self.ffmpeg_exe if self.ffmpeg_exe else "ffmpeg"
+
+        def build():
+            with tempfile.TemporaryDirectory(prefix="index_") as work_dir:
+                seekindex.build(SOURCE_CACHE, key, path, work_dir, ff_bin, self._ffprobe_bin())
+        threading.Thread(target=build, daemon=True).start()
+
+    def _run_ffmpeg_cut(self, input_path, start_sec, end_sec, out_path, source_codec=None):
         # Utilise le binaire résolu si connu, sinon 'ffmpeg' (PATH)
         ff_bin = self.ffmpeg_exe if self.ffmpeg_exe else "ffmpeg"
 
-        cmd = [
-            ff_bin,
-            "-y",
-            "-hide_banner",
-            "-loglevel", "error",
-            "-ss", str(start_sec),
-            "-to", str(end_sec),
-            "-i", input_path,
-            "-vn",
-            "-acodec", "libmp3lame",
-            out_path
-        ]
+        # Un seul encodage depuis le flux natif (copie directe si la source est déjà dans ce codec)
+        self._run_ffmpeg(build_cut_command(ff_bin, input_path, start_sec, end_sec, out_path, source_codec,
+                                           self.output),
+                         end_sec - start_sec, "Découpage de l'extrait... ✂️")
+
+    def _ffmpeg_progress(self, phase):
+        """Callback run_ffmpeg -> événements 'progress' (pourcentage, vitesse, temps restant)."""
+        def on_progress(p):
+            if p['percent'] is None:
+                return
+            details = []
+            if p['speed']:
+                details.append(f"×{p['speed']:.1f}")
+            if p['eta'] is not None:
+                details.append(f"reste {seconds_to_hhmmss(p['eta'])}")
+            text = f"{phase} [{', '.join(details)}]" if details else phase
+            self._emit("progress", percent=f"{p['percent']:.1f}%", phase=text)
+        return on_progress
+
+    def _run_ffmpeg(self, cmd, duration=None, phase="Découpage... ✂️"):
 
         env = os.environ.copy()
         # s'assure que le dossier contenant ffmpeg est en tête du PATH
@@ -283,30 +340,52 @@ class ExtractWorker(threading.Thread):
             # pour permettre CTRL_BREAK_EVENT sur Windows
             creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
 
-        self._ff_proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+        code, err = run_ffmpeg(
+            cmd, duration,
+            on_progress=self._ffmpeg_progress(phase),
+            on_start=lambda proc: setattr(self, "_ff_proc", proc),
             env=env,
             creationflags=creationflags
         )
-        _, err = self._ff_proc.communicate()
-        code = self._ff_proc.returncode
         self._ff_proc = None
 
         if self._stopped:
             raise RuntimeError("Annulé")
         if code != 0:
-            raise RuntimeError(err.decode("utf-8", errors="ignore") or "Echec ffmpeg")
+            raise RuntimeError(err or "Echec ffmpeg")
+
+    def _cut_batch(self, input_path, ranges, offset, title_safe, source_codec):
+        """Tous les extraits du lot en une passe ffmpeg, dans un dossier temporaire."""
+        phase = f"Découpage de {len(ranges)} extraits... ✂️"
+        self._emit("progress", percent="cut", phase=phase)
+        out_dir = tempfile.mkdtemp(prefix="extraits_")
+        self.temp_out_path = out_dir
+        clips = []
+        for i, (start_str, end_str, start_sec, end_sec) in enumerate(ranges, 1):
+            name = safe_filename(f"{i:02d}_{title_safe}_{start_str.replace(':', '-')}-to-{end_str.replace(':', '-')}.{self.ext}")
+            clips.append((start_sec - offset, end_sec - offset, os.path.join(out_dir, name)))
 
+        ff_bin = self.ffmpeg_exe if self.ffmpeg_exe else "ffmpeg"
+        span = max(end for _, end, _ in clips) - min(start for start, _, _ in clips)
+        self._run_ffmpeg(build_multi_cut_command(ff_bin, input_path, clips, source_codec, self.output), span, phase)
+
+        self._emit("done", temp_path=out_dir, files=[out for _, _, out in clips],
+                   suggested_name=f"{title_safe}_extraits")
+        self._emit("status", text="Terminé ✅")
 
     def run(self):
         try:
             # Prépare temps
-            start_time = parse_time_to_seconds(self.start_str)
-            end_time = parse_time_to_seconds(self.end_str)
-            if end_time <= start_time:
-                raise ValueError("Le temps de fin doit être supérieur au temps de début.")
+            ranges = []
+            for start_str, end_str in self.ranges:
+                start_sec = parse_time_to_seconds(start_str)
+                end_sec = parse_time_to_seconds(end_str)
+                if end_sec <= start_sec:
+                    raise ValueError("Le temps de fin doit être supérieur au temps de début.")
+                ranges.append((start_str, end_str, start_sec, end_sec))
+            # Fenêtre couvrant toutes les plages
+            start_time = min(r[2] for r in ranges)
+            end_time = max(r[3] for r in ranges)
 
             # FFmpeg par défaut : ./ffmpeg/bin si dispo
             ffdir, ffexe, fprobe = ffmpeg_default_paths()
@@ -319,6 +398,8 @@ class ExtractWorker(threading.Thread):
                 self._tmp_workdir = temp_dir
                 input_path = None
                 video_title = "audio"
+                offset = 0  # début du fichier téléchargé dans la vidéo (téléchargement partiel)
+                source_codec = None
 
                 if self._stopped:
                     raise RuntimeError("Annulé")
@@ -328,44 +409,15 @@ class ExtractWorker(threading.Thread):
                         raise ValueError("Veuillez saisir une URL YouTube.")
                     self._emit("status", text="Récupération du lien et du timing...")
 
-                    audio_output_path = os.path.join(temp_dir, "audio.%(ext)s")
-                    downloaded_file_path_mp3 = os.path.join(temp_dir, "audio.mp3")
-
-                    # Options yt-dlp durcies pour contourner SABR/Signature (client Android) + cookies
-                    cookies_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookies.txt')
-                    ydl_opts = {
-                        'format': 'bestaudio/best',
-                        'outtmpl': audio_output_path,
-                        'progress_hooks': [self.yt_progress_hook],
-                        'prefer_ffmpeg': True,
-                        'noplaylist': True,
-                        'extractor_args': {
-                            'youtube': {
-                                'player_client': ['android']
-                            }
-                        },
-                        'postprocessors': [{
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': 'mp3',
-                            'preferredquality': '128',
-                        }],
-                    }
-                    if self.ffmpeg_dir:
-                        ydl_opts['ffmpeg_location'] = self.ffmpeg_dir
-                    if os.path.exists(cookies_path):
-                        ydl_opts['cookiefile'] = cookies_path
-                    # ffmpeg_location déjà ajouté si nécessaire
-
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(self.url, download=False)
-                        title = info.get('title', 'video')
-                        video_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
-                        ydl.download([self.url])
-
-                    if not os.path.exists(downloaded_file_path_mp3):
-                        raise RuntimeError("Fichier MP3 non trouvé après le téléchargement.")
-
-                    input_path = downloaded_file_path_mp3
+                    input_path, info, offset = download_audio(
+                        self.url, temp_dir, start_time, end_time,
+                        [self.yt_progress_hook], self.ffmpeg_dir,
+                        on_status=lambda text: self._emit("status", text=text),
+                        cache=SOURCE_CACHE,
+                        info_cache=INFO_CACHE,
+                    )
+                    video_title = clean_title(info.get('title', 'video'))
+                    source_codec = info.get('acodec')
                     self._downloaded_input = input_path
                 else:
                     # Fichier local
@@ -377,48 +429,103 @@ class ExtractWorker(threading.Thread):
                         raise ValueError("Format non supporté. Acceptés : MP3, WAV, M4A, AAC, MP4, AVI, MKV.")
 
                     self._emit("status", text="Fichier chargé avec succès.")
-                    input_path = self.local_file
+                    # Grosse vidéo déjà indexée : les coupes lisent l'index, sinon il sera construit après
+                    index_key = waveform.file_key(self.local_file)
+                    input_path = seekindex.fetch(SOURCE_CACHE, index_key, temp_dir) or self.local_file
+                    if input_path == self.local_file and seekindex.wanted(SOURCE_CACHE, input_path):
+                        self._to_index = (index_key, input_path)
+                    source_codec = self._source_codec(input_path)
                     base = os.path.splitext(os.path.basename(self.local_file))[0]
                     video_title = "".join(c for c in base if c.isalnum() or c in (' ', '-', '_')).strip()
 
                 if self._stopped:
                     raise RuntimeError("Annulé")
 
+                title_safe = safe_filename(video_title)
+                if self.snap:
+                    self._emit("progress", percent="snap", phase="Calage des bornes sur les silences... 🔇")
+                    ranges = snap_ranges(input_path, ranges, self.ffmpeg_exe or "ffmpeg", offset)
+                    start_time = min(r[2] for r in ranges)
+                    end_time = max(r[3] for r in ranges)
+                    if self._stopped:
+                        raise RuntimeError("Annulé")
+
+                if len(ranges) > 1:
+                    self._cut_batch(input_path, ranges, offset, title_safe, source_codec)
+                    self._index_later()
+                    return
+
                 # Découpage
                 self._emit("progress", percent="cut", phase="Découpage de l'extrait... ✂️")
 
                 # Fichier temporaire de sortie
-                temp_fd, temp_path = tempfile.mkstemp(suffix=".mp3")
+                temp_fd, temp_path = tempfile.mkstemp(suffix="." + self.ext)
                 os.close(temp_fd)
                 self.temp_out_path = temp_path
-                start_safe = self.start_str.replace(":", "-")
-                end_safe   = self.end_str.replace(":", "-")
-                title_safe = safe_filename(video_title)
-                self.output_filename = safe_filename(f"{title_safe}_{start_safe}-to-{end_safe}.mp3")
+                start_safe = ranges[0][0].replace(":", "-")
+                end_safe   = ranges[0][1].replace(":", "-")
+                self.output_filename = safe_filename(f"{title_safe}_{start_safe}-to-{end_safe}.{self.ext}")
 
 
 
                 # Lancer ffmpeg
                 self._run_ffmpeg_cut(
                     input_path=input_path,
-                    start_sec=start_time,
-                    end_sec=end_time,
-                    out_path=self.temp_out_path
+                    start_sec=start_time - offset,
+                    end_sec=end_time - offset,
+                    out_path=self.temp_out_path,
+                    source_codec=source_codec
                 )
 
             # Terminé
             self._emit("done", temp_path=self.temp_out_path, suggested_name=self.output_filename)
             self._emit("status", text="Terminé ✅")
+            self._index_later()
 
-        except yt_dlp.utils.DownloadError as e:
-            # Annulation propre pendant le download
+        except Exception as e:
             msg = str(e)
-            if "Annulé" in msg:
+            if is_download_error(e) and "Annulé" in msg:
+                # Annulation propre pendant le download
                 self._emit("error", message="Annulé")
-            else:
+            elif is_download_error(e):
                 self._emit("error", message=msg or "Erreur yt-dlp")
+            else:
+                self._emit("error", message=msg)
+
+class PeaksWorker(threading.Thread):
+    """
+    Forme d'onde de la source (lien ou fichier local), calculée hors de l'UI.
+    Émet 'peaks' (tableau de waveform.decode_peaks) ou 'peaks_error'.
+    Un lien est téléchargé en entier dans le cache des sources : l'extraction suivante le réutilise.
+    """
+    def __init__(self, mode, source, event_queue, ffmpeg_exe=None):
+        super().__init__(daemon=True)
+        self.mode = mode
+        self.source = source
+        self.event_queue = event_queue
+        self.ffmpeg_exe = ffmpeg_exe or "ffmpeg"
+
+    def run(self):
+        try:
+            if self.mode == "youtube":
+                key = waveform.url_key(self.source)
+                compute = self._compute_url
+            else:
+                if not os.path.isfile(self.source):
+                    raise ValueError("Fichier introuvable.")
+                key = waveform.file_key(self.source)
+                compute = lambda: waveform.decode_peaks(self.source, self.ffmpeg_exe)
+            peaks = waveform.cached_peaks(PEAKS_CACHE, key, compute)
+            self.event_queue.put({"type": "peaks", "source": self.source, "peaks": peaks})
         except Exception as e:
-            self._emit("error", message=str(e))
+            self.event_queue.put({"type": "peaks_error", "message": str(e) or "Erreur inconnue"})
+
+    def _compute_url(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            ffmpeg_dir = os.path.dirname(self.ffmpeg_exe) or None
+            input_path, _, _ = download_audio(self.source, temp_dir, 0, None, [], ffmpeg_dir,
+                                              cache=SOURCE_CACHE, info_cache=INFO_CACHE)
+            return waveform.decode_peaks(input_path, self.ffmpeg_exe)
 
 # ------------------------------
 # UI Tkinter
@@ -429,14 +536,18 @@ class App(tk.Tk):
         super().__init__()
         self.title("Extraction Audio (YouTube / Fichier)")
         # Fenêtre plus grande + redimensionnable
-        self.geometry("900x700")
-        self.minsize(820, 700)
+        self.geometry("900x800")
+        self.minsize(820, 800)
         self.resizable(True, True)
 
 
         self.event_queue = queue.Queue()
         self.worker = None
         self.temp_result_path = None  # pour supprimer si nécessaire
+        self.peaks = None             # forme d'onde affichée (waveform.decode_peaks)
+        self.peaks_source = None      # lien ou fichier correspondant
+        self._drag_from = None        # position (s) du début d'un glisser sur la forme d'onde
+        self.result_files = None      # extraits d'un lot (dans temp_result_path)
 
         # --- Détection OS pour polices ---
         if platform.system() == "Darwin":  # macOS
@@ -507,6 +618,17 @@ class App(tk.Tk):
         self.file_entry.grid(row=2, column=1, sticky="we", padx=6, pady=6)
         ttk.Button(frm_source, text="Parcourir…", command=self._browse_file).grid(row=2, column=2, padx=6, pady=6)
 
+        # Forme d'onde : glisser pour choisir début et fin
+        self.peaks_btn = ttk.Button(frm_source, text="Forme d'onde", command=self._on_peaks)
+        self.peaks_btn.grid(row=3, column=0, sticky="nw", padx=6, pady=6)
+        self.wave_canvas = tk.Canvas(frm_source, height=70, width=640, background="#f8f9fa",
+                                     highlightthickness=1, highlightbackground="#dee2e6", cursor="crosshair")
+        self.wave_canvas.grid(row=3, column=1, columnspan=2, sticky="we", padx=6, pady=6)
+        self.wave_canvas.bind("<Configure>", lambda e: self._draw_waveform())
+        self.wave_canvas.bind("<ButtonPress-1>", self._on_wave_press)
+        self.wave_canvas.bind("<B1-Motion>", self._on_wave_drag)
+        self.wave_canvas.bind("<ButtonRelease-1>", self._on_wave_release)
+
         # Par défaut : mode YouTube => on grise la ligne "fichier"
         self._apply_mode_visibility(initial=True)
 
@@ -577,6 +699,38 @@ class App(tk.Tk):
             ttk.Button(quick_end, text=txt, command=lambda s=sec: self._set_quick("end", s)).pack(side="left", padx=2)
         quick_end.grid(row=1, column=1, sticky="w", pady=4)
 
+        # Lot de plages (plusieurs extraits de la même source en une passe)
+        batch_frame = ttk.Frame(frm_time)
+        batch_frame.pack(fill="x", padx=6, pady=6)
+        ttk.Label(batch_frame, text="Lot :").grid(row=0, column=0, sticky="nw")
+        self.ranges = []
+        self.ranges_list = tk.Listbox(batch_frame, height=4, width=40)
+        self.ranges_list.grid(row=0, column=1, sticky="w", padx=(6, 6))
+        batch_btns = ttk.Frame(batch_frame)
+        batch_btns.grid(row=0, column=2, sticky="nw")
+        ttk.Button(batch_btns, text="Ajouter la plage", command=self._add_range).pack(fill="x", pady=(0, 4))
+        ttk.Button(batch_btns, text="Retirer", command=self._remove_range).pack(fill="x")
+
+        self.snap_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frm_time, text="Caler les bornes sur les silences voisins (±2 s)",
+                        variable=self.snap_var).pack(anchor="w", padx=6, pady=(0, 6))
+
+        # Format de sortie (liste réduite aux encodeurs de ffmpeg, cf. _probe_formats)
+        output_frame = ttk.Frame(frm_time)
+        output_frame.pack(anchor="w", padx=6, pady=(0, 6))
+        ttk.Label(output_frame, text="Format :").pack(side="left")
+        self.format_var = tk.StringVar(value=OUTPUT_FORMATS[DEFAULT_OUTPUT[0]]['label'])
+        self.format_box = ttk.Combobox(output_frame, textvariable=self.format_var, state="readonly", width=12,
+                                       values=[spec['label'] for spec in OUTPUT_FORMATS.values()])
+        self.format_box.pack(side="left", padx=(4, 12))
+        ttk.Label(output_frame, text="Débit :").pack(side="left")
+        self.bitrate_var = tk.StringVar(value="Auto")
+        ttk.Combobox(output_frame, textvariable=self.bitrate_var, state="readonly", width=8,
+                     values=["Auto", *BITRATES]).pack(side="left", padx=(4, 0))
+
+        # La plage sélectionnée suit les champs
+        for spinner in (self.start_h, self.start_m, self.start_s, self.end_h, self.end_m, self.end_s):
+            spinner.var.trace_add("write", lambda *_: self._draw_waveform())
 
 
 
@@ -601,7 +755,7 @@ class App(tk.Tk):
 
         # ---- Enregistrer (sous la progression, visible seulement après fin) ----
         self.save_frame = ttk.Frame(frm_prog)  # << parent corrigé
-        self.save_btn = ttk.Button(self.save_frame, text="Enregistrer le MP3…", command=self._on_save)
+        self.save_btn = ttk.Button(self.save_frame, text="Enregistrer l'extrait…", command=self._on_save)
         self.save_btn.pack(side="left")
         self.save_frame.pack_forget()  # caché au départ
 
@@ -666,6 +820,87 @@ class App(tk.Tk):
         es = str(self.end_s.get())
         return f"{sh}:{sm}:{ss}", f"{eh}:{em}:{es}"
 
+    def _add_range(self):
+        start_str, end_str = self._read_time_fields()
+        self.ranges.append((start_str, end_str))
+        self.ranges_list.insert("end", f"{len(self.ranges)}. {start_str} → {end_str}")
+
+    def _remove_range(self):
+        sel = self.ranges_list.curselection()
+        if not sel:
+            return
+        del self.ranges[sel[0]]
+        self.ranges_list.delete(0, "end")
+        for i, (start_str, end_str) in enumerate(self.ranges, 1):
+            self.ranges_list.insert("end", f"{i}. {start_str} → {end_str}")
+
+    # ---------- Forme d'onde ----------
+    def _current_source(self):
+        if self.mode_var.get() == "youtube":
+            return "youtube", self.url_entry.get().strip()
+        return "upload", self.file_path_var.get().strip()
+
+    def _on_peaks(self):
+        mode, source = self._current_source()
+        if not source:
+            messagebox.showerror("Erreur", "Veuillez d'abord indiquer la source.")
+            return
+        self.peaks_btn.config(state="disabled")
+        self.status_var.set("Analyse de la forme d'onde… 〰️")
+        PeaksWorker(mode, source, self.event_queue, self.ffmpeg_path_var.get() or None).start()
+
+    def _field_seconds(self, which):
+        if which == "start":
+            h, m, s = self.start_h, self.start_m, self.start_s
+        else:
+            h, m, s = self.end_h, self.end_m, self.end_s
+        return h.get() * 3600 + m.get() * 60 + s.get()
+
+    def _draw_waveform(self, selection=None):
+        canvas = self.wave_canvas
+        canvas.delete("all")
+        if self.peaks is None or self._current_source()[1] != self.peaks_source:
+            return
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        duration = waveform.duration_of(self.peaks)
+        if width <= 1 or not duration:
+            return
+        start, end = selection or (self._field_seconds("start"), self._field_seconds("end"))
+        canvas.create_rectangle(start / duration * width, 0, end / duration * width, height,
+                                fill="#d4edda", outline="")
+        columns = waveform.resample(self.peaks, width)
+        step = width / len(columns)
+        # Normalisé sur le pic le plus fort : une source calme reste lisible
+        scale = max(int(abs(columns.astype(int)).max()), 1)
+        for i, (low, high) in enumerate(columns.tolist()):
+            x = i * step
+            canvas.create_line(x, (1 - high / scale) * height / 2, x, (1 - low / scale) * height / 2 + 1,
+                               fill="#007bff")
+
+    def _wave_seconds(self, event):
+        width = max(self.wave_canvas.winfo_width(), 1)
+        ratio = min(max(event.x / width, 0), 1)
+        return round(ratio * waveform.duration_of(self.peaks))
+
+    def _on_wave_press(self, event):
+        if self.peaks is not None:
+            self._drag_from = self._wave_seconds(event)
+
+    def _on_wave_drag(self, event):
+        if self._drag_from is not None:
+            t = self._wave_seconds(event)
+            self._draw_waveform((min(self._drag_from, t), max(self._drag_from, t)))
+
+    def _on_wave_release(self, event):
+        if self._drag_from is None:
+            return
+        t = self._wave_seconds(event)
+        start, end = min(self._drag_from, t), max(self._drag_from, t)
+        self._drag_from = None
+        if end > start:
+            self._set_quick("start", start)
+            self._set_quick("end", end)
+        self._draw_waveform()
 
     # ---------- Actions ----------
     def _on_run(self):
@@ -694,7 +929,7 @@ class App(tk.Tk):
         self.run_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
         self.save_frame.pack_forget()
-        self.temp_result_path = None
+        self._remove_result()
 
         # Lancer le worker
         self.worker = ExtractWorker(
@@ -705,22 +940,50 @@ class App(tk.Tk):
             end_str=end_str,
             event_queue=self.event_queue,
             ffmpeg_dir=os.path.dirname(self.ffmpeg_path_var.get()) if self.ffmpeg_path_var.get() else None,
+            ranges=list(self.ranges) or None,
+            snap=self.snap_var.get(),
+            output=self._selected_output(),
         )
         self.worker.ffmpeg_exe = self.ffmpeg_path_var.get() or None
 
         self.worker.start()
 
+    def _selected_output(self):
+        """(format, débit) choisis ; débit 'Auto' : copie du flux quand la source le permet."""
+        fmt = next(f for f, spec in OUTPUT_FORMATS.items() if spec['label'] == self.format_var.get())
+        bitrate = self.bitrate_var.get()
+        return fmt, None if bitrate == "Auto" else bitrate
+
+    def _probe_formats(self):
+        """Encodeurs de ffmpeg lus une fois, hors de l'UI : la liste des formats suit."""
+        ffmpeg = self.ffmpeg_path_var.get() or "ffmpeg"
+        threading.Thread(target=lambda: self.event_queue.put({"type": "formats", "formats": available_formats(ffmpeg)}),
+                         daemon=True).start()
+
     def _on_save(self):
         if not self.temp_result_path or not os.path.exists(self.temp_result_path):
             messagebox.showerror("Erreur", "Aucun fichier à enregistrer.")
             return
 
+        if self.result_files:
+            # Lot : on copie tous les extraits dans le dossier choisi
+            out_dir = filedialog.askdirectory(title="Dossier de destination des extraits")
+            if out_dir:
+                try:
+                    for path in self.result_files:
+                        shutil.copyfile(path, os.path.join(out_dir, os.path.basename(path)))
+                    messagebox.showinfo("Succès", f"{len(self.result_files)} fichiers enregistrés dans :\n{out_dir}")
+                except Exception as e:
+                    messagebox.showerror("Erreur", f"Impossible d'enregistrer : {e}")
+            return
+
         suggested = getattr(self, "_suggested_name", "extrait_audio.mp3")
+        ext = os.path.splitext(suggested)[1] or ".mp3"
         out_path = filedialog.asksaveasfilename(
-            title="Enregistrer le MP3",
-            defaultextension=".mp3",
+            title="Enregistrer l'extrait",
+            defaultextension=ext,
             initialfile=suggested,
-            filetypes=[("Fichier MP3", "*.mp3")]
+            filetypes=[(f"Fichier {ext[1:].upper()}", "*" + ext)]
         )
         if out_path:
             try:
@@ -771,11 +1034,30 @@ class App(tk.Tk):
                     self.progress["value"] = 100
                     self.status_var.set("✅ Fichier prêt à être enregistré !")
                     self.temp_result_path = msg.get("temp_path")
+                    self.result_files = msg.get("files")
                     self._suggested_name = msg.get("suggested_name", "extrait_audio.mp3")
+                    self.save_btn.config(text="Enregistrer les extraits…" if self.result_files else "Enregistrer l'extrait…")
                     self.save_frame.pack(pady=(0, 10))   # >> sous la barre de progression
                     self.run_btn.config(state="normal")
                     self.cancel_btn.config(state="disabled")
 
+                elif typ == "formats":
+                    labels = [OUTPUT_FORMATS[fmt]['label'] for fmt in msg["formats"]]
+                    self.format_box.config(values=labels)
+                    if labels and self.format_var.get() not in labels:
+                        self.format_var.set(labels[0])
+
+                elif typ == "peaks":
+                    self.peaks = msg["peaks"]
+                    self.peaks_source = msg["source"]
+                    self.peaks_btn.config(state="normal")
+                    self.status_var.set("Glisser sur la forme d'onde pour choisir début et fin.")
+                    self._draw_waveform()
+
+                elif typ == "peaks_error":
+                    self.peaks_btn.config(state="normal")
+                    self.status_var.set(f"Forme d'onde indisponible : {msg.get('message')}")
+
                 elif typ == "error":
                     if str(self.progress["mode"]) == "indeterminate":
                         self.progress.stop()
@@ -796,15 +1078,26 @@ class App(tk.Tk):
 
         self.after(100, self._poll_events)
 
-    def destroy(self):
+    def _remove_result(self):
         try:
-            if self.temp_result_path and os.path.exists(self.temp_result_path):
+            if self.temp_result_path and os.path.isdir(self.temp_result_path):
+                shutil.rmtree(self.temp_result_path, ignore_errors=True)
+            elif self.temp_result_path and os.path.exists(self.temp_result_path):
                 os.remove(self.temp_result_path)
         except Exception:
             pass
+        self.temp_result_path = None
+        self.result_files = None
+
+    def destroy(self):
+        self._remove_result()
         super().destroy()
 
 
 if __name__ == "__main__":
     app = App()
+    startup.mark('window')
+    # yt-dlp n'est importé qu'au premier lien YouTube : on le charge pendant que la fenêtre s'affiche
+    app.after(500, warm_up)
+    app.after(500, app._probe_formats)
     app.mainloop()
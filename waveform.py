@@ -0,0 +1,106 @@
+"""
+Forme d'onde (pics min/max) d'une source, partagée par app.py et version_tkinter.py.
+
+La source est décodée une seule fois par ffmpeg en PCM mono basse fréquence (RATE),
+lu par blocs et réduit avec NumPy en PEAKS_PER_SECOND paires (min, max) par seconde.
+Ce tableau compact (int8) est mis en cache (cache.PeaksCache) puis ré-échantillonné
+à la largeur d'affichage demandée, sans redécoder.
+NumPy n'est importé qu'au premier calcul, pour ne pas ralentir le démarrage.
+"""
+import io
+import os
+
+import media
+from youtube import source_key
+
+RATE = 4000              # Hz, PCM décodé pour le calcul (largement assez pour des pics)
+PEAKS_PER_SECOND = 50    # résolution du tableau mis en cache
+BUCKET = RATE // PEAKS_PER_SECOND
+CHUNK_BUCKETS = 4096     # paires calculées par bloc lu (mémoire bornée quelle que soit la durée)
+
+
+def decode_peaks(input_file, ffmpeg="ffmpeg", **popen_kwargs):
+    """Décode `input_file` et retourne ses pics : tableau int8 (n, 2) de paires (min, max)."""
+    import numpy as np
+
+    parts = []
+    cmd = media.build_pcm_command(ffmpeg, input_file, RATE)
+    for data in media.stream_ffmpeg(cmd, CHUNK_BUCKETS * BUCKET * 2, full_chunks=True, **popen_kwargs):
+        samples = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+        # Dernier bloc incomplet : complété par des zéros (silence) jusqu'au seau suivant
+        if len(samples) % BUCKET:
+            samples = np.concatenate([samples, np.zeros(BUCKET - len(samples) % BUCKET, samples.dtype)])
+        buckets = samples.reshape(-1, BUCKET)
+        parts.append(np.stack([buckets.min(axis=1), buckets.max(axis=1)], axis=1))
+    if not parts:
+        raise media.FFmpegError("ffmpeg a échoué: aucun flux audio décodé")
+    # int16 -> int8 : un octet par valeur suffit à l'affichage
+    return (np.concatenate(parts) >> 8).astype(np.int8)
+
+
+def resample(peaks, width):
+    """Réduit les pics à `width` colonnes au plus (min des min, max des max par colonne)."""
+    import numpy as np
+
+    if len(peaks) <= width:
+        return peaks
+    starts = np.linspace(0, len(peaks), width, endpoint=False).astype(np.int64)
+    return np.stack([np.minimum.reduceat(peaks[:, 0], starts),
+                     np.maximum.reduceat(peaks[:, 1], starts)], axis=1)
+
+
+def duration_of(peaks):
+    return len(peaks) / PEAKS_PER_SECOND
+
+
+def to_bytes(peaks):
+    import numpy as np
+
+    buffer = io.BytesIO()
+    np.save(buffer, peaks, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def from_bytes(data):
+    import numpy as np
+
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def url_key(url):
+    """Clé de cache d'un lien : id de la vidéo si l'extracteur en donne un, sinon l'URL."""
+    return f"url-{source_key(url) or url}"
+
+
+def file_key(path):
+    """Clé de cache d'un fichier local (identité : ré-analysé s'il est modifié)."""
+    dev, ino, size, mtime_ns = media.file_identity(path)
+    return f"file-{os.path.abspath(path)}-{dev}-{ino}-{size}-{mtime_ns}"
+
+
+def cached_peaks(cache, key, compute):
+    """
+    Pics de `key`, depuis `cache` (PeaksCache, optionnel) ou via compute() -> tableau.
+    Un seul calcul à la fois par clé : les demandes simultanées attendent le premier.
+    """
+    if cache is None:
+        return compute()
+    data = cache.get(key)
+    if data is None:
+        with cache.key_lock(key):
+            data = cache.get(key, count=False)
+            if data is None:
+                peaks = compute()
+                cache.put(key, to_bytes(peaks))
+                return peaks
+    return from_bytes(data)
+
+
+def to_json(peaks, width):
+    """Réponse de /peaks : durée (s) et pics aplatis [min0, max0, min1, max1, ...] (-128..127)."""
+    reduced = resample(peaks, width)
+    return {
+        'duration': duration_of(peaks),
+        'count': len(reduced),
+        'peaks': reduced.reshape(-1).tolist(),
+    }
@@ -0,0 +1,215 @@
+"""
+Espace de travail des serveurs : dossiers des jobs et résultats en attente de /download.
+
+Tout est créé sous une racine unique (WORK_DIR), bornée par un quota en octets :
+- les nouveaux jobs passent par admit(), qui réserve la place annoncée sur le dossier du
+  job, ou attend qu'un peu de place se libère puis refuse si le quota reste dépassé ;
+- l'occupation est un compteur : réservations et tailles mesurées des entrées de ce
+  process (settle, nettoyage), rendues par remove(), plus les entrées orphelines
+  mesurées au nettoyage. Aucun parcours de l'arborescence dans admit() ;
+- un seul thread de nettoyage appelle périodiquement les rappels enregistrés (oubli des
+  jobs expirés et de leurs résultats) puis supprime les entrées orphelines (process
+  arrêté, job perdu) plus vieilles que le TTL ;
+- stats() donne l'occupation et les compteurs, exportés par /metrics.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "import_audio_work")
+
+
+def tree_size(path):
+    """Taille (octets) d'un fichier ou d'une arborescence, 0 si elle a disparu entre-temps."""
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+    except OSError:
+        return 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class WorkArea:
+    """
+    Racine des fichiers temporaires des jobs, avec quota (`quota_bytes`, 0 = illimité)
+    et expiration des entrées orphelines après `ttl` secondes sans modification.
+    Chaque entrée vivante est comptée pour le plus grand de ses réservations cumulées
+    et de sa dernière taille mesurée.
+    Les entrées créées par ce process (mkdtemp/mkstemp) ne sont jamais balayées avant
+    d'être rendues par remove() : seuls leur propriétaire ou l'expiration du job les suppriment.
+    """
+    def __init__(self, root=DEFAULT_WORK_DIR, quota_bytes=0, ttl=7200, sweep_interval=60):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._live = {}       # entrée créée par ce process -> octets comptés
+        self._orphans = 0     # octets des autres entrées, mesurés au nettoyage
+        self._on_sweep = []
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._thread = None
+        self.used_bytes = 0   # entrées vivantes + orphelines
+        self.entries = 0
+        self.swept = 0        # entrées orphelines supprimées
+        self.swept_bytes = 0
+        self.admissions = {'admitted': 0, 'queued': 0, 'rejected': 0}
+        os.makedirs(root, exist_ok=True)
+
+    # ---- Création / suppression ----
+    def mkdtemp(self, prefix):
+        path = tempfile.mkdtemp(prefix=prefix, dir=self.root)
+        with self._lock:
+            self._live[path] = 0
+        return path
+
+    def mkstemp(self, suffix):
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.root)
+        os.close(fd)
+        with self._lock:
+            self._live[path] = 0
+        return path
+
+    def remove(self, path):
+        """Supprime un fichier ou dossier (de l'espace de travail ou non) et réveille admit()."""
+        if path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.used_bytes -= self._live.pop(path, 0)
+            self._freed.notify_all()
+
+    def settle(self, path):
+        """Mesure une entrée vivante (ex. résultat terminé) pour l'occupation."""
+        size = tree_size(path)
+        with self._lock:
+            self._charge(path, size)
+
+    def charged(self, path):
+        """Octets comptés pour l'entrée vivante `path` (0 si inconnue)."""
+        with self._lock:
+            return self._live.get(path, 0)
+
+    def transfer(self, src, dst, size):
+        """Déplace jusqu'à `size` octets réservés de l'entrée `src` vers l'entrée `dst`."""
+        with self._lock:
+            if src in self._live and dst in self._live:
+                moved = min(size, self._live[src])
+                self._live[src] -= moved
+                self._live[dst] += moved
+
+    def _charge(self, path, size):
+        """(verrou tenu) Compte `size` octets pour `path` s'il en avait moins."""
+        if path in self._live and size > self._live[path]:
+            self.used_bytes += size - self._live[path]
+            self._live[path] = size
+
+    # ---- Quota ----
+    def has_room(self, need=0):
+        return not self.quota_bytes or self.used_bytes + need <= self.quota_bytes
+
+    def admit(self, need=0, path=None, timeout=30):
+        """
+        True si `need` octets de plus tiennent dans le quota ; ils sont alors réservés sur
+        l'entrée vivante `path` (dossier du job) jusqu'à son remove(). Quota atteint :
+        nettoyage immédiat, puis attente (au plus `timeout` s) qu'un résultat soit
+        téléchargé ou expire ; False si la place manque toujours.
+        """
+        with self._lock:
+            if self.has_room(need):
+                return self._admit(need, path)
+            self.admissions['queued'] += 1
+        self.sweep()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while not self.has_room(need):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.admissions['rejected'] += 1
+                    return False
+                self._freed.wait(min(remaining, 1))
+            return self._admit(need, path)
+
+    def _admit(self, need, path):
+        """(verrou tenu) Réserve `need` octets sur `path`."""
+        if path in self._live:
+            self._live[path] += need
+            self.used_bytes += need
+        self.admissions['admitted'] += 1
+        return True
+
+    # ---- Nettoyage ----
+    def on_sweep(self, callback):
+        """callback() appelé à chaque passage du nettoyeur (ex. oubli des jobs expirés)."""
+        self._on_sweep.append(callback)
+
+    def sweep(self):
+        """Rappels enregistrés, puis suppression des entrées orphelines expirées."""
+        for callback in self._on_sweep:
+            callback()
+        now = time.time()
+        with self._lock:
+            live = set(self._live)
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            entries = []
+        orphans, count = 0, 0
+        for entry in entries:
+            size = tree_size(entry.path)
+            if entry.path in live:
+                with self._lock:
+                    self._charge(entry.path, size)
+                count += 1
+                continue
+            try:
+                expired = now - entry.stat(follow_symlinks=False).st_mtime > self.ttl
+            except OSError:
+                continue
+            if expired:
+                self.remove(entry.path)
+                with self._lock:
+                    self.swept += 1
+                    self.swept_bytes += size
+            else:
+                orphans += size
+                count += 1
+        with self._lock:
+            self.used_bytes += orphans - self._orphans
+            self._orphans, self.entries = orphans, count
+            self._freed.notify_all()
+
+    def start(self):
+        """Lance le thread de nettoyage (une seule fois)."""
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name='workarea-sweeper')
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:  # le nettoyeur ne doit jamais s'arrêter
+                print(f"Nettoyage de l'espace de travail : {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'used_bytes': self.used_bytes, 'quota_bytes': self.quota_bytes,
+                    'entries': self.entries, 'swept': self.swept, 'swept_bytes': self.swept_bytes,
+                    'admissions': dict(self.admissions)}
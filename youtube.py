@@ -0,0 +1,369 @@
+"""
+Téléchargement YouTube (yt-dlp) partagé entre app.py et version_tkinter.py.
+"""
+import atexit
+import contextlib
+import copy
+import glob
+import os
+import sys
+import threading
+
+import startup
+
+# Marge (secondes) téléchargée de part et d'autre de la plage demandée
+RANGE_MARGIN = 2
+# Protocoles que ffmpeg sait lire à partir d'une position (requêtes HTTP Range / playlists HLS)
+SEEKABLE_PROTOCOLS = {'http', 'https', 'm3u8', 'm3u8_native'}
+
+COOKIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookies.txt')
+
+_load_lock = threading.Lock()
+
+
+def ytdlp():
+    """
+    Module yt_dlp, importé au premier usage : son chargement (des centaines de modules
+    d'extracteurs) ne retarde plus l'affichage de la fenêtre ou le démarrage du serveur.
+    """
+    with _load_lock:
+        if 'yt_dlp' not in sys.modules:
+            with startup.timed('import_yt_dlp'):
+                import yt_dlp
+    return sys.modules['yt_dlp']
+
+
+def is_download_error(exc):
+    """True pour une erreur yt-dlp, sans charger yt-dlp s'il ne l'est pas encore."""
+    utils = sys.modules.get('yt_dlp.utils')
+    return utils is not None and isinstance(exc, utils.DownloadError)
+
+
+def warm_up(pool=None, ffmpeg_dir=None, delay=0):
+    """
+    Charge yt-dlp et ses extracteurs en tâche de fond (après `delay` secondes, une fois
+    l'interface affichée) ; avec un `pool`, y prépare aussi une instance YoutubeDL.
+    """
+    def run():
+        with startup.timed('warm_up'):
+            ytdlp()
+            source_key("https://www.youtube.com/watch?v=")  # liste des extracteurs
+            if pool:
+                pool.prefill(ffmpeg_dir)
+    timer = threading.Timer(delay, run)
+    timer.daemon = True
+    timer.start()
+
+
+def build_ydl_opts(outtmpl, progress_hooks, ffmpeg_dir=None, **overrides):
+    """Options yt-dlp durcies pour contourner SABR/Signature (client Android) + cookies."""
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': outtmpl,
+        'progress_hooks': list(progress_hooks),
+        'prefer_ffmpeg': True,
+        'noplaylist': True,
+        'extractor_args': {
+            'youtube': {
+                'player_client': ['android']
+            }
+        },
+        # Pas de post-traitement MP3 : le flux natif (m4a/webm/opus) est coupé et
+        # encodé une seule fois par ffmpeg.
+    }
+    if ffmpeg_dir:
+        ydl_opts['ffmpeg_location'] = ffmpeg_dir
+    if os.path.exists(COOKIES_PATH):
+        ydl_opts['cookiefile'] = COOKIES_PATH
+    ydl_opts.update(overrides)
+    return ydl_opts
+
+
+class YDLPool:
+    """
+    Instances YoutubeDL réutilisées d'un téléchargement à l'autre : cookies.txt lu une seule
+    fois (et réécrit à la fermeture), connexions HTTP/TLS gardées ouvertes, extracteurs déjà
+    initialisés. Une instance ne sert qu'à un job à la fois : `checkout` lui donne le dossier
+    de sortie, les hooks de progression et les options du job, puis les retire au retour.
+    Les instances sont regroupées par options de base (dossier ffmpeg).
+    """
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle  # instances libres gardées par jeu d'options
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.hits = 0    # prêts servis par une instance existante (cf. /metrics)
+        self.misses = 0  # instances créées
+        atexit.register(self.close)
+
+    @contextlib.contextmanager
+    def checkout(self, outtmpl, progress_hooks, ffmpeg_dir=None, **overrides):
+        with self._lock:
+            idle = self._idle.get(ffmpeg_dir)
+            ydl = idle.pop() if idle else None
+            if ydl:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if ydl is None:
+            ydl = ytdlp().YoutubeDL(build_ydl_opts(None, [], ffmpeg_dir))
+
+        base = dict(ydl.params)
+        ydl.params.update(overrides)
+        ydl.params['outtmpl'] = {'default': outtmpl} if outtmpl else {}
+        ydl._parse_outtmpl()  # complète les modèles par défaut, comme à la construction
+        for hook in progress_hooks:
+            ydl.add_progress_hook(hook)
+        try:
+            yield ydl
+        finally:
+            # Remise à l'état initial : pas de hook ni d'option d'un job sur le suivant
+            ydl._progress_hooks.clear()
+            ydl.params.clear()
+            ydl.params.update(base)
+            ydl._download_retcode = 0
+            with self._lock:
+                idle = self._idle.setdefault(ffmpeg_dir, [])
+                if len(idle) < self.max_idle:
+                    idle.append(ydl)
+                    ydl = None
+            if ydl is not None:
+                ydl.close()
+
+    def prefill(self, ffmpeg_dir=None):
+        """Crée une instance libre d'avance (préchauffage) s'il n'y en a aucune."""
+        with self._lock:
+            if self._idle.get(ffmpeg_dir):
+                return
+        ydl = ytdlp().YoutubeDL(build_ydl_opts(None, [], ffmpeg_dir))
+        with self._lock:
+            self._idle.setdefault(ffmpeg_dir, []).append(ydl)
+
+    def close(self):
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+        for ydl in instances:
+            with contextlib.suppress(Exception):
+                ydl.close()
+
+
+# Pool par défaut (application Tkinter, scripts) ; app.py dimensionne le sien
+default_pool = YDLPool()
+
+
+def clean_title(title):
+    return "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+
+
+def check_range(duration, start_time, end_time):
+    """Lève ValueError si [start_time, end_time] dépasse la durée du média (end_time None = fin)."""
+    if start_time >= duration or (end_time is not None and end_time > duration):
+        raise ValueError(
+            f"La durée du fichier est de {int(duration//60)}:{int(duration%60):02d}. "
+            "Veuillez choisir une plage de temps valide."
+        )
+
+
+def source_key(url):
+    """
+    Clé 'extracteur-id' de la vidéo, déduite de l'URL sans requête réseau.
+    None pour l'extracteur générique (pas d'identifiant stable).
+    """
+    for ie in ytdlp().extractor.gen_extractor_classes():
+        if not ie.suitable(url):
+            continue
+        if ie.ie_key() == 'Generic':
+            return None
+        video_id = ie.get_temp_id(url)
+        return f"{ie.ie_key()}-{video_id}" if video_id else None
+    return None
+
+
+def plan_range(info, start_time, end_time, margin=RANGE_MARGIN):
+    """
+    Retourne la fenêtre (début, fin) à télécharger, ou None si le format choisi
+    ne peut pas être lu partiellement (live, DASH fragmenté, durée inconnue...)
+    ou si l'audio complet est demandé (end_time None).
+    """
+    duration = info.get('duration')
+    if end_time is None or not duration or info.get('is_live') or info.get('live_status') in ('is_live', 'is_upcoming'):
+        return None
+    formats = info.get('requested_formats') or [info]
+    for fmt in formats:
+        protocols = (fmt.get('protocol') or '').split('+')
+        if not fmt.get('url') or not all(p in SEEKABLE_PROTOCOLS for p in protocols):
+            return None
+    return max(0, start_time - margin), min(duration, end_time + margin)
+
+
+def find_downloaded(workdir):
+    """Fichier audio final produit par yt-dlp dans `workdir` (hors fichiers partiels)."""
+    for path in glob.glob(os.path.join(workdir, "audio.*")):
+        if not path.endswith(('.part', '.ytdl', '.temp')):
+            return path
+    return None
+
+
+def expand_urls(urls, ffmpeg_dir=None, info_cache=None, pool=None):
+    """
+    Vidéos désignées par `urls` : [{'url', 'title', 'error'}]. Une playlist (ou une chaîne)
+    est développée en ses entrées sans résoudre chaque vidéo (extract_flat) ; l'info d'une
+    vidéo isolée, résolue au passage, est mise dans `info_cache` pour son téléchargement.
+    Un lien introuvable donne un élément avec son erreur, sans interrompre les autres.
+    """
+    items = []
+    with (pool or default_pool).checkout(None, [], ffmpeg_dir, noplaylist=False,
+                                         extract_flat='in_playlist') as ydl:
+        for url in urls:
+            try:
+                info = ydl.extract_info(url, download=False)
+            except ytdlp().utils.DownloadError as e:
+                items.append({'url': url, 'title': None, 'error': str(e)})
+                continue
+            if info.get('_type') not in ('playlist', 'multi_video'):
+                if info_cache:
+                    info_cache.put(source_key(url) or url,
+                                   ydl.sanitize_info(info, remove_private_keys=True))
+                items.append({'url': url, 'title': info.get('title'), 'error': None})
+                continue
+            for entry in info.get('entries') or []:
+                entry_url = entry and (entry.get('url') or entry.get('webpage_url'))
+                if entry_url:
+                    items.append({'url': entry_url, 'title': entry.get('title'), 'error': None})
+    return items
+
+
+def fetch_info(ydl, url, info_cache=None, key=None):
+    """
+    Résout `url` une seule fois. Retourne (info, depuis_le_cache).
+
+    L'info est nettoyée (sanitize_info) pour pouvoir être mise en cache puis
+    rejouée telle quelle par process_ie_result, sans nouvelle résolution.
+    """
+    cache_key = key or url
+    if info_cache:
+        info = info_cache.get(cache_key)
+        if info is not None:
+            return info, True
+    info = ydl.sanitize_info(ydl.extract_info(url, download=False), remove_private_keys=True)
+    if info_cache:
+        info_cache.put(cache_key, info)
+    return info, False
+
+
+def source_kept(url, cache, ffmpeg_dir=None, info_cache=None, pool=None):
+    """
+    True si la source complète de `url` est déjà dans `cache` (SourceCache) ou y entrera
+    une fois téléchargée (durée <= max_duration). L'info résolue pour le savoir est mise
+    dans `info_cache` et resservira au téléchargement.
+    """
+    key = source_key(url)
+    if cache is None or key is None:
+        return False
+    if cache.meta(key) is not None:
+        return True
+    with (pool or default_pool).checkout(None, [], ffmpeg_dir) as ydl:
+        info, _ = fetch_info(ydl, url, info_cache, key)
+    return cache.accepts(info.get('duration'))
+
+
+def download_audio(url, workdir, start_time, end_time, progress_hooks,
+                   ffmpeg_dir=None, on_status=None, cache=None, info_cache=None, pool=None,
+                   **overrides):
+    """
+    Télécharge l'audio de `url` dans `workdir` (en entier si end_time est None).
+
+    Avec un `cache` (SourceCache), une vidéo déjà téléchargée est reprise telle
+    quelle sans appeler yt-dlp ; une vidéo assez courte pour être mise en cache est
+    téléchargée entièrement puis ajoutée au cache.
+    Sinon seule la fenêtre [start_time, end_time] (+ RANGE_MARGIN) est récupérée
+    quand le format s'y prête ; si le format ne le permet pas, ou si le
+    téléchargement partiel échoue, on retombe sur un téléchargement complet.
+    Les métadonnées sont résolues une seule fois (et mises en cache via
+    `info_cache`) puis réutilisées pour le téléchargement. L'instance YoutubeDL
+    est empruntée à `pool` (YDLPool, `default_pool` par défaut).
+    Retourne (chemin, info, offset) : offset = position (s) du début du fichier dans la vidéo.
+    """
+    key = source_key(url) if (cache or info_cache) else None
+    if key and cache:
+        hit = cache.fetch(key, workdir)
+        if hit is None:
+            # Attend un éventuel téléchargement concurrent de la même vidéo
+            with cache.key_lock(key):
+                hit = cache.fetch(key, workdir)
+                if hit is None:
+                    cache.count(False)
+                    return _download(url, workdir, start_time, end_time, progress_hooks,
+                                     ffmpeg_dir, on_status, cache, info_cache, key, pool, **overrides)
+        cache.count(True)
+        path, meta = hit
+        if on_status:
+            on_status("Source déjà en cache ⚡")
+        if meta.get('duration'):
+            check_range(meta['duration'], start_time, end_time)
+        return path, meta, 0
+
+    return _download(url, workdir, start_time, end_time, progress_hooks,
+                     ffmpeg_dir, on_status, None, info_cache, key, pool, **overrides)
+
+
+def _download(url, workdir, start_time, end_time, progress_hooks,
+              ffmpeg_dir, on_status, cache, info_cache, key, pool, **overrides):
+    outtmpl = os.path.join(workdir, "audio.%(ext)s")
+
+    with (pool or default_pool).checkout(outtmpl, progress_hooks, ffmpeg_dir, **overrides) as ydl:
+        info, from_cache = fetch_info(ydl, url, info_cache, key)
+        try:
+            offset, cacheable = _download_with_info(ydl, info, workdir, start_time, end_time,
+                                                    on_status, cache, key)
+        except ytdlp().utils.DownloadError as e:
+            if not from_cache or "Annulé" in str(e):
+                raise
+            # URLs de formats expirées : on oublie l'info en cache et on résout à nouveau
+            info_cache.invalidate(key or url)
+            _clear_partials(workdir)
+            info, _ = fetch_info(ydl, url, info_cache, key)
+            offset, cacheable = _download_with_info(ydl, info, workdir, start_time, end_time,
+                                                    on_status, cache, key)
+
+    downloaded_path = find_downloaded(workdir)
+    if not downloaded_path:
+        raise RuntimeError("Fichier audio non trouvé après le téléchargement.")
+
+    if cacheable and offset == 0:
+        meta = {k: info.get(k) for k in ('title', 'duration', 'acodec', 'abr', 'extractor_key', 'id')}
+        with contextlib.suppress(OSError):
+            cache.put(key, downloaded_path, meta)
+    return downloaded_path, info, offset
+
+
+def _clear_partials(workdir):
+    for partial in glob.glob(os.path.join(workdir, "audio.*")):
+        os.remove(partial)
+
+
+def _download_with_info(ydl, info, workdir, start_time, end_time, on_status, cache, key):
+    """Télécharge à partir d'une info déjà résolue. Retourne (offset, cacheable)."""
+    if info.get('duration'):
+        check_range(info['duration'], start_time, end_time)
+
+    cacheable = bool(cache and key and cache.accepts(info.get('duration')))
+    # Source destinée au cache : on la veut entière pour les prochains extraits
+    window = None if cacheable else plan_range(info, start_time, end_time)
+    if window:
+        if on_status:
+            on_status("Téléchargement de la plage demandée uniquement...")
+        ydl.params['download_ranges'] = ytdlp().utils.download_range_func(None, [window])
+        try:
+            ydl.process_ie_result(copy.deepcopy(info), download=True)
+            return window[0], cacheable
+        except ytdlp().utils.DownloadError as e:
+            if "Annulé" in str(e):
+                raise
+            # Format non seekable en pratique : téléchargement complet
+            _clear_partials(workdir)
+        finally:
+            ydl.params.pop('download_ranges', None)
+
+    ydl.process_ie_result(copy.deepcopy(info), download=True)
+    return 0, cacheable